@@ -21,7 +21,8 @@ Functions concerning the yaml configuration file.
 
 import yaml
 
-from hazimp.templates import READERS, DEFAULT, TEMPLATE
+from hazimp.config_build import add_job
+from hazimp.templates import READERS, DEFAULT, TEMPLATE, RANDOMSEED
 
 
 def read_config_file(file_name: str) -> list:
@@ -67,6 +68,16 @@ def instance_builder(config_list: list) -> list:
             'Invalid template name, %s in config file.' % template)
 
     config_dict = {k: v for item in config_list for k, v in list(item.items())}
+
+    # The root seed of the random numbers applies to every template, so
+    # it is set before the other jobs
+    seed = config_dict.pop(RANDOMSEED, None)
     jobs = reader_function(config_dict)
+    if seed is not None:
+        if not isinstance(seed, dict):
+            seed = {'seed': seed}
+        seed_jobs = []
+        add_job(seed_jobs, RANDOMSEED, seed)
+        jobs = seed_jobs + jobs
 
     return jobs
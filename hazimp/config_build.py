@@ -68,6 +68,22 @@ def find_attributes(config: dict, keys: Union[str, list]) -> Union[str, dict]:
     raise RuntimeError(f'Mandatory key not found in config file: {keys[0]}')
 
 
+def raster_attributes(config: dict, keys: Union[str, list]) -> dict:
+    """
+    Find the attributes of the load raster job from config. The hazard
+    raster can be given as a file, a list of files, or a dictionary with a
+    file_list and other load raster options, e.g. workers.
+
+    :param config: configuration
+    :param keys: configuration element to locate, see `find_attributes`
+    :returns: The load raster attributes, including the file_list.
+    """
+    hazard = find_attributes(config, keys)
+    if isinstance(hazard, dict) and 'file_list' in hazard:
+        return dict(hazard)
+    return {'file_list': hazard}
+
+
 def add_job(jobs, new_job, atts=None):
     """
     Given a list of jobs, add a new job and it's att's to the job.
@@ -85,6 +101,34 @@ def add_job(jobs, new_job, atts=None):
     jobs.append(caj)
 
 
+def add_job_options(config: dict, atts: dict, keys: list) -> dict:
+    """
+    Add the optional keys that are in a config section to the attributes
+    of a job.
+
+    :param config: The config section, e.g. the vulnerability attributes.
+    :param atts: The attributes of the job, updated in place.
+    :param keys: The optional keys to copy, if they are in config.
+    :returns: The attributes of the job.
+    """
+    for key in keys:
+        if key in config:
+            atts[key] = config[key]
+    return atts
+
+
+def add_optional_job(jobs, config: dict, new_job):
+    """
+    Add a job, with its attributes from config, if it is in config.
+
+    :param jobs: A list of jobs.
+    :param config: configuration
+    :param new_job: The new job, as a string. This is also its config key.
+    """
+    if new_job in config:
+        add_job(jobs, new_job, find_attributes(config, new_job))
+
+
 def get_job_or_calcs(job_names):
     """
     Given a list of job or calc names, return a list of job or calc
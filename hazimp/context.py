@@ -134,6 +134,10 @@ class Context(object):
         # Instantiate the `pivot` attribute to None initially
         self.pivot = None
 
+        # The root seed of the counter based random numbers of the assets,
+        # see `hazimp.rng`. If None the global numpy random state is used.
+        self.random_seed = None
+
         # A `prov.ProvDocument` to manage provenance information, including
         # adding required namespaces (TODO: are these all required?)
         self.prov = ProvDocument()
@@ -231,6 +235,35 @@ class Context(object):
         else:
             self.exposure_att = self.exposure_att.take(good_indexes)
 
+    def reorder_exposure(self, curve=misc.HILBERT, order=16):
+        """
+        Sort the exposure data along a space filling curve, so assets
+        that are close in space are close together and the hazard rasters
+        are read in order. The :data:`misc.INTID` attribute is kept, so
+        the original order is restored when the exposure is saved.
+
+        Note: This must be called before the exposure_vuln_curves
+        are determined, since the curves have a site dimension.
+
+        :param curve: The space filling curve, one of :data:`misc.CURVES`.
+        :param order: The number of bits per axis of the curve.
+        :returns: The indexes that sorted the exposure.
+        """
+        assert self.exposure_vuln_curves is None
+
+        key = misc.space_filling_key(self.exposure_long, self.exposure_lat,
+                                     curve, order)
+        indexes = numpy.argsort(key, kind='stable')
+
+        self.exposure_lat = self.exposure_lat[indexes]
+        self.exposure_long = self.exposure_long[indexes]
+        if isinstance(self.exposure_att, dict):
+            for key in self.exposure_att:
+                self.exposure_att[key] = self.exposure_att[key][indexes]
+        else:
+            self.exposure_att = self.exposure_att.take(indexes)
+        return indexes
+
     def save_exposure_atts(self, filename, use_parallel=True):
         """
         Save the exposure attributes, including latitude and longitude.
@@ -265,6 +298,7 @@ class Context(object):
                                               write_dict[misc.INTID])
 
         if parallel.STATE.rank == 0 or not use_parallel:
+            write_dict = restore_exposure_order(write_dict)
             if filename[-4:] == '.csv':
                 save_csv(write_dict, filename)
             else:
@@ -539,6 +573,28 @@ class Context(object):
             self.prov.wasInformedBy(a1, self.provlabel)
 
 
+def restore_exposure_order(write_dict):
+    """
+    Put exposure attributes back in the order they were loaded in, given
+    by the :data:`misc.INTID` attribute.
+
+    :param write_dict: A dictionary or :class:`pandas.DataFrame` of
+        exposure attributes.
+    :returns: The exposure attributes, sorted by :data:`misc.INTID`.
+    """
+    if misc.INTID not in write_dict:
+        return write_dict
+    indexes = numpy.argsort(numpy.asarray(write_dict[misc.INTID]),
+                            kind='stable')
+    if numpy.all(indexes == numpy.arange(indexes.shape[0])):
+        return write_dict
+
+    if isinstance(write_dict, dict):
+        return {key: numpy.asarray(value)[indexes]
+                for key, value in write_dict.items()}
+    return write_dict.take(indexes)
+
+
 def save_csv(write_dict, filename):
     """
     Save a dictionary of arrays as a csv file.
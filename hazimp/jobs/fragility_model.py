@@ -0,0 +1,238 @@
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+ Title: fragility_model.py
+
+Description: Lognormal fragility functions, giving the probability of
+each damage state of an asset at a hazard intensity.
+
+"""
+
+import os
+import sys
+import logging
+
+import numpy
+import pandas
+from numpy import asarray
+from lxml import etree
+from scipy.special import ndtr
+
+from hazimp.validator import Validator, NRML_SCHEMA
+
+LOGGER = logging.getLogger(__name__)
+
+# The damage state of an asset that exceeds no limit state
+NO_DAMAGE = 'none'
+
+
+def fragility_set_from_xml_file(filename):
+    """
+    Load a continuous GEM NRML fragility model, in the format described
+    in resources/nrml/schema/risk/fragility.xsd. The file is validated
+    and read in one streaming pass.
+
+    The ``mean`` and ``stddev`` of each fragility function are the mean
+    and standard deviation of the lognormal distribution of the intensity
+    at which the limit state is exceeded.
+
+    :param filename: The name of the xml file.
+    :returns: A FragilitySet instance.
+    """
+    if not os.path.exists(filename):
+        raise RuntimeError(
+            f'No fragility XML was loaded. Check file name {filename}')
+
+    schema = Validator(NRML_SCHEMA).schema
+    model_format = None
+    limit_states = None
+    intensity_measure_type = None
+    functions = {}
+    try:
+        for event, elem in etree.iterparse(filename, events=('end',),
+                                           schema=schema):
+            tag = etree.QName(elem).localname
+            if tag == 'limitStates':
+                limit_states = (elem.text or '').split()
+            elif tag == 'fragilityModel':
+                model_format = elem.get('format')
+            elif tag == 'ffs':
+                taxonomy, imt, params = _read_ffs(elem)
+                if intensity_measure_type is None:
+                    intensity_measure_type = imt
+                functions[taxonomy] = (params,
+                                       float(elem.get('noDamageLimit', 0.)))
+                # Discard the function set, and the siblings before it
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+    except etree.XMLSyntaxError as err:
+        LOGGER.exception(f"{filename} is not a valid fragility file")
+        LOGGER.exception(err)
+        sys.exit(1)
+
+    if model_format != 'continuous':
+        raise RuntimeError(f'{filename} is not a continuous fragility model.'
+                           ' Only continuous models are supported.')
+
+    taxonomies = list(functions)
+    median = numpy.empty((len(taxonomies), len(limit_states)))
+    beta = numpy.empty((len(taxonomies), len(limit_states)))
+    no_damage_limit = numpy.empty(len(taxonomies))
+    for row, taxonomy in enumerate(taxonomies):
+        params, no_damage_limit[row] = functions[taxonomy]
+        for col, limit_state in enumerate(limit_states):
+            try:
+                mean, stddev = params[limit_state]
+            except KeyError:
+                msg = f'{taxonomy} has no fragility function for the '
+                msg += f'{limit_state} limit state.'
+                raise RuntimeError(msg)
+            median[row, col], beta[row, col] = lognormal_params(mean,
+                                                                stddev)
+
+    return FragilitySet(intensity_measure_type, limit_states, taxonomies,
+                        median, beta, no_damage_limit)
+
+
+def _read_ffs(elem):
+    """
+    Read a fragility function set element.
+
+    :returns: The taxonomy, the intensity measure type and a dictionary
+        of the (mean, stddev) of each limit state.
+    """
+    taxonomy = None
+    imt = None
+    params = {}
+    for child in elem:
+        tag = etree.QName(child).localname
+        if tag == 'taxonomy':
+            taxonomy = (child.text or '').strip()
+        elif tag == 'IML':
+            imt = child.get('imt')
+        elif tag == 'ffc':
+            for param in child:
+                params[child.get('ls')] = (float(param.get('mean')),
+                                           float(param.get('stddev')))
+    return taxonomy, imt, params
+
+
+def lognormal_params(mean, stddev):
+    """
+    Convert the mean and standard deviation of a lognormal distribution
+    to its median and logarithmic standard deviation (beta).
+
+    :param mean: The mean of the distribution.
+    :param stddev: The standard deviation of the distribution.
+    :returns: median, beta
+    """
+    variance_ratio = (stddev / mean) ** 2
+    return (mean / numpy.sqrt(1. + variance_ratio),
+            numpy.sqrt(numpy.log1p(variance_ratio)))
+
+
+class FragilitySet(object):
+
+    """
+    Lognormal fragility functions for a set of building types, with the
+    same limit states and intensity measure.
+
+    The probability of exceeding limit state i at intensity x is
+    Phi(ln(x / median_i) / beta_i). The limit states are in increasing
+    order of damage, so the damage states are no damage, then each limit
+    state.
+    """
+
+    def __init__(self, intensity_measure_type, limit_states, taxonomies,
+                 median, beta, no_damage_limit=None):
+        """
+        :param intensity_measure_type: The type of intensity measure of
+            the functions. This is the exposure attribute of the intensity.
+        :param limit_states: A list of the limit states, from least to
+            most damage.
+        :param taxonomies: A list of the building type of each function.
+        :param median: A 2D array of the median intensity at which each
+            limit state is exceeded. Dimensions (taxonomy, limit state)
+        :param beta: A 2D array of the logarithmic standard deviation of
+            the intensity at which each limit state is exceeded.
+            Dimensions (taxonomy, limit state)
+        :param no_damage_limit: An optional 1D array of the intensity below
+            which each building type has no damage.
+        """
+        self.intensity_measure_type = intensity_measure_type
+        self.limit_states = list(limit_states)
+        self.damage_states = [NO_DAMAGE] + self.limit_states
+        self.taxonomies = list(taxonomies)
+        self.median = asarray(median, dtype=float)
+        self.beta = asarray(beta, dtype=float)
+        if no_damage_limit is None:
+            no_damage_limit = numpy.zeros(len(self.taxonomies))
+        self.no_damage_limit = asarray(no_damage_limit, dtype=float)
+
+    def damage_state_probabilities(self, taxonomy, intensity):
+        """
+        Calculate the probability of each damage state of every asset.
+
+        :param taxonomy: The building type of each asset.
+        :param intensity: The intensity at each asset. Assets with a NaN
+            intensity have no damage.
+        :returns: An array of the probability of each damage state.
+            Dimensions (asset, damage state)
+        """
+        codes, taxonomies = pandas.factorize(asarray(taxonomy).reshape(-1))
+        index = {key: row for row, key in enumerate(self.taxonomies)}
+        missing = [str(key) for key in taxonomies if key not in index]
+        if (codes < 0).any():
+            missing.append('nan')
+        if missing:
+            raise NotImplementedError(
+                f"[{', '.join(missing)}] does not have a fragility function.")
+        rows = asarray([index[key] for key in taxonomies],
+                       dtype=int)[codes]
+
+        intensity = asarray(intensity, dtype=float).reshape(-1, 1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            exceed = ndtr(numpy.log(intensity / self.median[rows]) /
+                          self.beta[rows])
+        no_damage = numpy.isnan(intensity[:, 0]) | \
+            (intensity[:, 0] < self.no_damage_limit[rows])
+        exceed[no_damage] = 0.
+        # A more damaging limit state can not be more likely
+        exceed = numpy.minimum.accumulate(exceed, axis=1)
+        return -numpy.diff(exceed, axis=1, prepend=1., append=0.)
+
+
+def expected_counts(regions, probabilities, damage_states, groupby):
+    """
+    Add up the damage state probabilities of the assets in each region,
+    giving the expected number of assets in each damage state.
+
+    :param regions: The region of each asset.
+    :param probabilities: The probability of each damage state of each
+        asset. Dimensions (asset, damage state)
+    :param damage_states: A list of the damage states.
+    :param groupby: The name of the region attribute.
+    :returns: A `pandas.DataFrame` of the regions, with a column of the
+        expected count of each damage state.
+    """
+    codes, uniques = pandas.factorize(asarray(regions).reshape(-1))
+    valid = codes >= 0
+    counts = {groupby: uniques}
+    for state, column in zip(damage_states, probabilities.T):
+        counts[f'{state}_count'] = numpy.bincount(
+            codes[valid], weights=column[valid], minlength=len(uniques))
+    return pandas.DataFrame(counts)
@@ -39,6 +39,8 @@ import os
 import sys
 from typing import Union
 import datetime
+import logging
+import contextlib
 import scipy
 import numpy as np
 
@@ -46,9 +48,18 @@ from prov.dot import prov_to_dot
 
 from hazimp import parallel
 from hazimp import misc
+from hazimp import rng
 from hazimp import raster as raster_module
 from hazimp.context import EX_LAT, EX_LONG
-from hazimp.jobs.vulnerability_model import vuln_sets_from_xml_file
+from hazimp.jobs.vulnerability_model import (vuln_sets_from_xml_file,
+                                             hazard_chunk_size)
+from hazimp.jobs.fragility_model import (fragility_set_from_xml_file,
+                                         expected_counts)
+from hazimp.jobs.loss_statistics import (loss_statistics,
+                                         relative_change, EXACT)
+from hazimp.jobs.permutation import permutation_losses
+
+LOGGER = logging.getLogger(__name__)
 
 ADD = 'add'
 MULT = 'mult'
@@ -71,6 +82,9 @@ AGGREGATE = 'aggregate'
 TABULATE = 'tabulate'
 CATEGORISE = 'categorise'
 SAVEPROVENANCE = 'saveprovenance'
+REORDER_EXPOSURE = 'reorder_exposure'
+FRAGILITY = 'fragility'
+RANDOM_SEED = 'random_seed'
 DATEFMT = "%Y-%m-%d %H:%M:%S"
 
 
@@ -159,6 +173,56 @@ class Const(Job):
         context.exposure_att[var] = np.tile(np.asarray(value), shape)
 
 
+class RandomSeed(Job):
+
+    """
+    Set the root seed of the random numbers of the assets.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.call_funct = RANDOM_SEED
+
+    def __call__(self, context, seed):
+        """
+        Set the root seed of the random numbers of the assets.
+
+        With a root seed, the jobs that draw random numbers for each asset
+        (`RandomConst`, `SelectVulnFunction`, and the Monte Carlo `LookUp`)
+        draw them from counter based streams, keyed by the seed, the job
+        and the :data:`misc.INTID` of the asset. These do not depend on how
+        the exposure is split between processes or chunks, or on the order
+        of the jobs. See `hazimp.rng`.
+
+        :param context: The context instance, used to move data around.
+        :param seed: The root seed, a non-negative integer.
+        """
+        if isinstance(seed, bool) or \
+                not isinstance(seed, (int, np.integer)) or seed < 0:
+            raise RuntimeError('The random seed must be a non-negative '
+                               f'integer, not {seed!r}.')
+        context.random_seed = int(seed)
+
+
+def asset_stream(context, job_name):
+    """
+    The counter based random numbers of the assets for a job, if the
+    context has a root seed.
+
+    :param context: The context instance, used to move data around.
+    :param job_name: The name of the job drawing the random numbers.
+    :returns: A `hazimp.rng.AssetStream`, or None if there is no root seed.
+    """
+    seed = getattr(context, 'random_seed', None)
+    if seed is None:
+        return None
+    if misc.INTID in context.exposure_att:
+        asset_ids = np.asarray(context.exposure_att[misc.INTID])
+    else:
+        asset_ids = np.arange(context.get_site_shape()[0])
+    return rng.AssetStream(seed, job_name, asset_ids)
+
+
 class RandomConst(Job):
 
     """
@@ -184,6 +248,9 @@ class RandomConst(Job):
         s_keys, s_probs = misc.sorted_dict_values(values)
         s_probs = np.asarray(s_probs)
         s_keys = np.asarray(s_keys)
+        stream = asset_stream(context, f'{RANDOM_CONSTANT}:{var}')
+        if forced_random is None and stream is not None:
+            forced_random = stream.uniform()[:, 0]
         values_array = misc.weighted_values(s_keys, s_probs, shape,
                                             forced_random=forced_random)
 
@@ -262,22 +329,11 @@ class MultipleDimensionMult(Job):
             var1 * var2.
         """
 
-        rolled = context.exposure_att[var1]
-        context.exposure_att[var1] = np.rollaxis(rolled, 0,
-                                                 rolled.ndim)
-
-        context.exposure_att[var_out] = (context.exposure_att[var1] *
-                                         context.exposure_att[var2])
-        rolled = context.exposure_att[var1]
-
-        # Roll var1 back
-        context.exposure_att[var1] = np.rollaxis(rolled,
-                                                 rolled.ndim - 1, 0)
-
-        # Roll the output so the asset dimension is 0.
-        result = context.exposure_att[var_out]
-        context.exposure_att[var_out] = np.rollaxis(result,
-                                                    rolled.ndim - 1, 0)
+        values = np.asarray(context.exposure_att[var1])
+        factor = np.asarray(context.exposure_att[var2])
+        # Broadcast the asset values over the trailing dimensions
+        factor = factor.reshape((-1,) + (1,) * (values.ndim - 1))
+        context.exposure_att[var_out] = values * factor
 
 
 class LoadCsvExposure(Job):
@@ -352,6 +408,30 @@ class LoadCsvExposure(Job):
         context.exposure_att = data_frame
 
 
+class ReorderExposure(Job):
+
+    """
+    Sort the exposure along a space filling curve, so the hazard rasters
+    are read in order.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.call_funct = REORDER_EXPOSURE
+
+    def __call__(self, context, curve=misc.HILBERT, order=16):
+        """
+        Sort the exposure data along a space filling curve. The exposure
+        is saved in the original order.
+
+        :param context: The context instance, used to move data around.
+        :param curve: The space filling curve, 'hilbert' or 'morton'.
+        :param order: The number of bits per axis of the curve, the
+            exposure extent is split into a 2**order square grid.
+        """
+        context.reorder_exposure(curve, order)
+
+
 class LoadXmlVulnerability(Job):
 
     """
@@ -362,18 +442,27 @@ class LoadXmlVulnerability(Job):
         super().__init__()
         self.call_funct = LOADXMLVULNERABILITY
 
-    def __call__(self, context, file_name: Union[str, list]):
+    def __call__(self, context, file_name: Union[str, list],
+                 lut_resolution=None, cache_dir=None):
         """
         Read XML vulnerability files into the context object.
 
         :param context: The context instance, used to move data around.
         :param file_name: The xml files to load.
+        :param lut_resolution: An optional intensity step. If given, the
+            vulnerability curves are tabulated on a uniform grid of
+            intensities with this step, and looked up by rounding the
+            intensity to the grid.
+        :param cache_dir: An optional directory to keep compiled copies of
+            the xml files in, keyed by the file contents. Later runs read
+            the compiled copy instead of validating and parsing the xml.
         """
         if file_name is not None:
             if isinstance(file_name, str):
                 file_name = [file_name]
 
-            vuln_sets = vuln_sets_from_xml_file(file_name)
+            vuln_sets = vuln_sets_from_xml_file(file_name, lut_resolution,
+                                                cache_dir)
             context.vulnerability_sets.update(vuln_sets)
 
             for filename in file_name:
@@ -439,7 +528,7 @@ class SelectVulnFunction(Job):
         super().__init__()
         self.call_funct = SELECTVULNFUNCTION
 
-    def __call__(self, context, variability_method=None):
+    def __call__(self, context, variability_method=None, realisations=None):
         """
         Specifies what vulnerability sets to use.
         Links vulnerability curves to assets.
@@ -459,6 +548,10 @@ class SelectVulnFunction(Job):
             e.g. `{'EQ_contents': 'mean', 'EQ_building': 'mean'}`
             Limitation: A vulnerability set can only be used once, since
             it needs a unique name.
+        :param realisations: An optional number of Monte Carlo realisations.
+            If given, sets sampled with the 'normal' or 'normal_uniform'
+            methods are not sampled once per asset; instead `LookUp`
+            summarises the loss over this many realisations of each curve.
 
         :returns: A dictionary of realised vulnerability curves, associated
             with the exposure data. key - intensity measure; value - realised
@@ -475,9 +568,12 @@ class SelectVulnFunction(Job):
             exposure_title = context.vul_function_titles[vuln_set_key]
             vuln_function_ids = context.exposure_att[exposure_title]
             # sample from the function to get the curve
+            stream = asset_stream(
+                context, f'{SELECTVULNFUNCTION}:{vuln_set_key}')
             realised_vuln_curves = vuln_set.build_realised_vuln_curves(
                 vuln_function_ids,
-                variability_method=variability_method[vuln_set_key])
+                variability_method=variability_method[vuln_set_key],
+                realisations=realisations, stream=stream)
             # Build a dictionary of realised vulnerability curves
             exposure_vuln_curves[vuln_set_key] = realised_vuln_curves
 
@@ -495,18 +591,33 @@ class LookUp(Job):
         super().__init__()
         self.call_funct = LOOKUP
 
-    def __call__(self, context):
+    def __call__(self, context, quantiles=None, memory_budget=None):
         """
         Does a look up on all the vulnerability curves, returning the
         associated loss.
 
+        Vulnerability sets on the same intensity measure and intensity
+        measure levels share the weights of the look up, so they are only
+        computed once.
+
+        For vulnerability sets with Monte Carlo realisations (see
+        `SelectVulnFunction`) the loss is the mean over the realisations.
+        The standard deviation is added as '<loss>_std', and each quantile
+        q as '<loss>_q<100q>', e.g. 'structural_q95'.
+
         :param context: The context instance, used to move data around.
+        :param quantiles: The quantiles of the Monte Carlo loss, in the
+            range [0, 1], default=[0.05, 0.95]
+        :param memory_budget: The memory, in megabytes, of each chunk of
+            Monte Carlo realisations, or of hazard values when the
+            intensities have trailing hazard dimensions.
 
         :returns: exposure_vuln_curves: A dictionary of realised
             vulnerability curves, associated with the exposure
             data. Keys are intensity measure, values are the realised
             vulnerability curve instance per asset
         """
+        weights = {}
         for intensity_key in context.exposure_vuln_curves:
             vuln_curve = context.exposure_vuln_curves[intensity_key]
             int_measure = vuln_curve.intensity_measure_type
@@ -519,8 +630,88 @@ class LookUp(Job):
                 msg += 'vulnerability_set_id is %s. \n' % vulnerability_set_id
                 raise RuntimeError(msg)
 
-            losses = vuln_curve.look_up(intensities)
-            context.exposure_att[loss_category_type] = losses
+            group = (int_measure, vuln_curve.weights_key())
+            if group not in weights:
+                # Share the weights if they fit in one chunk of hazard
+                # values, otherwise each look up is chunked
+                weights[group] = None
+                shape = np.shape(intensities)
+                if hazard_chunk_size(shape, memory_budget) >= \
+                        int(np.prod(shape[1:])):
+                    weights[group] = vuln_curve.look_up_weights(intensities)
+            if vuln_curve.realisations is None:
+                losses = vuln_curve.look_up(intensities, weights[group],
+                                            memory_budget)
+                context.exposure_att[loss_category_type] = losses
+                continue
+
+            if quantiles is None:
+                quantiles = [0.05, 0.95]
+            mean, std, quantile_loss = vuln_curve.monte_carlo(
+                intensities, weights[group], quantiles, memory_budget)
+            context.exposure_att[loss_category_type] = mean
+            context.exposure_att[loss_category_type + '_std'] = std
+            for quantile, losses in zip(quantiles, quantile_loss):
+                label = f'{loss_category_type}_q{100 * quantile:g}'
+                context.exposure_att[label] = losses
+
+
+class Fragility(Job):
+
+    """
+    Calculate the probability of each damage state of every asset from
+    lognormal fragility functions, and the expected number of assets in
+    each damage state in each region.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.call_funct = FRAGILITY
+
+    def __call__(self, context, file_name, taxonomy_field, groupby=None):
+        """
+        Calculate the damage state probabilities of the assets.
+
+        The probability of each damage state is added to the exposure
+        attributes as '<damage state>_probability'. The damage states are
+        'none', then each limit state of the fragility model.
+
+        :param context: The context instance, used to move data around.
+        :param file_name: The NRML continuous fragility model to load.
+        :param taxonomy_field: The exposure attribute of the building type
+            of each asset, matching the taxonomies of the fragility model.
+        :param groupby: An optional exposure attribute of the region of each
+            asset. If given, the aggregated exposure data is set to the
+            expected number of assets in each damage state in each region,
+            as '<damage state>_count'.
+        """
+        fragility_set = fragility_set_from_xml_file(file_name)
+        dt = misc.get_file_mtime(file_name)
+        fragent = context.prov.entity(":fragility file",
+                                      {'prov:type': 'prov:Collection',
+                                       'prov:generatedAtTime': dt,
+                                       'prov:atLocation':
+                                           os.path.basename(file_name)})
+        context.prov.used(context.provlabel, fragent)
+
+        int_measure = fragility_set.intensity_measure_type
+        for field in [int_measure, taxonomy_field, groupby]:
+            if field is not None and field not in context.exposure_att:
+                msg = f'No field named {field} in the exposure data. \n'
+                msg += f'The fragility file is {file_name}. \n'
+                raise RuntimeError(msg)
+
+        probabilities = fragility_set.damage_state_probabilities(
+            context.exposure_att[taxonomy_field],
+            context.exposure_att[int_measure])
+        for state, column in zip(fragility_set.damage_states,
+                                 probabilities.T):
+            context.exposure_att[f'{state}_probability'] = column
+
+        if groupby is not None:
+            context.exposure_agg = expected_counts(
+                context.exposure_att[groupby], probabilities,
+                fragility_set.damage_states, groupby)
 
 
 class PermutateExposure(Job):
@@ -534,7 +725,8 @@ class PermutateExposure(Job):
         self.call_funct = PERMUTATE_EXPOSURE
 
     def __call__(self, context, groupby=None, iterations=1000,
-                 quantile=[0.05, 0.95]):
+                 quantile=[0.05, 0.95], statistics=EXACT, memory_budget=None,
+                 tolerance=None, check_every=100, seed=None, workers=None):
         """
         Calculates the loss for the given vulnerability set, randomly
         permutating the exposure attributes to arrive at a
@@ -554,55 +746,137 @@ class PermutateExposure(Job):
         :param int iterations: Number of iterations to perform
         :param list quantile: Represents the "minimum" and "maximum" event
             loss in the range [0, 1], default=[0.05, 0.95]
+        :param str statistics: How the quantiles are calculated. 'exact'
+            (the default) keeps the loss of every iteration, 'streaming'
+            keeps running estimates in memory independent of the number of
+            iterations, and 'auto' is exact if the losses fit in the
+            memory budget, otherwise streaming.
+        :param memory_budget: The memory, in megabytes, of the exact
+            statistics in the 'auto' mode, default 256.
+        :param float tolerance: If given, stop early once the quantiles of
+            the total loss and of the loss of each group change by less
+            than this fraction between checks. `iterations` is then the
+            largest number of iterations.
+        :param int check_every: The number of iterations between the
+            convergence checks, default 100.
+        :param int seed: The root seed of the permutations. Each batch of
+            iterations draws from its own stream, spawned from this seed,
+            so the same seed gives the same result whatever the number of
+            workers. By default it is drawn from the global random state.
+        :param int workers: An optional number of processes to run the
+            iterations in.
 
         """
-        vulnerability_set_id = list(context.exposure_vuln_curves)[0]
-        field = context.vul_function_titles[vulnerability_set_id]
-
-        losses = np.zeros((iterations, len(context.exposure_att)))
         starttime = datetime.datetime.now()
 
         # This calls the damage calculation for the base vulnerability
         # definition:
         LookUp()(context)
 
+        # The permutations only move the mean curve of each asset, so
+        # they are applied to the curve index. The exposure data is not
+        # copied or changed inside the loop.
+        codes = misc.group_codes(context.exposure_att, groupby)
+
+        curve_sets = []
+        for intensity_key in context.exposure_vuln_curves:
+            vuln_set = context.vulnerability_sets[intensity_key]
+            field = context.vul_function_titles[intensity_key]
+            vuln_curve = vuln_set.build_realised_vuln_curves(
+                context.exposure_att[field], variability_method='mean')
+            int_measure = vuln_curve.intensity_measure_type
+            try:
+                intensities = np.asarray(context.exposure_att[int_measure],
+                                         dtype=float)
+            except KeyError:
+                vulnerability_set_id = vuln_curve.vulnerability_set_id
+                msg = f'Invalid intensity measure: {int_measure}. \n'
+                msg += f'vulnerability_set_id: {vulnerability_set_id}. \n'
+                raise RuntimeError(msg)
+            curve_sets.append((vuln_curve, intensities,
+                               vuln_curve.look_up_weights(intensities)))
+        stats = [loss_statistics(codes.shape[0], iterations, quantile,
+                                 statistics, memory_budget)
+                 for _ in curve_sets]
+
+        # The total loss and the loss of each group, for the convergence
+        # checks
+        if tolerance is not None:
+            check_every = int(check_every)
+            if not tolerance > 0 or check_every < 1:
+                raise RuntimeError('The permutation tolerance and check_every'
+                                   ' must be positive.')
+            grouped = codes >= 0
+            groups = int(codes.max(initial=-1)) + 1
+            totals = [loss_statistics(groups + 1, iterations, quantile,
+                                      statistics, memory_budget)
+                      for _ in curve_sets]
+            previous = None
+        change = None
+
+        # The root seed of the context, or else the global random state,
+        # gives the seed by default
+        if seed is None and getattr(context, 'random_seed', None) is not None:
+            seed = rng.job_seed(context.random_seed, PERMUTATE_EXPOSURE)
+        elif seed is None:
+            seed = int(np.random.randint(2 ** 31))
+
         # Iterate and randomly assign vulnerability within the given
         # attribute grouping:
-
-        for n in range(iterations):
-            context.exposure_att = \
-                misc.permutate_att_values(context.exposure_att,
-                                          field, groupby=groupby)
-
-            for intensity_key in context.exposure_vuln_curves:
-                SelectVulnFunction()(
-                    context,
-                    variability_method={intensity_key: 'mean'}
-                    )
-                vuln_curve = context.exposure_vuln_curves[intensity_key]
-                int_measure = vuln_curve.intensity_measure_type
-                lct = vuln_curve.loss_category_type
-                try:
-                    intensities = context.exposure_att[int_measure]
-                except KeyError:
-                    vulnerability_set_id = vuln_curve.vulnerability_set_id
-                    msg = f'Invalid intensity measure: {int_measure}. \n'
-                    msg += f'vulnerability_set_id: {vulnerability_set_id}. \n'
-                    raise RuntimeError(msg)
-
-                losses[n, :] = vuln_curve.look_up(intensities)
+        used = 0
+        converged = False
+        batches = permutation_losses(curve_sets, codes, iterations, seed,
+                                     workers)
+        with contextlib.closing(batches):
+            for batch in batches:
+                for iteration in zip(*batch):
+                    for m, loss in enumerate(iteration):
+                        stats[m].update(loss)
+                        if tolerance is not None:
+                            totals[m].update(np.concatenate((
+                                [loss.sum()],
+                                np.bincount(codes[grouped],
+                                            weights=loss[grouped],
+                                            minlength=groups))))
+                    used += 1
+                    if tolerance is None or used % check_every != 0:
+                        continue
+                    current = np.concatenate(
+                        [total.quantiles().ravel() for total in totals])
+                    if previous is not None:
+                        change = relative_change(current, previous)
+                        converged = change < tolerance
+                    if converged:
+                        LOGGER.info(f'Permutation converged after {used} '
+                                    f'iterations, relative change '
+                                    f'{change:.3g}')
+                        break
+                    previous = current
+                if converged:
+                    break
 
         endtime = datetime.datetime.now()
 
-        lct_max = lct + '_upper'
-        lct_min = lct + '_lower'
-        context.exposure_att[lct_min], context.exposure_att[lct_max] = \
-            np.quantile(losses, quantile, axis=0)
+        for (vuln_curve, _, _), losses in zip(curve_sets, stats):
+            lct = vuln_curve.loss_category_type
+            lct_max = lct + '_upper'
+            lct_min = lct + '_lower'
+            context.exposure_att[lct_min], context.exposure_att[lct_max] = \
+                losses.quantiles()
 
         permatts = {"dcterms:title": "Exposure permutation",
-                    ":iterations": iterations,
+                    ":iterations": used,
+                    ":maxIterations": iterations,
                     ":GroupingField": groupby,
-                    ":quantile": repr(quantile)}
+                    ":quantile": repr(quantile),
+                    ":seed": seed,
+                    ":workers": workers or 1}
+        if stats:
+            permatts[":statistics"] = stats[0].method
+        if tolerance is not None:
+            permatts[":tolerance"] = tolerance
+            permatts[":checkEvery"] = check_every
+            permatts[":relativeChange"] = repr(change)
 
         permact = context.prov.activity(":ExposurePermutation",
                                         starttime.strftime(DATEFMT),
@@ -634,7 +908,11 @@ class LoadRaster(Job):
     def __call__(self, context, attribute_label, file_list,
                  clip_exposure2all_hazards=False,
                  file_format=None, variable=None,
-                 no_data_value=None, scaling_factor=None):
+                 no_data_value=None, scaling_factor=None,
+                 memory_budget=None, cache_dir=None, cache_size=None,
+                 cache_hash_content=False, pixel_index_dir=None,
+                 tile_index_dir=None, interpolation=None, workers=None,
+                 tile_cache_size=None):
         """
         Load one or more files and get the value for all the
         exposure points. All files have to be of the same attribute and unit.
@@ -645,9 +923,33 @@ class LoadRaster(Job):
         :param clip_exposure2all_hazards: True if the exposure data is
             clippped to the hazard data, so no hazard values are ignored.
         :param file_list: A list of files or a single file to be loaded.
+            An entry can also be a directory or glob pattern of raster
+            tiles, which are sampled as a single hazard.
         :param no_data_value: Values in the raster that represent no data.
         :param scaling_factor: An optional scaling factor to apply to
             the raster values.
+        :param memory_budget: The memory, in megabytes, a single raster
+            read may use. This decides if the cells under the exposure are
+            read as one window, block by block or cell by cell.
+        :param cache_dir: An optional directory to cache the decoded
+            rasters in. Later runs sample the cached rasters directly.
+        :param cache_size: The disk space, in megabytes, the raster cache
+            may use. The least recently used rasters are removed first.
+        :param cache_hash_content: If True the cached rasters are keyed
+            by a hash of the file contents, rather than the file path,
+            size and modification time.
+        :param pixel_index_dir: An optional directory to save the raster
+            cell of each exposure point in. Later runs with the same
+            exposure and raster grid reuse them.
+        :param tile_index_dir: An optional directory to save the extents
+            of raster tiles in. Later runs reuse them while the tiles are
+            unchanged.
+        :param interpolation: How the raster values are interpolated at
+            the exposure points, 'nearest' (the default) or 'bilinear'.
+        :param workers: An optional number of processes to sample the
+            files with, for long lists of hazard files.
+        :param tile_cache_size: The memory, in megabytes, used to cache
+            blocks of remote rasters, e.g. /vsis3/ paths.
 
         Context return:
            exposure_att: Add the file values into this dictionary.
@@ -659,7 +961,15 @@ class LoadRaster(Job):
             file_list = [file_list]
 
         for f in file_list:
-            f = misc.download_file_from_s3_if_needed(f)
+            if raster_module.is_mosaic(f):
+                hazent = context.prov.entity(
+                    ":Hazard data", {"dcterms:title": "Source hazard tiles",
+                                     "prov:type": "prov:Collection",
+                                     "prov:atLocation": f})
+                context.prov.used(context.provlabel, hazent)
+                continue
+            if not raster_module.is_remote(f):
+                f = misc.download_file_from_s3_if_needed(f)
             dt = misc.get_file_mtime(f)
             current_file_format = os.path.splitext(f)[1].replace('.', '')
             atts = {"dcterms:title": "Source hazard data",
@@ -675,9 +985,32 @@ class LoadRaster(Job):
         if file_format == 'nc' and variable:
             file_list = misc.mod_file_list(file_list, variable)
 
+        if memory_budget is None:
+            memory_budget = raster_module.DEFAULT_MEMORY_BUDGET
+        if any(raster_module.is_remote(f) for f in file_list):
+            # Sample remote rasters in place, rather than downloading them
+            if tile_cache_size is None:
+                tile_cache_size = raster_module.DEFAULT_TILE_CACHE_SIZE
+            raster_module.configure_remote_reads(tile_cache_size)
+        if interpolation is None:
+            interpolation = raster_module.NEAREST
+
+        cache = None
+        if cache_dir is not None:
+            if cache_size is None:
+                cache_size = raster_module.DEFAULT_CACHE_SIZE
+            cache = raster_module.RasterCache(cache_dir, cache_size,
+                                              cache_hash_content)
+
+        # Only sample each location once
+        lon, lat, inverse = raster_module.unique_points(
+            context.exposure_long, context.exposure_lat)
+        pixel_index = raster_module.PixelIndex(lon, lat, pixel_index_dir)
+
         file_data, extent = raster_module.files_raster_data_at_points(
-            context.exposure_long, context.exposure_lat,
-            file_list, scaling_factor)
+            lon, lat, file_list, scaling_factor, memory_budget, cache,
+            pixel_index, tile_index_dir, interpolation, workers)
+        file_data = file_data[inverse]
         file_data[file_data == no_data_value] = np.nan
 
         context.exposure_att[attribute_label] = file_data
@@ -0,0 +1,263 @@
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+ Title: loss_statistics.py
+
+Description: Statistics of the loss of every asset over many iterations,
+such as the permutations of the exposure, updated one iteration at a time.
+
+"""
+
+import logging
+
+import numpy
+
+LOGGER = logging.getLogger(__name__)
+
+EXACT = 'exact'
+STREAMING = 'streaming'
+AUTO = 'auto'
+# The memory, in megabytes, the exact statistics may use in the auto mode
+DEFAULT_MEMORY_BUDGET = 256
+
+
+class ExactStatistics(object):
+
+    """
+    Keep the loss of every iteration, and calculate the statistics from
+    all of them. The memory is O(iterations x assets).
+    """
+
+    method = EXACT
+
+    def __init__(self, assets, iterations, quantiles):
+        """
+        :param assets: The number of assets.
+        :param iterations: The largest number of iterations.
+        :param quantiles: A list of quantiles, in the range [0, 1].
+        """
+        self.quantile_levels = list(quantiles)
+        self.losses = numpy.zeros((iterations, assets))
+        self.count = 0
+
+    def update(self, loss):
+        """
+        Add the loss of the assets of one iteration.
+
+        :param loss: A 1D array of the loss of each asset.
+        """
+        self.losses[self.count] = loss
+        self.count += 1
+
+    @property
+    def mean(self):
+        """The mean loss of each asset."""
+        return self.losses[:self.count].mean(axis=0)
+
+    @property
+    def std(self):
+        """The standard deviation of the loss of each asset."""
+        return self.losses[:self.count].std(axis=0)
+
+    def quantiles(self):
+        """
+        :returns: The quantiles of the loss. Dimensions (quantile, asset)
+        """
+        return numpy.quantile(self.losses[:self.count],
+                              self.quantile_levels, axis=0)
+
+
+class StreamingStatistics(object):
+
+    """
+    Running statistics of the loss of every asset, in O(assets) memory
+    whatever the number of iterations.
+
+    The mean and variance are updated with Welford's algorithm. Each
+    quantile is estimated with the P-squared algorithm (Jain and Chlamtac,
+    1985), which keeps five markers per asset and adjusts them with
+    piecewise parabolic interpolation. Every asset is updated at once.
+    """
+
+    method = STREAMING
+
+    def __init__(self, assets, iterations, quantiles):
+        """
+        :param assets: The number of assets.
+        :param iterations: The largest number of iterations. Not used,
+            the memory does not depend on it.
+        :param quantiles: A list of quantiles, in the range [0, 1].
+        """
+        self.quantile_levels = list(quantiles)
+        self.count = 0
+        self._mean = numpy.zeros(assets)
+        self._m2 = numpy.zeros(assets)
+        probs = numpy.asarray(self.quantile_levels, dtype=float)
+        # The marker heights and positions. Dimensions
+        # (quantile, marker, asset)
+        self._heights = numpy.zeros((probs.shape[0], 5, assets))
+        self._positions = numpy.broadcast_to(
+            numpy.arange(1., 6.)[:, None],
+            (probs.shape[0], 5, assets)).copy()
+        # The desired marker positions and their increments. Dimensions
+        # (quantile, marker)
+        self._increments = numpy.stack(
+            [numpy.zeros_like(probs), probs / 2, probs, (1 + probs) / 2,
+             numpy.ones_like(probs)], axis=1)
+        self._desired = 1. + 4. * self._increments
+
+    def update(self, loss):
+        """
+        Add the loss of the assets of one iteration.
+
+        :param loss: A 1D array of the loss of each asset.
+        """
+        loss = numpy.asarray(loss, dtype=float)
+        self.count += 1
+        delta = loss - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (loss - self._mean)
+
+        if self.count <= 5:
+            # Fill the markers with the first five losses
+            self._heights[:, self.count - 1] = loss
+            if self.count == 5:
+                self._heights.sort(axis=1)
+            return
+        self._update_markers(loss)
+
+    def _update_markers(self, loss):
+        """
+        Move the P-squared markers of every quantile for a new loss.
+        """
+        heights = self._heights
+        positions = self._positions
+        # The cell of the new loss, between markers k and k + 1
+        cell = (loss >= heights[:, 1:4]).sum(axis=1)
+        numpy.minimum(heights[:, 0], loss, out=heights[:, 0])
+        numpy.maximum(heights[:, 4], loss, out=heights[:, 4])
+        positions += numpy.arange(5)[None, :, None] > cell[:, None, :]
+        self._desired += self._increments
+
+        for i in range(1, 4):
+            offset = self._desired[:, i, None] - positions[:, i]
+            above = positions[:, i + 1] - positions[:, i]
+            below = positions[:, i - 1] - positions[:, i]
+            step = numpy.where((offset >= 1) & (above > 1), 1.,
+                               numpy.where((offset <= -1) & (below < -1),
+                                           -1., 0.))
+            moved = step != 0
+            if not moved.any():
+                continue
+            height = heights[:, i]
+            next_height = heights[:, i + 1]
+            prev_height = heights[:, i - 1]
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                parabolic = height + step / (above - below) * (
+                    (-below + step) * (next_height - height) / above +
+                    (above - step) * (height - prev_height) / -below)
+                linear = numpy.where(
+                    step > 0, height + (next_height - height) / above,
+                    height - (prev_height - height) / below)
+            inside = (prev_height < parabolic) & (parabolic < next_height)
+            new_height = numpy.where(inside, parabolic, linear)
+            heights[:, i] = numpy.where(moved, new_height, height)
+            positions[:, i] += step
+
+    @property
+    def mean(self):
+        """The mean loss of each asset."""
+        return self._mean.copy()
+
+    @property
+    def std(self):
+        """The standard deviation of the loss of each asset."""
+        if self.count == 0:
+            return numpy.zeros_like(self._m2)
+        return numpy.sqrt(self._m2 / self.count)
+
+    def quantiles(self):
+        """
+        :returns: The estimated quantiles of the loss. Dimensions
+            (quantile, asset). With five or fewer iterations these are
+            exact, as are the 0 and 1 quantiles, which are the end markers.
+        """
+        if self.count < 5:
+            return numpy.quantile(self._heights[0, :self.count],
+                                  self.quantile_levels, axis=0)
+        if self.count == 5:
+            return numpy.quantile(self._heights[0],
+                                  self.quantile_levels, axis=0)
+        probs = numpy.asarray(self.quantile_levels)
+        return numpy.where((probs == 0)[:, None], self._heights[:, 0],
+                           numpy.where((probs == 1)[:, None],
+                                       self._heights[:, 4],
+                                       self._heights[:, 2]))
+
+
+def relative_change(current, previous):
+    """
+    The largest relative change between two sets of estimates.
+
+    :param current: An array of the current estimates.
+    :param previous: An array of the previous estimates, the same shape.
+    :returns: The largest absolute change divided by the previous value.
+        Values that stay at zero have no change.
+    """
+    current = numpy.asarray(current, dtype=float)
+    previous = numpy.asarray(previous, dtype=float)
+    difference = numpy.abs(current - previous)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        change = numpy.where(difference == 0, 0.,
+                             difference / numpy.abs(previous))
+    return float(change.max(initial=0.))
+
+
+STATISTICS = {EXACT: ExactStatistics,
+              STREAMING: StreamingStatistics}
+
+
+def loss_statistics(assets, iterations, quantiles, method=EXACT,
+                    memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Make the statistics of the loss of the assets over the iterations.
+
+    :param assets: The number of assets.
+    :param iterations: The largest number of iterations.
+    :param quantiles: A list of quantiles, in the range [0, 1].
+    :param method: 'exact' (the default) keeps every loss, 'streaming'
+        keeps running statistics and estimates the quantiles. 'auto' is
+        exact if every loss fits in the memory budget, otherwise streaming.
+    :param memory_budget: The memory, in megabytes, of the exact statistics
+        in the auto mode.
+    :returns: An `ExactStatistics` or `StreamingStatistics` instance.
+    """
+    if method == AUTO:
+        if memory_budget is None:
+            memory_budget = DEFAULT_MEMORY_BUDGET
+        method = EXACT
+        if iterations * assets * 8 > memory_budget * 1024 ** 2:
+            method = STREAMING
+            LOGGER.warning(f'The loss of {iterations} iterations of '
+                           f'{assets} assets does not fit in memory, using '
+                           'streaming statistics with estimated quantiles')
+    try:
+        statistics = STATISTICS[method]
+    except KeyError:
+        msg = f'Unknown loss statistics method {method}. '
+        msg += f"Use one of {', '.join([AUTO] + list(STATISTICS))}."
+        raise RuntimeError(msg)
+    return statistics(assets, iterations, quantiles)
@@ -0,0 +1,236 @@
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+ Title: permutation.py
+
+Description: Permutate the vulnerability curves of the assets within
+groups, and look up the loss of every permutation. The iterations are run
+in batches, each with its own random stream, in this process or in a pool
+of processes.
+
+"""
+
+import copy
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy
+
+from hazimp import misc
+
+LOGGER = logging.getLogger(__name__)
+
+# The number of iterations in a batch. Each batch has its own random
+# stream, so the losses do not depend on the number of workers.
+BATCH_SIZE = 10
+
+# The shared arrays, and curve sets, of a permutation worker process
+_WORKER = {}
+
+
+def batch_seeds(seed, iterations, batch_size=BATCH_SIZE):
+    """
+    Spawn an independent seed sequence for each batch of iterations.
+
+    :param seed: The root seed. The same root seed gives the same batches.
+    :param iterations: The number of iterations.
+    :param batch_size: The number of iterations in a batch.
+    :returns: A list of `numpy.random.SeedSequence`, one per batch.
+    """
+    batches = -(-iterations // batch_size)
+    return numpy.random.SeedSequence(seed).spawn(batches)
+
+
+def permutation_batch(curve_sets, codes, group_order, seed_sequence, size,
+                      out=None):
+    """
+    Permutate the curves of the assets within their groups, and look up
+    the loss of each permutation.
+
+    :param curve_sets: A list of (vuln_curve, intensities, weights) of each
+        vulnerability set. See `permutation_losses`.
+    :param codes: A 1D integer array of the group code of each asset.
+    :param group_order: A stable argsort of ``codes``.
+    :param seed_sequence: The `numpy.random.SeedSequence` of the batch.
+    :param size: The number of iterations in the batch.
+    :param out: An optional list of arrays, one per vulnerability set, to
+        write the losses into. Dimensions (iteration, asset), with at least
+        ``size`` iterations.
+    :returns: A list of the losses of each vulnerability set. Dimensions
+        (iteration, asset)
+    """
+    rng = numpy.random.Generator(numpy.random.PCG64(seed_sequence))
+    permuted = numpy.empty(codes.shape[0], dtype=numpy.intp)
+    indexes = [numpy.empty(codes.shape[0], dtype=numpy.int32)
+               for _ in curve_sets]
+    if out is None:
+        out = [numpy.empty((size, codes.shape[0])) for _ in curve_sets]
+    losses = [array[:size] for array in out]
+    for n in range(size):
+        misc.group_permutation(codes, group_order, out=permuted, rng=rng)
+        for (vuln_curve, intensities, weights), index, loss in zip(
+                curve_sets, indexes, losses):
+            numpy.take(vuln_curve.curve_index, permuted, out=index)
+            loss[n] = vuln_curve.look_up(intensities, weights,
+                                         curve_index=index)
+    return losses
+
+
+def permutation_losses(curve_sets, codes, iterations, seed=None,
+                       workers=None, batch_size=BATCH_SIZE):
+    """
+    Look up the loss of the permutations of the curves of the assets, a
+    batch of iterations at a time.
+
+    The batches are yielded in order. With a pool of processes, the
+    curve index and intensities are in shared memory, and a few batches
+    per worker are in flight at a time. The workers write the losses into
+    a shared output slot per batch in flight, rather than pickling them
+    back. Each batch is copied out of its slot once it is done, so only
+    the batch being yielded is held in this process whatever the number
+    of workers. Each batch draws from its own seed sequence, spawned from
+    the root seed, so the same seed gives the same losses whatever the
+    number of workers.
+
+    :param curve_sets: A list of (vuln_curve, intensities, weights) of each
+        vulnerability set. vuln_curve is a `RealisedVulnerabilityCurves`
+        instance, with the mean curve of each asset. The weights are from
+        its `look_up_weights` of the 1D intensities.
+    :param codes: A 1D integer array of the group code of each asset, from
+        `misc.group_codes`.
+    :param iterations: The number of iterations.
+    :param seed: The root seed.
+    :param workers: The number of processes. By default the batches are
+        run in this process.
+    :param batch_size: The number of iterations in a batch.
+    :returns: A generator of the losses of each batch. Each is a list of
+        the losses of each vulnerability set. Dimensions (iteration, asset)
+    """
+    codes = numpy.asarray(codes)
+    group_order = numpy.argsort(codes, kind='stable')
+    seeds = batch_seeds(seed, iterations, batch_size)
+    sizes = [min(batch_size, iterations - start)
+             for start in range(0, iterations, batch_size)]
+
+    if workers is None or workers <= 1 or len(seeds) <= 1:
+        for seed_sequence, size in zip(seeds, sizes):
+            yield permutation_batch(curve_sets, codes, group_order,
+                                    seed_sequence, size)
+        return
+
+    arrays = {'codes': codes, 'group_order': group_order}
+    # The output slots of the batches in flight
+    slots = 2 * workers
+    outputs = {f'losses_{m}': ((slots, batch_size, codes.shape[0]),
+                               numpy.dtype(float))
+               for m in range(len(curve_sets))}
+    curves = []
+    for m, (vuln_curve, intensities, _) in enumerate(curve_sets):
+        arrays[f'curve_index_{m}'] = vuln_curve.curve_index
+        arrays[f'intensities_{m}'] = intensities
+        # The curve index is shared, so leave it out of the pickled copy
+        curves.append(copy.copy(vuln_curve))
+        curves[-1].curve_index = None
+
+    memories = {}
+    try:
+        specs = {}
+        for name, array in arrays.items():
+            array = numpy.asarray(array)
+            memories[name] = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1))
+            numpy.ndarray(array.shape, array.dtype,
+                          buffer=memories[name].buf)[:] = array
+            specs[name] = (memories[name].name, array.shape, array.dtype.str)
+        for name, (shape, dtype) in outputs.items():
+            memories[name] = shared_memory.SharedMemory(
+                create=True, size=max(int(numpy.prod(shape)) * dtype.itemsize,
+                                      1))
+            specs[name] = (memories[name].name, shape, dtype.str)
+        losses = [numpy.ndarray(shape, dtype, buffer=memories[name].buf)
+                  for name, (shape, dtype) in outputs.items()]
+
+        LOGGER.info(f"Permutating {iterations} iterations in batches of "
+                    f"{batch_size} with {workers} processes")
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_permutation_worker,
+                initargs=(specs, curves)) as executor:
+            batches = list(zip(seeds, sizes))
+            free = list(range(slots))
+            futures = []
+            submitted = 0
+            try:
+                for _ in batches:
+                    # Keep a few batches per worker in flight, each
+                    # writing to a free output slot
+                    while submitted < len(batches) and free:
+                        seed_sequence, size = batches[submitted]
+                        slot = free.pop(0)
+                        futures.append((slot, size, executor.submit(
+                            _permutation_batch_in_worker, seed_sequence,
+                            size, slot)))
+                        submitted += 1
+                    slot, size, future = futures.pop(0)
+                    future.result()
+                    batch = [array[slot, :size].copy() for array in losses]
+                    free.append(slot)
+                    yield batch
+            finally:
+                for _, _, future in futures:
+                    future.cancel()
+    finally:
+        for memory in memories.values():
+            memory.close()
+            memory.unlink()
+
+
+def _init_permutation_worker(specs, curves):
+    """
+    Attach a permutation worker process to the shared arrays, and work
+    out the look up weights of each vulnerability set.
+
+    :param specs: A dictionary of the shared memory name, shape and dtype
+        of each array.
+    :param curves: A list of the realised vulnerability curves of each set,
+        without their curve index.
+    """
+    for name, (memory_name, shape, dtype) in specs.items():
+        memory = shared_memory.SharedMemory(name=memory_name)
+        _WORKER[name + '_memory'] = memory
+        _WORKER[name] = numpy.ndarray(shape, dtype, buffer=memory.buf)
+    curve_sets = []
+    for m, vuln_curve in enumerate(curves):
+        vuln_curve.curve_index = _WORKER[f'curve_index_{m}']
+        intensities = _WORKER[f'intensities_{m}']
+        curve_sets.append((vuln_curve, intensities,
+                           vuln_curve.look_up_weights(intensities)))
+    _WORKER['curve_sets'] = curve_sets
+
+
+def _permutation_batch_in_worker(seed_sequence, size, slot):
+    """
+    Run one batch of permutations in a worker process, writing the losses
+    into an output slot in shared memory.
+
+    :param seed_sequence: The `numpy.random.SeedSequence` of the batch.
+    :param size: The number of iterations in the batch.
+    :param slot: The index of the output slot of the batch.
+    """
+    out = [_WORKER[f'losses_{m}'][slot]
+           for m in range(len(_WORKER['curve_sets']))]
+    permutation_batch(_WORKER['curve_sets'], _WORKER['codes'],
+                      _WORKER['group_order'], seed_sequence, size, out)
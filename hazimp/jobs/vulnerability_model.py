@@ -27,24 +27,43 @@ Copyright 2012 by Geoscience Australia
 
 import os
 import sys
+import json
+import hashlib
 import numpy
+import pandas
 import logging
-from numpy import asarray, interp, where, zeros
+from numpy import asarray, interp, where
+from lxml import etree
 
 from hazimp.validator import Validator, NRML_SCHEMA
-from hazimp.xml_interface import XmlLayer
 
 LOGGER = logging.getLogger(__name__)
 DEFAULTLOSS = 0
-
-
-def vuln_sets_from_xml_file(filenames: list) -> dict:
+# Bump when the layout of the compiled vulnerability files changes
+CACHE_VERSION = 1
+# The memory, in megabytes, of a chunk of Monte Carlo realisations or
+# of hazard values
+DEFAULT_MEMORY_BUDGET = 256
+# The working memory of one realisation of one loss
+SAMPLE_BYTES = 48
+# The working memory of the look up of one hazard value
+LOOKUP_BYTES = 80
+
+
+def vuln_sets_from_xml_file(filenames: list, lut_resolution=None,
+                            cache_dir=None) -> dict:
     """
     Load a GEM NRML vulnerability file in the format described in
     resources/nrml/schema/risk/vulnerability.xsd
 
     Args:
     :param filenames: The names of the xml files.
+    :param lut_resolution: An optional intensity step. If given, the
+        vulnerability curves are looked up in a table of losses on a
+        uniform intensity grid with this step. See `lut_levels`.
+    :param cache_dir: An optional directory of compiled vulnerability
+        files. A file that has been loaded before is read from there,
+        skipping the validation and parsing of the xml.
 
     :returns: A dictionary of Vulnerability Sets.
     """
@@ -57,27 +76,191 @@ def vuln_sets_from_xml_file(filenames: list) -> dict:
                 f'No vulnerability XML was loaded. Check file name {filename}'
             )
 
-        validator = Validator(NRML_SCHEMA)
+        cache_file = None
+        if cache_dir is not None:
+            cache_file = vuln_cache_file(filename, cache_dir)
+        if cache_file is not None and os.path.isfile(cache_file):
+            LOGGER.debug(f"Loading {filename} from {cache_file}")
+            set_id, vulnerability_set = vuln_set_from_npz(cache_file,
+                                                          lut_resolution)
+            vulnerability_sets[set_id] = vulnerability_set
+            continue
+
         try:
-            validator.validate(filename)
-        except AssertionError as err:
+            set_id, vulnerability_set = vuln_set_from_xml_stream(
+                filename, lut_resolution)
+        except etree.XMLSyntaxError as err:
             LOGGER.exception(f"{filename} is not a valid vulnerability file")
             LOGGER.exception(err)
             sys.exit(1)
-
-        xml_node = XmlLayer(filename=filename)
-        set_id, vulnerability_set = vuln_sets_from_xml_node(xml_node)
         vulnerability_sets[set_id] = vulnerability_set
+        if cache_file is not None:
+            vuln_set_to_npz(vulnerability_set, cache_file)
 
     return vulnerability_sets
 
 
-def vuln_sets_from_xml_node(xml_node):
+def vuln_cache_file(filename, cache_dir):
+    """
+    The compiled file of a vulnerability xml file, keyed by a hash of the
+    xml contents.
+
+    :param filename: The name of the xml file.
+    :param cache_dir: The directory of compiled vulnerability files.
+    :returns: The path of the compiled .npz file.
+    """
+    digest = hashlib.sha1(f'{CACHE_VERSION}'.encode('utf-8'))
+    with open(filename, 'rb') as fhandle:
+        for chunk in iter(lambda: fhandle.read(1024 ** 2), b''):
+            digest.update(chunk)
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, digest.hexdigest() + '.npz')
+
+
+def vuln_set_to_npz(vulnerability_set, cache_file):
+    """
+    Save a vulnerability set as a compiled .npz file. The file is written
+    under a temporary name and then renamed, so other processes never read
+    a partial file.
+
+    :param vulnerability_set: A VulnerabilitySet instance.
+    :param cache_file: The path of the compiled file.
+    """
+    functions = list(vulnerability_set.vulnerability_functions.values())
+    meta = {'vulnerability_set_id': vulnerability_set.vulnerability_set_id,
+            'intensity_measure_type':
+                vulnerability_set.intensity_measure_type,
+            'asset_category': vulnerability_set.asset_category,
+            'loss_category': vulnerability_set.loss_category,
+            'default_loss': vulnerability_set.default_loss}
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp.npz'
+    numpy.savez(
+        tmp_file,
+        meta=json.dumps(meta),
+        intensity_measure_level=vulnerability_set.intensity_measure_level,
+        function_id=[funct.function_id for funct in functions],
+        mean_loss=[funct.mean_loss for funct in functions],
+        coefficient_of_variation=[funct.coefficient_of_variation
+                                  for funct in functions],
+        distribution=[str(funct.distribution) for funct in functions])
+    os.replace(tmp_file, cache_file)
+
+
+def vuln_set_from_npz(cache_file, lut_resolution=None):
+    """
+    Load a vulnerability set from a compiled .npz file.
+
+    :param cache_file: The path of the compiled file.
+    :param lut_resolution: An optional intensity step of the look up table
+        of the vulnerability curves.
+    :returns: The vulnerability set id and a VulnerabilitySet instance.
+    """
+    with numpy.load(cache_file) as saved:
+        meta = json.loads(str(saved['meta']))
+        vulnerability_functions = {}
+        for func_id, loss, cov, dist in zip(
+                saved['function_id'], saved['mean_loss'],
+                saved['coefficient_of_variation'], saved['distribution']):
+            vulnerability_functions[str(func_id)] = VulnerabilityFunction(
+                str(func_id), loss, cov, str(dist))
+        im_level = saved['intensity_measure_level']
+
+    vuln_set_id = meta['vulnerability_set_id']
+    return (vuln_set_id, VulnerabilitySet(
+        im_level,
+        meta['intensity_measure_type'],
+        vuln_set_id,
+        meta['asset_category'],
+        meta['loss_category'],
+        vulnerability_functions,
+        meta['default_loss'],
+        lut_resolution))
+
+
+def vuln_set_from_xml_stream(filename, lut_resolution=None):
+    """
+    Validate and load the vulnerability set of a NRML vulnerability file
+    in one streaming pass. Each vulnerability function is built when its
+    element has been read, and the element is then discarded, so the
+    memory used does not grow with the number of functions.
+
+    As with `vuln_sets_from_xml_node`, only the first vulnerability model
+    in the file is loaded, though the whole file is validated.
+
+    :param filename: The name of the xml file.
+    :param lut_resolution: An optional intensity step of the look up table
+        of the vulnerability curves.
+    :raises lxml.etree.XMLSyntaxError: If the file is not valid NRML.
+    :returns: The vulnerability set id and a VulnerabilitySet instance.
+    """
+    schema = Validator(NRML_SCHEMA).schema
+    model_attributes = None
+    model_done = False
+    im_level = None
+    intensity_measure_type = None
+    vulnerability_functions = {}
+
+    for event, elem in etree.iterparse(filename, events=('start', 'end'),
+                                       schema=schema):
+        tag = etree.QName(elem).localname
+        if event == 'start':
+            if tag == 'vulnerabilityModel' and model_attributes is None:
+                model_attributes = dict(elem.attrib)
+            continue
+
+        if tag == 'imls' and im_level is None:
+            im_level = _xml_floats(elem.text)
+            intensity_measure_type = elem.get('imt')
+        elif tag == 'vulnerabilityFunction':
+            if not model_done:
+                # Schema errors are raised at the end of the file, so
+                # allow for missing elements here
+                values = {etree.QName(child).localname: child.text
+                          for child in elem}
+                vuln_funct = VulnerabilityFunction(
+                    elem.get('id'),
+                    _xml_floats(values.get('meanLRs')),
+                    _xml_floats(values.get('covLRs')),
+                    elem.get('dist'))
+                vulnerability_functions[vuln_funct.function_id] = vuln_funct
+            # Discard the function, and the siblings before it
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        elif tag == 'vulnerabilityModel':
+            model_done = True
+
+    if model_attributes is None:
+        raise RuntimeError(f'{filename} has no vulnerability model')
+
+    vuln_set_id = model_attributes['id']
+    return (vuln_set_id, VulnerabilitySet(
+        im_level,
+        intensity_measure_type,
+        vuln_set_id,
+        model_attributes['assetCategory'],
+        model_attributes['lossCategory'],
+        vulnerability_functions,
+        model_attributes.get('defaultLoss', DEFAULTLOSS),
+        lut_resolution))
+
+
+def _xml_floats(text):
+    """
+    Convert the whitespace separated numbers of an xml element to a float
+    array in one step.
+    """
+    return numpy.fromstring(text or '', sep=' ')
+
+
+def vuln_sets_from_xml_node(xml_node, lut_resolution=None):
     """
     Load in the vulnerability sets from an xml node.
 
     :param vulnerability_models: Dictionary to store vulnerability models.
     :param xml_node: The root node of the vulnerability xml file.
+    :param lut_resolution: An optional intensity step of the look up table
+        of the vulnerability curves.
 
     :returns: A dictionary of Vulnerability Sets.
     """
@@ -107,7 +290,8 @@ def vuln_sets_from_xml_node(xml_node):
         asset_category,
         loss_category,
         vulnerability_functions,
-        default_loss))
+        default_loss,
+        lut_resolution))
 
 
 class VulnerabilitySet(object):
@@ -145,7 +329,8 @@ class VulnerabilitySet(object):
                  asset_category,
                  loss_category,
                  vulnerability_functions,
-                 default_loss):
+                 default_loss,
+                 lut_resolution=None):
         """
         :params intensity_measure_level: a set of points for the x axis
                 of the mean loss curve (common to all functions)
@@ -155,6 +340,9 @@ class VulnerabilitySet(object):
         :params loss_category: The type of loss suffered by the asset_category
         :params vulnerability_functons: a dictionary of VulnerabilityFunction
                  objects where the function id is the key.
+        :params lut_resolution: An optional intensity step. If given, the
+                mean curves are tabulated on a uniform grid of intensities
+                with this step, and looked up in the table.
 
         """
         self.intensity_measure_level = asarray(intensity_measure_level)
@@ -169,6 +357,29 @@ class VulnerabilitySet(object):
         self.loss_category = loss_category
         self.vulnerability_functions = vulnerability_functions
         self.default_loss = default_loss
+        # The intensities of the look up table, common to all functions,
+        # and the loss of the mean curve of each function at them. The
+        # table is built once, with a row per function in the order of
+        # lut_rows. Dimensions (function, lut level)
+        self.lut_levels = None
+        self.lut = None
+        self.lut_rows = {}
+        if lut_resolution is not None:
+            self.lut_levels = lut_levels(self.intensity_measure_level,
+                                         lut_resolution)
+            self.lut_rows = {key: row for row, key in
+                             enumerate(self.vulnerability_functions)}
+            mean_curves = asarray(
+                [funct.mean_loss for funct in
+                 self.vulnerability_functions.values()], dtype=float)
+            mean_curves = mean_curves.reshape(
+                (len(self.lut_rows),
+                 self.intensity_measure_level.shape[0]))
+            self.lut = interp_curves(
+                numpy.broadcast_to(self.lut_levels,
+                                   (mean_curves.shape[0],
+                                    self.lut_levels.shape[0])),
+                self.intensity_measure_level, mean_curves)
 
     def __repr__(self):
         return ('Discrete Vulnerability Set:\n'
@@ -180,40 +391,90 @@ class VulnerabilitySet(object):
                    str(list(self.vulnerability_functions.keys()))))
 
     def build_realised_vuln_curves(self, vulnerability_function_ids,
-                                   variability_method=None):
+                                   variability_method=None,
+                                   realisations=None, stream=None):
         """
         Given a list of vulnerability_function_IDs return the
         actual vulnerability curves, as a realised vulnerabitly
         curves instance.
 
-        Currently this just returns a mean curve.
+        The function ids are factorised, so each distinct function is
+        looked up once. With the mean curves the assets index into the
+        table of distinct curves. Sampled curves differ for every asset,
+        so there is one curve per asset. With a number of realisations,
+        the curves are not sampled here; the mean curves and their
+        standard deviations are kept for a Monte Carlo look up.
+
+        The mean curves take their rows of the look up table of the set,
+        if there is one. Sampled curves are not in the table, so they are
+        interpolated.
 
         :parmas vulnerability_function_IDs: A list of the vuln. functions.
             The list dimension is asset.
         :parmas variability_method: How the vulnerability function is sampled.
+        :parmas realisations: An optional number of Monte Carlo
+            realisations of the sampled curves.
+        :parmas stream: An optional `hazimp.rng.AssetStream` of the assets
+            to sample with. By default the global random state is used.
 
         :returns: A realised vulnerabitly curves instance.  Use this to calc
             the loss ratio.
 
         """
-        loss_per_asset = []  # Build a list up.
-        for key in vulnerability_function_ids:
-            try:
-                vuln_funct = self.vulnerability_functions[key]
-            except KeyError:
-                msg = '[%s] does not have a vulnerability curve.\n The' % key
-                msg += ' vulnerability set is %s' % self.vulnerability_set_id
-                raise NotImplementedError(msg)
-            loss_per_asset.append(vuln_funct.get_loss(variability_method))
-        # To get dimensions (asset, loss)
-        loss_per_asset = asarray(loss_per_asset)
+        codes, function_ids = pandas.factorize(
+            asarray(vulnerability_function_ids).reshape(-1))
+        missing = [str(key) for key in function_ids
+                   if key not in self.vulnerability_functions]
+        if (codes < 0).any():
+            missing.append('nan')
+        if missing:
+            msg = '[%s] does not have a vulnerability curve.\n The' % \
+                ', '.join(missing)
+            msg += ' vulnerability set is %s' % self.vulnerability_set_id
+            raise NotImplementedError(msg)
+        functions = [self.vulnerability_functions[key]
+                     for key in function_ids]
+
+        sigma_curves = None
+        levels = None
+        lut = None
+        if variability_method in (None, 'mean'):
+            curves = [funct.get_loss(variability_method)
+                      for funct in functions]
+            curve_index = codes
+            realisations = None
+            if self.lut is not None:
+                levels = self.lut_levels
+                lut = self.lut[[self.lut_rows[key] for key in function_ids]]
+        elif realisations is not None:
+            curves = [funct.mean_loss for funct in functions]
+            sigma_curves = curve_sigma(functions, variability_method)
+            curve_index = codes
+        else:
+            curves = sample_losses(functions, codes, variability_method,
+                                   stream)
+            curve_index = None
+            if self.lut is not None:
+                LOGGER.warning(f'The {self.vulnerability_set_id} curves are '
+                               f'sampled with {variability_method}, so '
+                               'they are interpolated rather than looked up '
+                               'in the table of the mean curves')
+        # To get dimensions (curve, loss)
+        curves = asarray(curves, dtype=float).reshape(
+            (len(curves), self.intensity_measure_level.shape[0]))
         realised_vuln_curves = RealisedVulnerabilityCurves(
             self.intensity_measure_type,
             self.loss_category,
             self.intensity_measure_level,
-            loss_per_asset,
+            curves,
             self.vulnerability_set_id,
-            self.default_loss)
+            self.default_loss,
+            curve_index,
+            levels,
+            sigma_curves,
+            realisations,
+            stream,
+            lut)
         return realised_vuln_curves
 
     def calc_mean(self, func_id, intensity):
@@ -269,6 +530,50 @@ def ratio_cutoff(ratio):
     return ratio
 
 
+def sample_losses(functions, codes, variability_method, stream=None):
+    """
+    Sample a loss curve for every asset in one step. The assets are sampled
+    in order, so this gives the same curves as calling
+    `VulnerabilityFunction.get_loss` for each asset.
+
+    :param functions: A list of the distinct vulnerability functions.
+    :param codes: The index into `functions` of each asset.
+    :param variability_method: How the vulnerability functions are sampled.
+    :param stream: An optional `hazimp.rng.AssetStream` of the assets. By
+        default the deviates are drawn from the global random state.
+    :returns: The sampled loss points. Dimensions (asset, loss)
+    """
+    mean_loss = asarray([funct.mean_loss for funct in functions])[codes]
+    sigma = curve_sigma(functions, variability_method)[codes]
+    if stream is None:
+        deviate = numpy.random.normal(0, 1, size=(len(codes), 1))
+    else:
+        deviate = stream.normal()
+    return ratio_cutoff(mean_loss + deviate * sigma)
+
+
+def curve_sigma(functions, variability_method):
+    """
+    The standard deviation of the loss points of vulnerability functions,
+    for a sampling method.
+
+    :param functions: A list of vulnerability functions.
+    :param variability_method: How the vulnerability functions are sampled.
+    :returns: The standard deviation of the loss points.
+        Dimensions (function, loss)
+    """
+    mean_loss = asarray([funct.mean_loss for funct in functions])
+    cov = asarray([funct.coefficient_of_variation for funct in functions])
+    if variability_method == 'normal':
+        return mean_loss * cov
+    elif variability_method == 'normal_uniform':
+        return cov
+    raise RuntimeError(("Invalid vulnerability_method in "
+                        "configuration file. vulnerability_method "
+                        "must be 'normal','normal_uniform, 'mean' "
+                        "or left blank"))
+
+
 class VulnerabilityFunction(object):
 
     """
@@ -299,7 +604,7 @@ class VulnerabilityFunction(object):
         self.coefficient_of_variation = asarray(coefficient_of_variation)
         self.distribution = asarray(distribution)
 
-    def get_loss(self, variability_method=None):
+    def get_loss(self, variability_method=None, deviate=None):
 
         """
         Get the actual loss for a curve.
@@ -307,18 +612,23 @@ class VulnerabilityFunction(object):
         Currently this just returns a mean curve.
 
         :param variability_method: How the vulnerability function is sampled.
+        :param deviate: An optional standard normal deviate to sample with.
+            By default it is drawn from the global random state.
 
         :returns: The loss y-axis values, sampled using the supplied method.
         """
+        if variability_method in ('normal', 'normal_uniform') and \
+                deviate is None:
+            deviate = numpy.random.normal(0, 1)
         if variability_method is None:
             loss_points = self.mean_loss
         elif variability_method == 'mean':
             loss_points = self.mean_loss
         elif variability_method == 'normal':
-            loss_points = self.mean_loss + numpy.random.normal(0, 1) * \
+            loss_points = self.mean_loss + deviate * \
                 (self.mean_loss*self.coefficient_of_variation)
         elif variability_method == 'normal_uniform':
-            loss_points = self.mean_loss + numpy.random.normal(0, 1) * \
+            loss_points = self.mean_loss + deviate * \
                 (self.coefficient_of_variation)
         else:
             raise RuntimeError(("Invalid vulnerability_method in "
@@ -390,7 +700,18 @@ class RealisedVulnerabilityCurves(object):
     Respresents a collection of vulnerability curves associated with an
     exposure set.
 
-    There is one vulnerability curve per asset
+    There is one vulnerability curve per asset. The distinct curves are
+    kept in a table, with the index of the curve of each asset, so the
+    memory used depends on the number of curves rather than assets.
+
+    Optionally the curves are also tabulated on a uniform grid of
+    intensities. A look up then rounds the intensity to the nearest grid
+    point and takes the loss there. See `lut_error_bound` for the largest
+    difference from interpolating the curves.
+
+    For a Monte Carlo look up the curves are the mean curves, with the
+    standard deviation of each loss point in `sigma_curves`. See
+    `monte_carlo`.
     """
     # pylint: disable=R0913
 
@@ -400,7 +721,13 @@ class RealisedVulnerabilityCurves(object):
                  intensity_measure_level,
                  loss_per_asset,
                  vulnerability_set_id,
-                 default_loss):
+                 default_loss,
+                 curve_index=None,
+                 lut_levels=None,
+                 sigma_curves=None,
+                 realisations=None,
+                 stream=None,
+                 lut=None):
         """
 
         :param intensity_measure_type: type of intensity measure that the
@@ -411,36 +738,444 @@ class RealisedVulnerabilityCurves(object):
             the mean loss curve (common to all functions).
         :param loss_per_asset: 2D array of ratio points per asset.
                 The loss dimension can be regarded as the y axis values.
-                dimensions (asset, loss).
+                dimensions (asset, loss). If `curve_index` is given this is
+                the table of distinct curves, dimensions (curve, loss).
+        :param curve_index: An optional 1D array of the row of
+                `loss_per_asset` holding the curve of each asset.
+        :param lut_levels: An optional uniform grid of intensities, from
+                `lut_levels`, to tabulate the curves on.
+        :param sigma_curves: An optional 2D array of the standard deviation
+                of the loss points of the curves, for a Monte Carlo look up.
+                The curves are not tabulated with this.
+        :param realisations: The number of Monte Carlo realisations.
+        :param stream: An optional `hazimp.rng.AssetStream` of the assets,
+                for the Monte Carlo deviates.
+        :param lut: An optional table of the loss of each curve at the
+                `lut_levels`, e.g. the rows of the table of a
+                `VulnerabilitySet`. Dimensions (curve, lut level). By
+                default the curves are tabulated here.
         """
 
         self.intensity_measure_type = intensity_measure_type
         self.loss_category_type = loss_category_type
-        self.loss_per_asset = loss_per_asset
+        self.curves = asarray(loss_per_asset)
+        if curve_index is None:
+            curve_index = numpy.arange(self.curves.shape[0])
+        self.curve_index = asarray(curve_index, dtype=numpy.int32)
 
         self.intensity_measure_level = intensity_measure_level
         self.vulnerability_set_id = vulnerability_set_id
         self.default_loss = default_loss
 
-    def look_up(self, intensity):
+        self.sigma_curves = sigma_curves
+        self.stream = stream
+        self.realisations = None
+        if sigma_curves is not None:
+            self.sigma_curves = asarray(sigma_curves, dtype=float)
+            self.realisations = check_realisations(realisations)
+            lut_levels = None
+
+        # The loss of each curve at the look up table intensities,
+        # dimensions (curve, lut level)
+        self.lut_levels = lut_levels
+        self.lut = None
+        if lut_levels is not None:
+            if lut is None:
+                lut = interp_curves(
+                    numpy.broadcast_to(lut_levels, (self.curves.shape[0],
+                                                    lut_levels.shape[0])),
+                    self.intensity_measure_level, self.curves)
+            self.lut = asarray(lut, dtype=float)
+            LOGGER.info(f'Looking up {self.curves.shape[0]} '
+                        f'{self.vulnerability_set_id} curves in a table of '
+                        f'{lut_levels.shape[0]} intensities, with a '
+                        f'maximum loss error of {self.lut_error_bound:.3g}')
+
+    @property
+    def lut_error_bound(self):
+        """
+        The largest difference between the loss from the look up table
+        and the loss interpolated from the curves. Rounding the intensity
+        moves it at most half the grid step, so this is half the step times
+        the steepest slope of the curves. It is zero without a table.
+        """
+        if self.lut_levels is None or self.lut_levels.shape[0] < 2:
+            return 0.
+        levels = asarray(self.intensity_measure_level, dtype=float)
+        if levels.shape[0] < 2:
+            return 0.
+        slope = numpy.abs(numpy.diff(self.curves, axis=1)) / \
+            numpy.diff(levels)
+        step = self.lut_levels[1] - self.lut_levels[0]
+        return float(slope.max(initial=0.)) * step / 2
+
+    @property
+    def loss_per_asset(self):
+        """
+        The loss points of the curve of every asset, dimensions
+        (asset, loss). This builds the full array, so use `curves` and
+        `curve_index` where possible.
+        """
+        return self.curves[self.curve_index]
+
+    def weights_key(self):
+        """
+        A key of the intensities the curves are defined at. Curve sets
+        with the same key can share the weights of a look up.
+
+        :returns: A hashable key.
+        """
+        if self.lut is None:
+            levels = asarray(self.intensity_measure_level, dtype=float)
+            return ('interp', levels.tobytes())
+        return ('lut', self.lut_levels.tobytes())
+
+    def look_up_weights(self, intensity):
+        """
+        Compute the weights of a look up of the given intensities. These
+        only depend on the intensities and `weights_key`, so can be reused
+        for other curve sets with the same key.
+
+        :param intensity: An array intensity measures.  Dimensions(asset, ...)
+        :returns: The weights, for the `weights` argument of `look_up`.
+        """
+        if self.lut is None:
+            return interp_weights(intensity, self.intensity_measure_level)
+        return lut_position(intensity, self.lut_levels)
+
+    def look_up(self, intensity, weights=None,
+                memory_budget=DEFAULT_MEMORY_BUDGET, curve_index=None):
         """
         Given an intensity use the curve to determine the loss ratio.
 
+        The intensities can have trailing hazard dimensions, such as
+        ensemble members or time steps, after the asset dimension. These
+        are looked up in one vectorised pass, a chunk of hazard values at
+        a time, with the chunk size set by the memory budget.
+
         :param intensity: An array intensity measures.  Dimensions(asset, ...)
+        :param weights: Optional weights of the intensities, from
+            `look_up_weights` of a curve set with the same `weights_key`.
+            The intensities are not chunked if these are given.
+        :param memory_budget: The memory, in megabytes, of each chunk of
+            hazard values.
+        :param curve_index: An optional 1D array of the curve of each
+            asset, to use instead of `curve_index`, e.g. a permutation of
+            it.
 
         :return: A loss value. loss_category_type describes type of loss.
         """
         # Note the dimensions after the asset are different in intensity
-        # and loss_per_asset.
-
-        loss = zeros(intensity.shape)
-        assert self.loss_per_asset.shape[0] == intensity.shape[0]
-
-        nan = numpy.isnan(intensity)
-        for asset in range(self.loss_per_asset.shape[0]):
-            loss[asset] = interp(
-                intensity[asset],
-                self.intensity_measure_level,
-                self.loss_per_asset[asset])
-        loss[nan] = self.default_loss
+        # and the curves.
+        intensity = asarray(intensity, dtype=float)
+        if curve_index is None:
+            curve_index = self.curve_index
+        assert curve_index.shape[0] == intensity.shape[0]
+
+        hazards = int(numpy.prod(intensity.shape[1:]))
+        chunk = hazard_chunk_size(intensity.shape, memory_budget)
+        if weights is not None or chunk >= hazards:
+            if weights is None:
+                weights = self.look_up_weights(intensity)
+            loss = self._apply_weights(weights, intensity.ndim,
+                                       curve_index)
+        else:
+            # Flatten the hazard dimensions, and look up a chunk at a time
+            columns = intensity.reshape((intensity.shape[0], hazards))
+            loss = numpy.empty(columns.shape)
+            for start in range(0, hazards, chunk):
+                part = columns[:, start:start + chunk]
+                loss[:, start:start + chunk] = self._apply_weights(
+                    self.look_up_weights(part), 2, curve_index)
+            loss = loss.reshape(intensity.shape)
+        loss[numpy.isnan(intensity)] = self.default_loss
         return loss
+
+    def _apply_weights(self, weights, ndim, curve_index):
+        """
+        Look up the loss of the intensities with the given weights.
+
+        :param weights: The weights of the intensities.
+        :param ndim: The number of dimensions of the intensities.
+        :param curve_index: The curve of each asset.
+        :returns: The loss, the same shape as the intensities.
+        """
+        if self.lut is None:
+            return apply_interp_weights(weights, self.curves, curve_index)
+        rows = curve_index.reshape((-1,) + (1,) * (ndim - 1))
+        return self.lut[rows, weights]
+
+    def monte_carlo(self, intensity, weights=None, quantiles=None,
+                    memory_budget=DEFAULT_MEMORY_BUDGET):
+        """
+        Sample the loss of every asset over the Monte Carlo realisations of
+        its curve, and summarise it. See `monte_carlo_losses`.
+
+        :param intensity: An array intensity measures.  Dimensions(asset, ...)
+        :param weights: Optional weights of the intensities, from
+            `look_up_weights` of a curve set with the same `weights_key`.
+        :param quantiles: An optional list of quantiles of the loss.
+        :param memory_budget: The memory, in megabytes, of each chunk of
+            realisations.
+        :returns: mean, std, quantile_loss. NaN intensities have the default
+            loss, with no spread.
+        """
+        intensity = asarray(intensity, dtype=float)
+        assert self.curve_index.shape[0] == intensity.shape[0]
+        if self.realisations is None:
+            raise RuntimeError(f'The {self.vulnerability_set_id} curves '
+                               'have no Monte Carlo realisations.')
+
+        if weights is None:
+            weights = self.look_up_weights(intensity)
+        mean, std, quantile_loss = monte_carlo_losses(
+            weights, self.curves, self.sigma_curves, self.curve_index,
+            self.realisations, quantiles, memory_budget, self.stream)
+        missing = numpy.isnan(intensity)
+        mean[missing] = self.default_loss
+        std[missing] = 0.
+        if quantile_loss is not None:
+            quantile_loss[:, missing] = self.default_loss
+        return mean, std, quantile_loss
+
+
+def check_realisations(realisations):
+    """
+    Check a number of Monte Carlo realisations is a positive integer.
+
+    :param realisations: The number of realisations.
+    :returns: The number of realisations, as an int.
+    """
+    if isinstance(realisations, bool) or \
+            not isinstance(realisations, (int, numpy.integer)) or \
+            realisations < 1:
+        raise RuntimeError('The number of realisations must be a positive '
+                           f'integer, not {realisations!r}.')
+    return int(realisations)
+
+
+def monte_carlo_losses(weights, mean_curves, sigma_curves, curve_index,
+                       realisations, quantiles=None,
+                       memory_budget=DEFAULT_MEMORY_BUDGET, stream=None):
+    """
+    Sample the loss of every asset over many realisations of its curve.
+
+    As with the `normal` and `normal_uniform` variability methods, each
+    realisation of a curve moves every loss point by the same standard
+    normal deviate times the standard deviation of the point, and bounds
+    it between 0 and 1. The loss is then interpolated on the realised
+    curve. The deviates are drawn as a (realisation, asset) matrix for a
+    chunk of assets at a time, with the chunk size set by the memory
+    budget, so the summaries are exact without holding every realisation.
+
+    :param weights: The weights of the intensities, from `interp_weights`.
+    :param mean_curves: A 2D array of the mean loss at each level of each
+        curve. Dimensions (curve, loss)
+    :param sigma_curves: A 2D array of the standard deviation of the loss
+        at each level of each curve. Dimensions (curve, loss)
+    :param curve_index: A 1D array of the curve of each asset.
+    :param realisations: The number of realisations.
+    :param quantiles: An optional list of quantiles of the loss.
+    :param memory_budget: The memory, in megabytes, of each chunk.
+    :param stream: An optional `hazimp.rng.AssetStream` of the assets. By
+        default the deviates are drawn from the global random state.
+    :returns: mean, std, quantile_loss
+      mean, std: The mean and standard deviation of the loss over the
+      realisations, the same shape as the intensities.
+      quantile_loss: The quantiles of the loss. Dimensions
+      (quantile, asset, ...), or None if no quantiles are given.
+    """
+    low, high, offset, width, below, above = weights
+    if memory_budget is None:
+        memory_budget = DEFAULT_MEMORY_BUDGET
+    mean_curves = asarray(mean_curves, dtype=float)
+    sigma_curves = asarray(sigma_curves, dtype=float)
+    rows = asarray(curve_index).reshape((-1,) + (1,) * (low.ndim - 1))
+
+    # Intensities outside the levels take the first or last loss point
+    last = mean_curves.shape[1] - 1
+    low = numpy.where(below, 0, numpy.where(above, last, low))
+    high = numpy.where(below, 0, numpy.where(above, last, high))
+    offset = numpy.where(below | above, 0., offset)
+    low_mean = mean_curves[rows, low]
+    high_mean = mean_curves[rows, high]
+    low_sigma = sigma_curves[rows, low]
+    high_sigma = sigma_curves[rows, high]
+
+    mean = numpy.empty(low.shape)
+    std = numpy.empty(low.shape)
+    quantile_loss = None
+    if quantiles is not None:
+        quantile_loss = numpy.empty((len(quantiles),) + low.shape)
+
+    losses_per_asset = int(numpy.prod(low.shape[1:]))
+    chunk = int(memory_budget * 1024 ** 2 //
+                (SAMPLE_BYTES * realisations * max(losses_per_asset, 1)))
+    chunk = max(chunk, 1)
+    for start in range(0, low.shape[0], chunk):
+        part = slice(start, start + chunk)
+        size = (realisations, low[part].shape[0]) + (1,) * (low.ndim - 1)
+        if stream is None:
+            deviate = numpy.random.normal(0, 1, size=size)
+        else:
+            deviate = stream.normal(realisations, part).T.reshape(size)
+        low_loss = ratio_cutoff(low_mean[part] + deviate * low_sigma[part])
+        high_loss = ratio_cutoff(high_mean[part] +
+                                 deviate * high_sigma[part])
+        # The same arithmetic as numpy.interp
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            slope = (high_loss - low_loss) / width[part]
+            loss = slope * offset[part] + low_loss
+        mean[part] = loss.mean(axis=0)
+        std[part] = loss.std(axis=0)
+        if quantile_loss is not None:
+            quantile_loss[:, part] = numpy.quantile(loss, quantiles, axis=0)
+    return mean, std, quantile_loss
+
+
+def hazard_chunk_size(shape, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    The number of hazard values per asset to look up at a time, so that
+    the working memory of the look up stays within the memory budget.
+
+    :param shape: The shape of the intensities. Dimensions (asset, ...)
+    :param memory_budget: The memory, in megabytes, of each chunk.
+    :returns: The number of values of the flattened hazard dimensions in
+        each chunk, at least one.
+    """
+    if memory_budget is None:
+        memory_budget = DEFAULT_MEMORY_BUDGET
+    assets = max(shape[0], 1) if len(shape) > 0 else 1
+    chunk = int(memory_budget * 1024 ** 2 // (LOOKUP_BYTES * assets))
+    return max(chunk, 1)
+
+
+def interp_weights(intensity, intensity_measure_level):
+    """
+    Find the bin of each intensity on the intensity measure levels, and
+    its position in the bin. These are the same for every curve defined on
+    the levels.
+
+    :param intensity: An array of intensity measures. Dimensions (asset, ...)
+    :param intensity_measure_level: A 1D increasing array of the intensity
+        measure levels of the curves.
+    :returns: low, high, offset, width, below, above
+      low, high: The index of the levels either side of each intensity.
+      offset: The distance of each intensity from the low level.
+      width: The distance between the low and high levels.
+      below, above: Masks of the intensities before the first level, and
+      at or after the last level.
+    """
+    intensity = asarray(intensity, dtype=float)
+    levels = asarray(intensity_measure_level, dtype=float)
+    if levels.shape[0] == 1:
+        # Every intensity takes the loss of the single level
+        low = numpy.zeros(intensity.shape, dtype=numpy.intp)
+        return (low, low, intensity - levels[0], numpy.ones(intensity.shape),
+                intensity < levels[0], intensity >= levels[-1])
+
+    # The left edge of the bin of each intensity
+    low = numpy.searchsorted(levels, intensity, side='right') - 1
+    low = numpy.clip(low, 0, levels.shape[0] - 2)
+    low_level = levels[low]
+    return (low, low + 1, intensity - low_level, levels[low + 1] - low_level,
+            intensity < levels[0], intensity >= levels[-1])
+
+
+def apply_interp_weights(weights, curves, curve_index=None):
+    """
+    Interpolate the loss of every asset on its own curve, given the
+    weights of the intensities from `interp_weights`.
+
+    :param weights: The weights of the intensities.
+    :param curves: A 2D array of the loss at each level of each curve.
+        Dimensions (curve, loss)
+    :param curve_index: An optional 1D array of the curve of each asset.
+        By default there is one curve per asset.
+    :returns: An array of the loss, the same shape as the intensities. NaN
+        intensities give NaN.
+    """
+    low, high, offset, width, below, above = weights
+    curves = asarray(curves, dtype=float)
+    if curve_index is None:
+        curve_index = numpy.arange(low.shape[0])
+
+    # Index the curve of each intensity, over the trailing dimensions
+    rows = asarray(curve_index).reshape((-1,) + (1,) * (low.ndim - 1))
+    low_loss = curves[rows, low]
+    high_loss = curves[rows, high]
+
+    # The same arithmetic as numpy.interp
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        slope = (high_loss - low_loss) / width
+        loss = slope * offset + low_loss
+    loss = numpy.where(below, curves[rows, 0], loss)
+    return numpy.where(above, curves[rows, -1], loss)
+
+
+def interp_curves(intensity, intensity_measure_level, curves,
+                  curve_index=None):
+    """
+    Interpolate the loss of every asset on its own curve in one pass,
+    giving the same values as calling `numpy.interp` per asset.
+
+    The curves share the intensity measure levels, so the bin of every
+    intensity is found with one `searchsorted`. Intensities outside the
+    levels take the loss of the first or last level.
+
+    :param intensity: An array of intensity measures. Dimensions (asset, ...)
+    :param intensity_measure_level: A 1D increasing array of the intensity
+        measure levels of the curves.
+    :param curves: A 2D array of the loss at each level of each curve.
+        Dimensions (curve, loss)
+    :param curve_index: An optional 1D array of the curve of each asset.
+        By default there is one curve per asset.
+    :returns: An array of the loss, the same shape as intensity. NaN
+        intensities give NaN.
+    """
+    weights = interp_weights(intensity, intensity_measure_level)
+    return apply_interp_weights(weights, curves, curve_index)
+
+
+def lut_levels(intensity_measure_level, lut_resolution):
+    """
+    The uniform grid of intensities of a look up table. The grid starts at
+    the first intensity measure level and has a point at or beyond the last
+    level.
+
+    :param intensity_measure_level: The intensity measure levels of the
+        curves.
+    :param lut_resolution: The intensity step of the grid, in the units of
+        the intensity measure e.g. 0.1 m/s for wind or 0.01 for MMI.
+    :returns: A 1D array of the intensities of the grid.
+    """
+    try:
+        lut_resolution = float(lut_resolution)
+    except (TypeError, ValueError):
+        lut_resolution = numpy.nan
+    if not lut_resolution > 0:
+        msg = 'The lut_resolution must be a positive number.'
+        raise RuntimeError(msg)
+    levels = asarray(intensity_measure_level, dtype=float)
+    count = int(numpy.ceil((levels[-1] - levels[0]) / lut_resolution)) + 1
+    return levels[0] + numpy.arange(count) * lut_resolution
+
+
+def lut_position(intensity, lut_levels):
+    """
+    Round intensities to the nearest point of the uniform grid of a look
+    up table. Intensities outside the grid take its first or last point.
+
+    :param intensity: An array of intensity measures. Dimensions (asset, ...)
+    :param lut_levels: The uniform grid of intensities of the table.
+    :returns: An integer array of the grid point of each intensity. The
+        point of NaN intensities is not defined.
+    """
+    intensity = asarray(intensity, dtype=float)
+    if lut_levels.shape[0] == 1:
+        return numpy.zeros(intensity.shape, dtype=numpy.intp)
+    step = lut_levels[1] - lut_levels[0]
+    position = numpy.rint((intensity - lut_levels[0]) / step)
+    position = numpy.clip(numpy.nan_to_num(position), 0,
+                          lut_levels.shape[0] - 1)
+    return position.astype(numpy.intp)
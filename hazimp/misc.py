@@ -30,7 +30,7 @@ import tempfile
 from zipfile import ZipFile
 
 import numpy
-from numpy.random import random_sample, permutation
+from numpy.random import random_sample
 import boto3
 from botocore.exceptions import ClientError
 
@@ -48,6 +48,11 @@ RESOURCE_DIR = os.path.join(ROOT_DIR, 'resources')
 EXAMPLE_DIR = os.path.join(ROOT_DIR, 'examples')
 INTID = 'internal_id'
 
+# Space filling curves used to order the exposure
+HILBERT = 'hilbert'
+MORTON = 'morton'
+CURVES = (HILBERT, MORTON)
+
 DRIVERS = {'shp': 'ESRI Shapefile',
            'json': 'GeoJSON',
            'gpkg': 'GPKG'}
@@ -219,51 +224,167 @@ def sorted_dict_values(adict):
     return keys, [adict[key] for key in keys]
 
 
-def permutate_att_values(dframe, fields, groupby=None):
+def group_codes(dframe, groupby=None):
     """
-    Given a dataframe, return the dataframe with the values in
-    ``fields`` permutated. If the ``groupby`` arg is given,
-    then permutate the values of ``fields`` within each grouping of
-    ``groupby``.
+    Give each value of the ``groupby`` field an integer group code.
 
     :param dframe: A dataframe.
     :type dframe: ``pandas.DataFrame``
-    :param fields: Name of a field to permutate, or a list of fields.
-    :type fields: str or list.
-    :param str groupby: Name of the field to group values by.
-
-    :return: The same ``pandas.DataFrame``, with the values of ``fields``
-             permutated.
+    :param str groupby: Name of the field to group values by. If this is
+        not given, all the values are in one group.
 
+    :return: A 1D integer array of the group code of each row. Rows with
+             no value in ``groupby`` have a code of -1.
     """
-    newdf = dframe.copy()
-    if isinstance(fields, str):
-        fields = [fields]
-
-    if groupby and groupby in dframe.columns:
-        for field in fields:
-            newdf[field] = \
-                newdf.groupby(groupby)[field].transform(permutation)
-    elif groupby and groupby not in dframe.columns:
+    if not groupby:
+        return numpy.zeros(len(dframe), dtype=numpy.intp)
+    if groupby not in dframe:
         LOGGER.error(f"Cannot use {groupby} for permuting exposure attributes")
         LOGGER.error("The input exposure data does not include that field")
         sys.exit()
+    codes, _ = pd.factorize(numpy.asarray(dframe[groupby]))
+    return codes
+
+
+def group_permutation(codes, group_order=None, out=None, rng=None):
+    """
+    Randomly permutate the positions of values within each group, without
+    touching the values. The positions of the values sorted by group, and
+    then by a random key, are scattered back to the positions sorted by
+    group only, so each value is swapped with a random value of its own
+    group.
+
+    :param codes: A 1D integer array of the group code of each value, e.g.
+        from `pandas.factorize`. Values with a negative code have no group
+        and are not moved.
+    :param group_order: An optional stable argsort of ``codes``. Pass this
+        in to reuse it over many permutations.
+    :param out: An optional integer array to write the permutation into.
+    :param rng: An optional `numpy.random.Generator` to draw the random
+        keys from. By default they are drawn from the global random state.
+
+    :return: An index array, so ``values[index]`` is the permutated values.
+    """
+    codes = numpy.asarray(codes)
+    if group_order is None:
+        group_order = numpy.argsort(codes, kind='stable')
+    if out is None:
+        out = numpy.empty(codes.shape[0], dtype=numpy.intp)
+    if rng is None:
+        key = random_sample(codes.shape[0])
+    else:
+        key = rng.random(codes.shape[0])
+    # lexsort is stable, so values with no group keep their order
+    key[codes < 0] = 0.
+    out[group_order] = numpy.lexsort((key, codes))
+    return out
+
+
+def space_filling_key(lon, lat, curve=HILBERT, order=16):
+    """
+    Calculate the position of lat lon points along a space filling curve
+    covering their bounding box, so sorting by the key puts points that
+    are close in space close together.
+
+    :param lon: A 1D array of the longitude of the points.
+    :param lat: A 1D array of the latitude of the points.
+    :param curve: The space filling curve, one of `CURVES`.
+    :param order: The number of bits per axis; the bounding box is split
+        into a 2**order by 2**order grid.
+    :returns: A 1D integer array of the key of each point. Points with
+        no location have a key after all of the other points.
+    """
+    if curve not in CURVES:
+        raise RuntimeError(f'Invalid space filling curve, {curve}.')
+    if not 0 < order < 32:
+        raise RuntimeError(f'Invalid space filling curve order, {order}.')
+
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.asarray(lat, dtype=float)
+    located = numpy.isfinite(lon) & numpy.isfinite(lat)
+
+    cells = 1 << order
+    x = numpy.zeros(lon.shape, dtype=numpy.int64)
+    y = numpy.zeros(lat.shape, dtype=numpy.int64)
+    for grid, values in ((x, lon), (y, lat)):
+        if located.any():
+            low = values[located].min()
+            span = values[located].max() - low
+            if span > 0:
+                scaled = (values[located] - low) / span * (cells - 1)
+                grid[located] = numpy.round(scaled).astype(numpy.int64)
+
+    if curve == HILBERT:
+        key = _hilbert_key(x, y, order)
     else:
-        for field in fields:
-            newdf[field] = newdf[field].transform(permutation)
+        key = _morton_key(x, y, order)
+    key[~located] = numpy.int64(1) << (2 * order)
+    return key
 
-    return newdf
+
+def _hilbert_key(x, y, order):
+    """
+    Calculate the distance along a Hilbert curve of grid cells.
+
+    :param x: A 1D integer array of the column of each cell.
+    :param y: A 1D integer array of the row of each cell.
+    :param order: The number of bits per axis.
+    :returns: A 1D integer array of the distance of each cell.
+    """
+    x = x.copy()
+    y = y.copy()
+    key = numpy.zeros(x.shape, dtype=numpy.int64)
+    size = 1 << (order - 1)
+    while size > 0:
+        x_bit = (x & size) > 0
+        y_bit = (y & size) > 0
+        key += size * size * ((3 * x_bit) ^ y_bit)
+
+        # Rotate the quadrant so the curve is continuous
+        flip = ~y_bit & x_bit
+        x[flip] = size - 1 - x[flip]
+        y[flip] = size - 1 - y[flip]
+        swap = ~y_bit
+        x[swap], y[swap] = y[swap], x[swap].copy()
+        x &= size - 1
+        y &= size - 1
+        size >>= 1
+    return key
+
+
+def _morton_key(x, y, order):
+    """
+    Calculate the Morton (Z order) key of grid cells, interleaving the
+    bits of the column and row.
+
+    :param x: A 1D integer array of the column of each cell.
+    :param y: A 1D integer array of the row of each cell.
+    :param order: The number of bits per axis.
+    :returns: A 1D integer array of the key of each cell.
+    """
+    key = numpy.zeros(x.shape, dtype=numpy.int64)
+    for bit in range(order):
+        key |= ((x >> bit) & 1) << (2 * bit)
+        key |= ((y >> bit) & 1) << (2 * bit + 1)
+    return key
 
 
 def get_file_mtime(file):
     """
     Retrieve the modified time of a file
 
-    :param str file: Full path to a valid file
+    :param str file: Full path to a valid file, or an S3 object in
+        /vsis3/bucket/key format.
 
     :returns: ISO-format of the modification time of the file
     """
-    dt = datetime.fromtimestamp(os.path.getmtime(file))
+    if file.startswith('/vsis3/'):
+        [bucket_name, bucket_key, _] = s3_path_segments_from_vsis3(file)
+        response = get_s3_client().head_object(Bucket=bucket_name,
+                                               Key=bucket_key)
+        dt = response['LastModified']
+    else:
+        dt = datetime.fromtimestamp(os.path.getmtime(file))
     return dt.strftime(DATEFMT)
 
 
@@ -18,13 +18,62 @@
 """
 Manipulate raster data.
 """
+import os
+import re
+import glob
+import json
+import hashlib
+import logging
 import threading
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures.thread import ThreadPoolExecutor
+from multiprocessing import shared_memory
 
 from osgeo import gdal
 import numpy
 from osgeo.gdalconst import GA_ReadOnly
 
+LOGGER = logging.getLogger(__name__)
+
+# The ways of reading the raster cells under the points
+WINDOW = 'window'
+BLOCK = 'block'
+SPARSE = 'sparse'
+STRATEGIES = (WINDOW, BLOCK, SPARSE)
+
+# The ways of interpolating the raster values at the points
+NEAREST = 'nearest'
+BILINEAR = 'bilinear'
+INTERPOLATIONS = (NEAREST, BILINEAR)
+
+# The memory, in megabytes, a single raster read may use
+DEFAULT_MEMORY_BUDGET = 256
+
+# Bytes per cell used to estimate the size of a read
+CELL_BYTES = 8
+
+# The disk space, in megabytes, the raster cache may use
+DEFAULT_CACHE_SIZE = 4096
+
+# GDAL subdataset names, e.g. NETCDF:"<filename>":<variable>
+SUBDATASET = re.compile(r'^[A-Za-z0-9_]+:"(?P<path>.+)":.+$')
+
+# Glob patterns that describe a set of raster tiles
+GLOB_MAGIC = re.compile(r'[*?[]')
+
+# GDAL virtual file systems of remote objects. GDAL reads these with HTTP
+# range requests, so only the blocks holding points are transferred.
+REMOTE_PREFIXES = ('/vsis3/', '/vsicurl/', '/vsigs/', '/vsiaz/')
+
+# The memory, in megabytes, of the in-process cache of remote blocks
+DEFAULT_TILE_CACHE_SIZE = 64
+
+# The most neighbouring blocks of a remote raster merged into one read
+MAX_COALESCED_BLOCKS = 16
+
+# The shared arrays, and pixel index, of a sampling worker process
+_WORKER = {}
+
 
 class Raster(object):
 
@@ -41,7 +90,8 @@ class Raster(object):
     # pylint: disable=R0902, R0913
 
     def __init__(self, filename, upper_left_x, upper_left_y,
-                 x_pixel, y_pixel, no_data_value, x_size, y_size):
+                 x_pixel, y_pixel, no_data_value, x_size, y_size,
+                 block_x_size=None, block_y_size=None, data=None):
         """
 
         :param filename: The raster file path string.
@@ -56,6 +106,13 @@ class Raster(object):
         :param x_size: Number of columns.
         :param y_size: Number of rows.
         :param no_data_value: Values in the raster that represent no data.
+        :param block_x_size: Number of columns in a native block of the
+                             raster. Defaults to the whole row.
+        :param block_y_size: Number of rows in a native block of the
+                             raster. Defaults to a single row.
+        :param data: An optional 2D array (rows, columns) of the raster
+                     values, e.g. memory mapped from the raster cache.
+                     If given the file is not read.
         """
         self.filename = filename
         self.ul_x = upper_left_x
@@ -65,6 +122,14 @@ class Raster(object):
         self.no_data_value = no_data_value
         self.x_size = x_size
         self.y_size = y_size
+        if block_x_size is None:
+            block_x_size = x_size
+        if block_y_size is None:
+            block_y_size = 1
+        self.block_x_size = block_x_size
+        self.block_y_size = block_y_size
+        self.data = data
+        self.remote = is_remote(filename)
 
     @classmethod
     def from_file(cls, filename):
@@ -93,70 +158,371 @@ class Raster(object):
         y_size = dataset.RasterYSize  # This will be a negative value.
         band = dataset.GetRasterBand(1)
         no_data_value = band.GetNoDataValue()
+        block_x_size, block_y_size = band.GetBlockSize()
         instance = cls(filename, upper_left_x, upper_left_y,
-                       x_pixel, y_pixel, no_data_value, x_size, y_size)
+                       x_pixel, y_pixel, no_data_value, x_size, y_size,
+                       block_x_size, block_y_size)
 
         return instance
 
-    def raster_data_at_points(self, lon, lat, scaling_factor=None):
+    def pixel_index(self, lon, lat):
+        """
+        Get the column and row of the cell containing each lat lon point.
+
+        :param lon: A 1D array of the longitude of the points.
+        :param lat: A 1D array of the latitude of the points.
+        :returns: col_offset, row_offset, inside
+          col_offset: A 1D integer array of the column of each point.
+          row_offset: A 1D integer array of the row of each point.
+          inside: A 1D boolean array, True where the point is in the grid.
+          Points outside the grid have a column and row of -1.
+        """
+        lon = numpy.asarray(lon, dtype=float)
+        lat = numpy.asarray(lat, dtype=float)
+
+        with numpy.errstate(invalid='ignore'):
+            raw_col_offset = numpy.floor((lon - self.ul_x) / self.x_pixel)
+            raw_row_offset = numpy.floor((lat - self.ul_y) / self.y_pixel)
+            inside = ((raw_col_offset >= 0) &
+                      (raw_col_offset < self.x_size) &
+                      (raw_row_offset >= 0) &
+                      (raw_row_offset < self.y_size))
+
+        col_offset = numpy.full(lon.shape, -1, dtype=numpy.intp)
+        row_offset = numpy.full(lat.shape, -1, dtype=numpy.intp)
+        col_offset[inside] = raw_col_offset[inside]
+        row_offset[inside] = raw_row_offset[inside]
+        return col_offset, row_offset, inside
+
+    def bilinear_index(self, lon, lat):
+        """
+        Get the four cells surrounding each lat lon point, and the
+        bilinear weights of the cell centres.
+
+        :param lon: A 1D array of the longitude of the points.
+        :param lat: A 1D array of the latitude of the points.
+        :returns: col_offset, row_offset, weights, nearest
+          col_offset: A (4, points) integer array of the column of the
+          cells, -1 where the cell is outside the grid.
+          row_offset: A (4, points) integer array of the row of the cells,
+          -1 where the cell is outside the grid.
+          weights: A (4, points) array of the weight of each cell.
+          nearest: A 1D integer array of which of the four cells contains
+          each point.
+        """
+        lon = numpy.asarray(lon, dtype=float)
+        lat = numpy.asarray(lat, dtype=float)
+
+        # Offsets relative to the cell centres
+        x_frac = (lon - self.ul_x) / self.x_pixel - 0.5
+        y_frac = (lat - self.ul_y) / self.y_pixel - 0.5
+        col_0 = numpy.floor(x_frac)
+        row_0 = numpy.floor(y_frac)
+        x_weight = x_frac - col_0
+        y_weight = y_frac - row_0
+
+        # The cells are ordered top left, top right, bottom left,
+        # bottom right
+        col_offset = numpy.stack([col_0, col_0 + 1, col_0, col_0 + 1])
+        row_offset = numpy.stack([row_0, row_0, row_0 + 1, row_0 + 1])
+        weights = numpy.stack([(1 - x_weight) * (1 - y_weight),
+                               x_weight * (1 - y_weight),
+                               (1 - x_weight) * y_weight,
+                               x_weight * y_weight])
+        nearest = ((x_weight >= 0.5).astype(int) +
+                   2 * (y_weight >= 0.5).astype(int))
+
+        inside = ((col_offset >= 0) & (col_offset < self.x_size) &
+                  (row_offset >= 0) & (row_offset < self.y_size))
+        col_offset = numpy.where(inside, col_offset, -1).astype(numpy.intp)
+        row_offset = numpy.where(inside, row_offset, -1).astype(numpy.intp)
+        return col_offset, row_offset, weights, nearest
+
+    def raster_data_at_points(self, lon, lat, scaling_factor=None,
+                              memory_budget=DEFAULT_MEMORY_BUDGET,
+                              strategy=None, pixel_index=None,
+                              interpolation=NEAREST):
         """
         Get data at lat lon points of the raster.
 
+        With bilinear interpolation the four cells around each point are
+        read together. Cells that are outside the grid or have no data
+        are left out and the weights of the other cells rescaled. Points
+        in a cell with no data, or outside the grid, have no value.
+
         :param lon: A 1D array of the longitude of the points.
         :param lat: A 1D array of the latitude of the points.
         :param scaling_factor: An optional scaling factor to
             apply to the values.
+        :param memory_budget: The memory, in megabytes, a single read
+            may use. Used to pick the read strategy.
+        :param strategy: Force one of the read strategies in
+            `STRATEGIES`. By default it is picked by `sample_strategy`.
+        :param pixel_index: An optional, precomputed, result of
+            `pixel_index` for the points on this grid.
+        :param interpolation: One of `INTERPOLATIONS`. The default,
+            nearest, uses the value of the cell containing the point.
         :returns: A numpy array, First dimension being the points/sites.
         """
 
         assert lon.size == lat.size
+        if interpolation not in INTERPOLATIONS:
+            raise RuntimeError(f'Invalid raster interpolation, '
+                               f'{interpolation}.')
+        if strategy is not None and strategy not in STRATEGIES:
+            raise RuntimeError(f'Invalid raster read strategy, '
+                               f'{strategy}.')
 
         values = numpy.empty(lon.size)
         values[:] = numpy.nan
 
-        # get an index of all the values inside the grid
-        # there has to be a better way...
-        bad_indexes = set()
-        bad_indexes = bad_indexes.union(numpy.where(lon < self.ul_x)[0])
-        bad_indexes = bad_indexes.union(
-            numpy.where(lon > self.ul_x + self.x_size * self.x_pixel)[0])
-        bad_indexes = bad_indexes.union(numpy.where(lat > self.ul_y)[0])
-        bad_indexes = bad_indexes.union(
-            numpy.where(lat < self.ul_y + self.y_size * self.y_pixel)[0])
-        good_indexes = numpy.array(list(set(
-            range(lon.size)).difference(bad_indexes)))
-
-        if good_indexes.shape[0] > 0:
-            # compute pixel offset
-            raw_col_offset = (lon - self.ul_x) / self.x_pixel
-            col_offset = numpy.trunc(raw_col_offset).astype(int)
-            raw_row_offset = (lat - self.ul_y) / self.y_pixel
-            row_offset = numpy.trunc(raw_row_offset).astype(int)
-
-            data = threading.local()
-
-            def read_cell(i, x, y):
-                if 'band' not in data.__dict__:
-                    data.dataset = gdal.Open(self.filename, GA_ReadOnly)
-                    data.band = data.dataset.GetRasterBand(1)
-
-                values[i] = data.band.ReadAsArray(x, y, 1, 1)[0][0]
-
-            with ThreadPoolExecutor() as executor:
-                for index in good_indexes:
-                    executor.submit(read_cell, index,
-                                    col_offset[index].item(),
-                                    row_offset[index].item())
+        if pixel_index is None:
+            pixel_index = self.pixel_index(lon, lat)
+        col_offset, row_offset, inside = pixel_index
+        good_indexes = numpy.flatnonzero(inside)
 
-        # Change NODATA_value to NAN
-        values = numpy.where(values == self.no_data_value, numpy.nan,
-                             values)
+        if good_indexes.shape[0] > 0 and interpolation == BILINEAR:
+            col_offset, row_offset, weights, nearest = self.bilinear_index(
+                lon[good_indexes], lat[good_indexes])
+            in_grid = col_offset >= 0
+            cells = numpy.empty(col_offset.shape)
+            cells[:] = numpy.nan
+            cells[in_grid] = self._read_points(
+                col_offset[in_grid], row_offset[in_grid],
+                memory_budget, strategy)
+
+            missing = numpy.isnan(cells)
+            weights[missing] = 0.
+            cells[missing] = 0.
+            total = weights.sum(axis=0)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                good_values = (weights * cells).sum(axis=0) / total
+            point = numpy.arange(good_indexes.shape[0])
+            good_values[missing[nearest, point]] = numpy.nan
+            values[good_indexes] = good_values
+        elif good_indexes.shape[0] > 0:
+            values[good_indexes] = self._read_points(
+                col_offset[good_indexes], row_offset[good_indexes],
+                memory_budget, strategy)
 
         if scaling_factor:
             values *= scaling_factor
 
         return values
 
+    def _read_points(self, col_offset, row_offset, memory_budget,
+                     strategy=None):
+        """
+        Read the values of raster cells, using the raster cache or the
+        read strategy for the cells.
+
+        :param col_offset: A 1D array of the column of each cell.
+        :param row_offset: A 1D array of the row of each cell.
+        :param memory_budget: The memory, in megabytes, a single read
+            may use. Used to pick the read strategy.
+        :param strategy: Force one of the read strategies in
+            `STRATEGIES`. By default it is picked by `sample_strategy`.
+        :returns: A 1D array of the cell values, NaN where there is no
+            data.
+        """
+        values = numpy.empty(col_offset.shape[0])
+        indexes = numpy.arange(col_offset.shape[0])
+
+        if self.data is not None:
+            LOGGER.info(f"Sampling {indexes.shape[0]} cells from "
+                        f"{self.filename} using the raster cache")
+            values[:] = self.data[row_offset, col_offset]
+        else:
+            if strategy is None:
+                strategy = self.sample_strategy(col_offset, row_offset,
+                                                memory_budget)
+            LOGGER.info(f"Sampling {indexes.shape[0]} cells from "
+                        f"{self.filename} using a {strategy} read")
+
+            if strategy == WINDOW:
+                self._read_window(values, indexes, col_offset, row_offset)
+            elif strategy == BLOCK:
+                self._read_blocks(values, indexes, col_offset, row_offset)
+            else:
+                self._read_cells(values, indexes, col_offset, row_offset)
+
+        # Change NODATA_value to NAN
+        values[values == self.no_data_value] = numpy.nan
+        return values
+
+    def sample_strategy(self, col_offset, row_offset,
+                        memory_budget=DEFAULT_MEMORY_BUDGET):
+        """
+        Pick how to read the cells under a set of points.
+
+        WINDOW - one read of the window covering all the points, if
+            it fits in the memory budget.
+        SPARSE - one read per point, if a native block does not fit
+            in the memory budget or there is at most one point per block.
+        BLOCK - one read per native block holding a point, otherwise.
+
+        Remote rasters use a window read only if every block in the
+        window holds a point, and otherwise read by block.
+
+        :param col_offset: A 1D array of the column of each point.
+        :param row_offset: A 1D array of the row of each point.
+        :param memory_budget: The memory, in megabytes, a single read
+            may use.
+        :returns: One of `STRATEGIES`.
+        """
+        budget = memory_budget * 1024 ** 2
+        window_cells = ((col_offset.max() - col_offset.min() + 1) *
+                        (row_offset.max() - row_offset.min() + 1))
+        block_cells = self.block_x_size * self.block_y_size
+        n_blocks = numpy.unique(self._block_id(col_offset, row_offset)).size
+
+        if self.remote:
+            # Every block read is a request, so never read blocks
+            # without points and read each block only once
+            window_blocks = ((col_offset.max() // self.block_x_size -
+                              col_offset.min() // self.block_x_size + 1) *
+                             (row_offset.max() // self.block_y_size -
+                              row_offset.min() // self.block_y_size + 1))
+            if (window_blocks == n_blocks and
+                    window_cells * CELL_BYTES <= budget):
+                return WINDOW
+            if block_cells * CELL_BYTES > budget:
+                return SPARSE
+            return BLOCK
+
+        if window_cells * CELL_BYTES <= budget:
+            return WINDOW
+        if block_cells * CELL_BYTES > budget or n_blocks >= col_offset.size:
+            return SPARSE
+        return BLOCK
+
+    def _block_id(self, col_offset, row_offset):
+        """
+        The native block holding each cell, numbered row by row.
+        """
+        blocks_per_row = -(-self.x_size // self.block_x_size)
+        return ((row_offset // self.block_y_size) * blocks_per_row +
+                col_offset // self.block_x_size)
+
+    def _thread_band(self, data):
+        """
+        Get the raster band for this thread, opening the file once
+        per thread.
+
+        :param data: A `threading.local` instance.
+        """
+        if 'band' not in data.__dict__:
+            data.dataset = gdal.Open(self.filename, GA_ReadOnly)
+            data.band = data.dataset.GetRasterBand(1)
+        return data.band
+
+    def _read_window(self, values, indexes, col_offset, row_offset):
+        """
+        Fill values at the given indexes from a single read of the
+        window covering all of the cells.
+
+        :param values: The 1D array to fill.
+        :param indexes: A 1D array of the indexes into values to fill.
+        :param col_offset: A 1D array of the column of each index.
+        :param row_offset: A 1D array of the row of each index.
+        """
+        x_off = int(col_offset.min())
+        y_off = int(row_offset.min())
+        x_size = int(col_offset.max()) - x_off + 1
+        y_size = int(row_offset.max()) - y_off + 1
+
+        dataset = gdal.Open(self.filename, GA_ReadOnly)
+        band = dataset.GetRasterBand(1)
+        window = band.ReadAsArray(x_off, y_off, x_size, y_size)
+        values[indexes] = window[row_offset - y_off, col_offset - x_off]
+
+    def _read_blocks(self, values, indexes, col_offset, row_offset):
+        """
+        Fill values at the given indexes, reading each native block of
+        the raster that holds at least one point exactly once. For remote
+        rasters runs of neighbouring blocks are read together.
+
+        :param values: The 1D array to fill.
+        :param indexes: A 1D array of the indexes into values to fill.
+        :param col_offset: A 1D array of the column of each index.
+        :param row_offset: A 1D array of the row of each index.
+        """
+        blocks_per_row = -(-self.x_size // self.block_x_size)
+        block_id = self._block_id(col_offset, row_offset)
+
+        # Group the points by block
+        order = numpy.argsort(block_id, kind='stable')
+        block_ids, starts = numpy.unique(block_id[order], return_index=True)
+        first_block, last_block, run_starts = self._block_runs(block_ids)
+        groups = numpy.split(order, starts[run_starts[1:]])
+
+        data = threading.local()
+
+        def read_run(first, last, members):
+            band = self._thread_band(data)
+            x_off = (first % blocks_per_row) * self.block_x_size
+            y_off = (first // blocks_per_row) * self.block_y_size
+            x_end = min((last % blocks_per_row + 1) * self.block_x_size,
+                        self.x_size)
+            y_size = min(self.block_y_size, self.y_size - y_off)
+            run_data = band.ReadAsArray(x_off, y_off, x_end - x_off, y_size)
+            values[indexes[members]] = run_data[row_offset[members] - y_off,
+                                                col_offset[members] - x_off]
+
+        with ThreadPoolExecutor() as executor:
+            # Consume the results so read errors are raised
+            list(executor.map(read_run, first_block.tolist(),
+                              last_block.tolist(), groups))
+
+    def _block_runs(self, block_ids):
+        """
+        Group sorted block ids into the runs read together. For remote
+        rasters neighbouring blocks in a row of blocks form a run, of at
+        most `MAX_COALESCED_BLOCKS`, so GDAL can fetch them with one
+        merged range request. Otherwise each block is a run.
+
+        :param block_ids: A sorted 1D array of unique block ids.
+        :returns: first_block, last_block, run_starts
+          first_block: A 1D array of the first block of each run.
+          last_block: A 1D array of the last block of each run.
+          run_starts: A 1D array of the index in block_ids of the
+          first block of each run.
+        """
+        if not self.remote:
+            return block_ids, block_ids, numpy.arange(block_ids.shape[0])
+
+        blocks_per_row = -(-self.x_size // self.block_x_size)
+        breaks = ((numpy.diff(block_ids) != 1) |
+                  (numpy.diff(block_ids // blocks_per_row) != 0))
+        run = numpy.concatenate([[0], numpy.cumsum(breaks)])
+        _, run_first = numpy.unique(run, return_index=True)
+
+        # Split long runs
+        rank = numpy.arange(block_ids.shape[0]) - run_first[run]
+        new_run = (rank % MAX_COALESCED_BLOCKS) == 0
+        run_starts = numpy.flatnonzero(new_run)
+        run_ends = numpy.append(run_starts[1:], block_ids.shape[0]) - 1
+        return block_ids[run_starts], block_ids[run_ends], run_starts
+
+    def _read_cells(self, values, indexes, col_offset, row_offset):
+        """
+        Fill values at the given indexes, reading one cell at a time.
+
+        :param values: The 1D array to fill.
+        :param indexes: A 1D array of the indexes into values to fill.
+        :param col_offset: A 1D array of the column of each index.
+        :param row_offset: A 1D array of the row of each index.
+        """
+        data = threading.local()
+
+        def read_cell(i, x, y):
+            band = self._thread_band(data)
+            values[i] = band.ReadAsArray(x, y, 1, 1)[0][0]
+
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(read_cell, indexes.tolist(),
+                              col_offset.tolist(), row_offset.tolist()))
+
     def extent(self):
         """
         Return the extent, in lats and longs of the raster.
@@ -170,15 +536,577 @@ class Raster(object):
         max_long = self.ul_x + self.x_pixel * self.x_size
         return min_long, min_lat, max_long, max_lat
 
+    def geotransform(self):
+        """
+        Return the GDAL style geotransform of the raster.
+
+        :returns: (ul_x, x_pixel, 0, ul_y, 0, y_pixel)
+        """
+        return (self.ul_x, self.x_pixel, 0.0, self.ul_y, 0.0, self.y_pixel)
+
+    def grid(self):
+        """
+        Return the grid definition of the raster. Rasters with the same
+        grid definition have the same cell for a lat lon point.
+
+        :returns: The geotransform followed by the number of columns and
+            rows.
+        """
+        return self.geotransform() + (self.x_size, self.y_size)
+
+
+class PixelIndex(object):
+
+    """
+    The cell of each exposure point on a raster grid, computed once per
+    distinct grid definition and shared by every raster on that grid.
+
+    If `index_dir` is given the indexes are also saved there, keyed by
+    a hash of the exposure coordinates and the grid definition, so later
+    runs on the same exposure and grid skip the conversion entirely.
+    """
+
+    def __init__(self, lon, lat, index_dir=None):
+        """
+        :param lon: A 1D array of the longitude of the points.
+        :param lat: A 1D array of the latitude of the points.
+        :param index_dir: An optional directory to save the indexes in.
+        """
+        self.lon = numpy.ascontiguousarray(lon, dtype=float)
+        self.lat = numpy.ascontiguousarray(lat, dtype=float)
+        self.index_dir = index_dir
+        self._indexes = {}
+        self._exposure_hash = None
+        if index_dir is not None:
+            os.makedirs(index_dir, exist_ok=True)
+
+    def exposure_hash(self):
+        """
+        A hex digest of the exposure coordinates.
+        """
+        if self._exposure_hash is None:
+            digest = hashlib.sha1(self.lon.tobytes())
+            digest.update(self.lat.tobytes())
+            self._exposure_hash = digest.hexdigest()
+        return self._exposure_hash
+
+    def __call__(self, raster):
+        """
+        Get the cell of each point on the grid of a raster.
+
+        :param raster: A Raster instance.
+        :returns: col_offset, row_offset, inside. See `Raster.pixel_index`.
+        """
+        grid = raster.grid()
+        if grid in self._indexes:
+            LOGGER.debug(f"Reusing the pixel index for {raster.filename}")
+            return self._indexes[grid]
+
+        index_file = None
+        if self.index_dir is not None:
+            digest = hashlib.sha1(self.exposure_hash().encode('utf-8'))
+            digest.update(repr(grid).encode('utf-8'))
+            index_file = os.path.join(self.index_dir,
+                                      digest.hexdigest() + '.npz')
+
+        if index_file is not None and os.path.isfile(index_file):
+            LOGGER.debug(f"Loading the pixel index from {index_file}")
+            with numpy.load(index_file) as saved:
+                col_offset = saved['col_offset']
+                row_offset = saved['row_offset']
+            index = (col_offset, row_offset, col_offset >= 0)
+        else:
+            index = raster.pixel_index(self.lon, self.lat)
+            if index_file is not None:
+                tmp_file = f'{index_file}.{os.getpid()}.tmp.npz'
+                numpy.savez(tmp_file, col_offset=index[0],
+                            row_offset=index[1])
+                os.replace(tmp_file, index_file)
+
+        self._indexes[grid] = index
+        return index
+
+
+class RasterCache(object):
+
+    """
+    An on-disk cache of decoded raster bands.
+
+    The first time a raster is used its first band is decoded through
+    GDAL and saved as a raw .npy file, with the geotransform in a
+    .json file beside it. Later uses memory map the .npy file, so there
+    is no decoding. The least recently used entries are removed once
+    the cache is larger than `max_size`.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE,
+                 hash_content=False):
+        """
+        :param cache_dir: The directory the cache files are kept in.
+        :param max_size: The disk space, in megabytes, the cache may use.
+        :param hash_content: If True, key entries by a hash of the file
+            contents. Otherwise key by the file path, size and
+            modification time.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hash_content = hash_content
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, filename):
+        """
+        Get the cache key for a raster file.
+
+        :param filename: The raster file path string. GDAL subdataset
+            names, such as 'NETCDF:"<filename>":<variable>', are keyed on
+            the underlying file.
+        :returns: A hex digest, or None if the file is not on the local
+            file system and can not be cached. Content keys only depend
+            on the subdataset and the file contents, so a moved or
+            renamed copy of a raster has the same key.
+        """
+        match = SUBDATASET.match(filename)
+        path = match.group('path') if match else filename
+        if not os.path.isfile(path):
+            return None
+
+        if self.hash_content:
+            # The subdataset name without the path, e.g. 'NETCDF:"":gust'
+            selector = ''
+            if match:
+                start, end = match.span('path')
+                selector = filename[:start] + filename[end:]
+            digest = hashlib.sha1(selector.encode('utf-8'))
+            with open(path, 'rb') as fhandle:
+                for chunk in iter(lambda: fhandle.read(1024 ** 2), b''):
+                    digest.update(chunk)
+        else:
+            stat = os.stat(path)
+            digest = hashlib.sha1(filename.encode('utf-8'))
+            digest.update(os.path.abspath(path).encode('utf-8'))
+            digest.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+        return digest.hexdigest()
+
+    def raster(self, filename):
+        """
+        Get a raster, backed by the cache where possible.
+
+        :param filename: The raster file path string.
+        :returns: A Raster instance.
+        """
+        key = self.key(filename)
+        if key is None:
+            return Raster.from_file(filename)
+
+        data_file = os.path.join(self.cache_dir, key + '.npy')
+        meta_file = os.path.join(self.cache_dir, key + '.json')
+        if os.path.isfile(data_file) and os.path.isfile(meta_file):
+            LOGGER.debug(f"Raster cache hit for {filename}")
+            # Touch the entry, so it is the most recently used
+            os.utime(data_file)
+        else:
+            LOGGER.info(f"Adding {filename} to the raster cache")
+            self._store(filename, data_file, meta_file)
+            self.evict(keep=key)
+
+        with open(meta_file, 'r') as fhandle:
+            meta = json.load(fhandle)
+        data = numpy.load(data_file, mmap_mode='r')
+        return Raster(filename, meta['ul_x'], meta['ul_y'],
+                      meta['x_pixel'], meta['y_pixel'],
+                      meta['no_data_value'], meta['x_size'],
+                      meta['y_size'], data=data)
+
+    @staticmethod
+    def _store(filename, data_file, meta_file):
+        """
+        Decode the first band of a raster and write it to the cache.
+        The files are written under temporary names and then renamed, so
+        other processes never see a partial entry.
+        """
+        raster = Raster.from_file(filename)
+        dataset = gdal.Open(filename, GA_ReadOnly)
+        data = dataset.GetRasterBand(1).ReadAsArray()
+
+        meta = {'filename': filename,
+                'ul_x': raster.ul_x,
+                'ul_y': raster.ul_y,
+                'x_pixel': raster.x_pixel,
+                'y_pixel': raster.y_pixel,
+                'no_data_value': raster.no_data_value,
+                'x_size': raster.x_size,
+                'y_size': raster.y_size}
+
+        tmp_tag = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(data_file + tmp_tag, 'wb') as fhandle:
+            numpy.save(fhandle, data)
+        with open(meta_file + tmp_tag, 'w') as fhandle:
+            json.dump(meta, fhandle)
+        os.replace(data_file + tmp_tag, data_file)
+        os.replace(meta_file + tmp_tag, meta_file)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache is no
+        larger than `max_size`.
+
+        :param keep: A key that is never removed.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+
+        total = sum(entry[1] for entry in entries)
+        max_bytes = self.max_size * 1024 ** 2
+        for _, size, key in sorted(entries):
+            if total <= max_bytes:
+                break
+            if key == keep:
+                continue
+            LOGGER.debug(f"Removing {key} from the raster cache")
+            for ext in ('.npy', '.json'):
+                try:
+                    os.remove(os.path.join(self.cache_dir, key + ext))
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+def unique_points(lon, lat):
+    """
+    Find the unique locations of a set of lat lon points, so co-located
+    points are only sampled once.
+
+    :param lon: A 1D array of the longitude of the points.
+    :param lat: A 1D array of the latitude of the points.
+    :returns: unique_lon, unique_lat, inverse
+      unique_lon: A 1D array of the longitude of the unique locations.
+      unique_lat: A 1D array of the latitude of the unique locations.
+      inverse: A 1D integer array of the unique location of each point,
+      so `unique_lon[inverse]` is `lon`.
+    """
+    points = numpy.column_stack([numpy.asarray(lon, dtype=float),
+                                 numpy.asarray(lat, dtype=float)])
+    unique, inverse = numpy.unique(points, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    if points.shape[0] > 0:
+        LOGGER.info(f"{points.shape[0]} points at {unique.shape[0]} unique "
+                    f"locations, {1 - unique.shape[0] / points.shape[0]:.1%}"
+                    f" of the points are co-located")
+    return unique[:, 0], unique[:, 1], inverse
+
 
-def files_raster_data_at_points(lon, lat, files, scaling_factor=None):
+def is_remote(filename):
+    """
+    Check if a raster file name is a remote object, read through one of
+    the GDAL network virtual file systems.
+
+    :param filename: The raster file path string.
+    :returns: True if the raster is remote.
+    """
+    return filename.startswith(REMOTE_PREFIXES)
+
+
+def configure_remote_reads(tile_cache_size=DEFAULT_TILE_CACHE_SIZE):
+    """
+    Set the GDAL options for sampling remote, cloud optimised, rasters
+    with range reads of only the blocks holding points.
+
+    :param tile_cache_size: The memory, in megabytes, of the in-process
+        cache of remote blocks, shared by all the open datasets.
+    """
+    options = {
+        # Do not list the bucket or directory when a file is opened
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+        # Merge the ranges of neighbouring blocks into one request
+        'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+        'GDAL_HTTP_MULTIRANGE': 'YES',
+        'GDAL_HTTP_MULTIPLEX': 'YES',
+        'CPL_VSIL_CURL_CACHE_SIZE': str(tile_cache_size * 1024 ** 2)}
+    for key, value in options.items():
+        gdal.SetConfigOption(key, value)
+
+
+def is_mosaic(filename):
+    """
+    Check if a hazard file name describes a set of raster tiles, being
+    either a directory or a glob pattern. An existing file is never a
+    mosaic, even if its name contains glob characters.
+
+    :param filename: The file, directory or glob pattern string.
+    :returns: True if the name describes a set of raster tiles.
+    """
+    if os.path.isfile(filename):
+        return False
+    return (os.path.isdir(filename) or
+            GLOB_MAGIC.search(filename) is not None)
+
+
+class TileIndex(object):
+
+    """
+    An index of the extents of a set of raster tiles, used to route
+    each point to the tile containing it.
+
+    The tile extents are registered on a regular grid of buckets, about
+    one tile in size, so routing a point only tests the few tiles in its
+    bucket rather than every tile.
+    """
+
+    def __init__(self, filenames, extents):
+        """
+        :param filenames: A list of the tile file names.
+        :param extents: A list of the tile extents,
+            [min_long, min_lat, max_long, max_lat] for each tile.
+        """
+        self.filenames = list(filenames)
+        self.extents = numpy.asarray(extents, dtype=float).reshape(-1, 4)
+        self._build()
+
+    @classmethod
+    def from_tiles(cls, tiles, index_dir=None):
+        """
+        Build the index of a directory or glob pattern of raster tiles.
+        Files in a directory that GDAL can not open are ignored.
+
+        :param tiles: A directory or glob pattern of raster tiles.
+        :param index_dir: An optional directory to save the index in.
+            The saved index is reused while the tiles are unchanged.
+        :returns: A TileIndex instance.
+        """
+        if os.path.isdir(tiles):
+            pattern = os.path.join(tiles, '*')
+        else:
+            pattern = tiles
+        candidates = [[name, os.path.getsize(name),
+                       os.stat(name).st_mtime_ns]
+                      for name in sorted(glob.glob(pattern))
+                      if os.path.isfile(name)]
+        if len(candidates) == 0:
+            raise RuntimeError(f'No raster tiles found: {tiles}')
+
+        index_file = None
+        if index_dir is not None:
+            os.makedirs(index_dir, exist_ok=True)
+            digest = hashlib.sha1(os.path.abspath(pattern).encode('utf-8'))
+            index_file = os.path.join(index_dir,
+                                      digest.hexdigest() + '.json')
+            if os.path.isfile(index_file):
+                with open(index_file, 'r') as fhandle:
+                    saved = json.load(fhandle)
+                if saved['candidates'] == candidates:
+                    LOGGER.debug(f"Loading the tile index from {index_file}")
+                    return cls(saved['filenames'], saved['extents'])
+
+        LOGGER.info(f"Indexing {len(candidates)} raster tiles in {tiles}")
+        filenames = []
+        extents = []
+        for name, _, _ in candidates:
+            try:
+                a_raster = Raster.from_file(name)
+            except RuntimeError:
+                LOGGER.debug(f"Ignoring {name}, it is not a raster")
+                continue
+            filenames.append(name)
+            extents.append(list(a_raster.extent()))
+        if len(filenames) == 0:
+            raise RuntimeError(f'No raster tiles found: {tiles}')
+
+        if index_file is not None:
+            tmp_file = f'{index_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as fhandle:
+                json.dump({'candidates': candidates,
+                           'filenames': filenames,
+                           'extents': extents}, fhandle)
+            os.replace(tmp_file, index_file)
+        return cls(filenames, extents)
+
+    def _build(self):
+        """
+        Register each tile in the buckets it overlaps.
+        """
+        ext = self.extents
+        self.bucket_x = numpy.median(ext[:, 2] - ext[:, 0])
+        self.bucket_y = numpy.median(ext[:, 3] - ext[:, 1])
+        self.origin_x = ext[:, 0].min()
+        self.origin_y = ext[:, 1].min()
+
+        col_0 = numpy.floor((ext[:, 0] - self.origin_x) / self.bucket_x)
+        col_1 = numpy.floor((ext[:, 2] - self.origin_x) / self.bucket_x)
+        row_0 = numpy.floor((ext[:, 1] - self.origin_y) / self.bucket_y)
+        row_1 = numpy.floor((ext[:, 3] - self.origin_y) / self.bucket_y)
+        col_0, col_1, row_0, row_1 = [a.astype(int) for a in
+                                      (col_0, col_1, row_0, row_1)]
+        self.n_x = col_1.max() + 1
+        self.n_y = row_1.max() + 1
+
+        members = [[] for _ in range(self.n_x * self.n_y)]
+        for tile in range(ext.shape[0]):
+            for row in range(row_0[tile], row_1[tile] + 1):
+                for col in range(col_0[tile], col_1[tile] + 1):
+                    members[row * self.n_x + col].append(tile)
+
+        depth = max(len(bucket) for bucket in members)
+        self.buckets = numpy.full((len(members), depth), -1, dtype=int)
+        for i, bucket in enumerate(members):
+            self.buckets[i, :len(bucket)] = bucket
+
+    def extent(self):
+        """
+        Return the extent, in lats and longs, covering all of the tiles.
+
+        :returns: min_long, min_lat, max_long, max_lat
+        """
+        return (self.extents[:, 0].min(), self.extents[:, 1].min(),
+                self.extents[:, 2].max(), self.extents[:, 3].max())
+
+    def route(self, lon, lat):
+        """
+        Find the tile containing each lat lon point. Where tiles overlap
+        the first tile is used.
+
+        :param lon: A 1D array of the longitude of the points.
+        :param lat: A 1D array of the latitude of the points.
+        :returns: A 1D integer array of the index of the tile in
+            `filenames` for each point, or -1 if no tile contains it.
+        """
+        lon = numpy.asarray(lon, dtype=float)
+        lat = numpy.asarray(lat, dtype=float)
+        tile = numpy.full(lon.shape, -1, dtype=int)
+
+        with numpy.errstate(invalid='ignore'):
+            col = numpy.floor((lon - self.origin_x) / self.bucket_x)
+            row = numpy.floor((lat - self.origin_y) / self.bucket_y)
+            valid = ((col >= 0) & (col < self.n_x) &
+                     (row >= 0) & (row < self.n_y))
+        points = numpy.flatnonzero(valid)
+        bucket = (row[points] * self.n_x + col[points]).astype(int)
+
+        for depth in range(self.buckets.shape[1]):
+            candidate = self.buckets[bucket, depth]
+            check = (tile[points] < 0) & (candidate >= 0)
+            ext = self.extents[candidate[check]]
+            in_x = lon[points[check]]
+            in_y = lat[points[check]]
+            # The same edges as Raster.pixel_index
+            inside = ((in_x >= ext[:, 0]) & (in_x < ext[:, 2]) &
+                      (in_y > ext[:, 1]) & (in_y <= ext[:, 3]))
+            tile[points[check][inside]] = candidate[check][inside]
+        return tile
+
+
+class Mosaic(object):
+
+    """
+    A set of raster tiles sampled as if they were one raster.
+    """
+
+    def __init__(self, tiles, tile_index):
+        """
+        :param tiles: The directory or glob pattern of the tiles.
+        :param tile_index: A TileIndex of the tiles.
+        """
+        self.filename = tiles
+        self.tile_index = tile_index
+
+    @classmethod
+    def from_tiles(cls, tiles, index_dir=None):
+        """
+        Load a directory or glob pattern of raster tiles.
+
+        :param tiles: A directory or glob pattern of raster tiles.
+        :param index_dir: An optional directory to save the tile index in.
+        :returns: A Mosaic instance.
+        """
+        return cls(tiles, TileIndex.from_tiles(tiles, index_dir))
+
+    def extent(self):
+        """
+        Return the extent, in lats and longs, covering all of the tiles.
+
+        :returns: min_long, min_lat, max_long, max_lat
+        """
+        return self.tile_index.extent()
+
+    def raster_data_at_points(self, lon, lat, scaling_factor=None,
+                              memory_budget=DEFAULT_MEMORY_BUDGET,
+                              cache=None, interpolation=NEAREST):
+        """
+        Get data at lat lon points of the tiles. Each point is sampled
+        from the one tile containing it, and the tiles are sampled in
+        parallel.
+
+        :param lon: A 1D array of the longitude of the points.
+        :param lat: A 1D array of the latitude of the points.
+        :param scaling_factor: An optional scaling factor to
+            apply to the values.
+        :param memory_budget: The memory, in megabytes, a single read
+            may use.
+        :param cache: An optional `RasterCache` to read the tiles through.
+        :param interpolation: One of `INTERPOLATIONS`. Bilinear
+            interpolation does not use cells across tile edges.
+        :returns: A numpy array, First dimension being the points/sites.
+        """
+        assert lon.size == lat.size
+
+        values = numpy.empty(lon.size)
+        values[:] = numpy.nan
+
+        tile = self.tile_index.route(lon, lat)
+        good_indexes = numpy.flatnonzero(tile >= 0)
+        order = good_indexes[numpy.argsort(tile[good_indexes],
+                                           kind='stable')]
+        tile_ids, starts = numpy.unique(tile[order], return_index=True)
+        groups = numpy.split(order, starts[1:])
+        LOGGER.info(f"Sampling {good_indexes.shape[0]} points from "
+                    f"{tile_ids.shape[0]} tiles in {self.filename}")
+
+        def sample_tile(tile_id, members):
+            filename = self.tile_index.filenames[tile_id]
+            if cache is None:
+                a_raster = Raster.from_file(filename)
+            else:
+                a_raster = cache.raster(filename)
+            values[members] = a_raster.raster_data_at_points(
+                lon[members], lat[members], scaling_factor, memory_budget,
+                interpolation=interpolation)
+
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(sample_tile, tile_ids.tolist(), groups))
+
+        return values
+
+
+def files_raster_data_at_points(lon, lat, files, scaling_factor=None,
+                                memory_budget=DEFAULT_MEMORY_BUDGET,
+                                cache=None, pixel_index=None,
+                                tile_index_dir=None, interpolation=NEAREST,
+                                workers=None):
     """
     Get data at lat lon points, based on a set of files
 
-    :param files: A list of files.
+    :param files: A list of files. An entry can also be a directory or
+        glob pattern of raster tiles, which are sampled as one raster.
     :param lon: A 1D array of the longitude of the points.
     :param lat: A 1d array of the latitude of the points.
     :param scaling_factor: An optional scaling factor to apply to the values.
+    :param memory_budget: The memory, in megabytes, a single raster read
+        may use.
+    :param cache: An optional `RasterCache` to read the rasters through.
+    :param pixel_index: An optional `PixelIndex` of the points. Files on
+        the same grid share the cell of each point.
+    :param tile_index_dir: An optional directory to save the index of
+        each set of raster tiles in.
+    :param interpolation: One of `INTERPOLATIONS`, how the raster values
+        are interpolated at the points.
+    :param workers: The number of processes to sample the files with.
+        By default the files are sampled one after another in this
+        process.
     :returns: reshaped_data, max_extent
       reshaped_data: A numpy array, shape (sites, hazards) or shape (sites),
       for one hazard.
@@ -187,15 +1115,26 @@ def files_raster_data_at_points(lon, lat, files, scaling_factor=None):
 
     """
 
-    data = []
-    max_extent = None
-    for filename in files:
-        a_raster = Raster.from_file(filename)
-        results = a_raster.raster_data_at_points(lon, lat, scaling_factor)
-        data.append(results)
+    if pixel_index is None:
+        pixel_index = PixelIndex(lon, lat)
+
+    if workers is not None and workers > 1 and len(files) > 1:
+        data, extents = _files_data_in_processes(
+            lon, lat, files, scaling_factor, memory_budget, cache,
+            pixel_index.index_dir, tile_index_dir, interpolation, workers)
+    else:
+        data = []
+        extents = []
+        for filename in files:
+            results, extent = _file_data_at_points(
+                lon, lat, filename, scaling_factor, memory_budget, cache,
+                pixel_index, tile_index_dir, interpolation)
+            data.append(results)
+            extents.append(extent)
 
-        # Working out the maximum extent
-        extent = a_raster.extent()
+    # Working out the maximum extent
+    max_extent = None
+    for extent in extents:
         if max_extent is None:
             max_extent = list(extent)
         else:
@@ -212,6 +1151,117 @@ def files_raster_data_at_points(lon, lat, files, scaling_factor=None):
     return reshaped_data, max_extent
 
 
+def _file_data_at_points(lon, lat, filename, scaling_factor, memory_budget,
+                         cache, pixel_index, tile_index_dir, interpolation):
+    """
+    Get data at lat lon points from one file, or set of raster tiles.
+
+    See `files_raster_data_at_points` for the parameters.
+
+    :returns: values, extent
+      values: A 1D array of the value at each point.
+      extent: min_long, min_lat, max_long, max_lat of the raster.
+    """
+    if is_mosaic(filename):
+        a_raster = Mosaic.from_tiles(filename, tile_index_dir)
+        values = a_raster.raster_data_at_points(
+            lon, lat, scaling_factor, memory_budget, cache, interpolation)
+    else:
+        if cache is None:
+            a_raster = Raster.from_file(filename)
+        else:
+            a_raster = cache.raster(filename)
+        values = a_raster.raster_data_at_points(
+            lon, lat, scaling_factor, memory_budget,
+            pixel_index=pixel_index(a_raster), interpolation=interpolation)
+    return values, a_raster.extent()
+
+
+def _files_data_in_processes(lon, lat, files, scaling_factor,
+                             memory_budget, cache, pixel_index_dir,
+                             tile_index_dir, interpolation, workers):
+    """
+    Sample a list of files in a pool of processes. The points, and the
+    (hazards, sites) array of results, are in shared memory so they are
+    not copied to and from each process.
+
+    See `files_raster_data_at_points` for the parameters.
+
+    :returns: data, extents
+      data: A (hazards, sites) array of the values.
+      extents: A list of the extent of each file.
+    """
+    n_sites = numpy.asarray(lon).shape[0]
+    shapes = {'lon': (n_sites,), 'lat': (n_sites,),
+              'data': (len(files), n_sites)}
+    memories = {}
+    try:
+        for name, shape in shapes.items():
+            size = int(numpy.prod(shape)) * numpy.dtype(float).itemsize
+            memories[name] = shared_memory.SharedMemory(create=True,
+                                                        size=max(size, 1))
+        arrays = {name: numpy.ndarray(shape, float,
+                                      buffer=memories[name].buf)
+                  for name, shape in shapes.items()}
+        arrays['lon'][:] = lon
+        arrays['lat'][:] = lat
+        arrays['data'][:] = numpy.nan
+
+        LOGGER.info(f"Sampling {len(files)} files with {workers} processes")
+        names = {name: memory.name for name, memory in memories.items()}
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_sampling_worker,
+                initargs=(names, shapes, pixel_index_dir)) as executor:
+            extents = list(executor.map(
+                _sample_file_in_worker, range(len(files)), files,
+                [(scaling_factor, memory_budget, cache, tile_index_dir,
+                  interpolation)] * len(files)))
+        data = arrays['data'].copy()
+        del arrays
+    finally:
+        for memory in memories.values():
+            memory.close()
+            memory.unlink()
+    return data, extents
+
+
+def _init_sampling_worker(names, shapes, pixel_index_dir):
+    """
+    Attach a sampling worker process to the shared arrays.
+
+    :param names: A dictionary of the shared memory name of each array.
+    :param shapes: A dictionary of the shape of each array.
+    :param pixel_index_dir: An optional directory of saved pixel indexes.
+    """
+    for name, shape in shapes.items():
+        memory = shared_memory.SharedMemory(name=names[name])
+        _WORKER[name + '_memory'] = memory
+        _WORKER[name] = numpy.ndarray(shape, float, buffer=memory.buf)
+    _WORKER['pixel_index'] = PixelIndex(_WORKER['lon'], _WORKER['lat'],
+                                        pixel_index_dir)
+
+
+def _sample_file_in_worker(index, filename, options):
+    """
+    Sample one file in a worker process, writing the values into the
+    shared results array.
+
+    :param index: The index of the file in the list of files.
+    :param filename: The file to sample.
+    :param options: scaling_factor, memory_budget, cache, tile_index_dir
+        and interpolation. See `files_raster_data_at_points`.
+    :returns: The extent of the file.
+    """
+    scaling_factor, memory_budget, cache, tile_index_dir, interpolation = \
+        options
+    values, extent = _file_data_at_points(
+        _WORKER['lon'], _WORKER['lat'], filename, scaling_factor,
+        memory_budget, cache, _WORKER['pixel_index'], tile_index_dir,
+        interpolation)
+    _WORKER['data'][index] = values
+    return extent
+
+
 def recalc_max(max_extent, extent):
     """
     Given an extent and a maximum extent modify maximum extent so
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Counter based random numbers, keyed by asset.
+
+The random numbers of an asset are the Philox4x32-10 block cipher
+(Salmon et al., 2011) of a counter holding the asset id and the draw
+number, under a key made from the root seed and the job name. Each draw
+only depends on the seed, the job and the asset, so the draws of an asset
+are the same however the exposure is split between processes or chunks,
+and whatever jobs are run before it.
+"""
+
+import hashlib
+
+import numpy
+from scipy.special import ndtri
+
+# The Philox4x32 multipliers and Weyl key increments
+PHILOX_M0 = numpy.uint64(0xD2511F53)
+PHILOX_M1 = numpy.uint64(0xCD9E8D57)
+PHILOX_W0 = 0x9E3779B9
+PHILOX_W1 = 0xBB67AE85
+PHILOX_ROUNDS = 10
+
+MASK32 = numpy.uint64(0xFFFFFFFF)
+SHIFT32 = numpy.uint64(32)
+
+
+def philox4x32(counter, key, rounds=PHILOX_ROUNDS):
+    """
+    The Philox4x32 block cipher of an array of counters.
+
+    :param counter: An array of 128 bit counters, as four 32 bit words.
+        Dimensions (..., 4)
+    :param key: The 64 bit key, as two 32 bit words.
+    :param rounds: The number of rounds.
+    :returns: A uint32 array of four random words per counter, the same
+        shape as ``counter``.
+    """
+    counter = numpy.asarray(counter, dtype=numpy.uint64)
+    words = [counter[..., i] for i in range(4)]
+    key0, key1 = (int(word) for word in key)
+    for round_ in range(rounds):
+        if round_ > 0:
+            key0 = (key0 + PHILOX_W0) & 0xFFFFFFFF
+            key1 = (key1 + PHILOX_W1) & 0xFFFFFFFF
+        product0 = PHILOX_M0 * words[0]
+        product1 = PHILOX_M1 * words[2]
+        words = [(product1 >> SHIFT32) ^ words[1] ^ numpy.uint64(key0),
+                 product1 & MASK32,
+                 (product0 >> SHIFT32) ^ words[3] ^ numpy.uint64(key1),
+                 product0 & MASK32]
+    return numpy.stack(words, axis=-1).astype(numpy.uint32)
+
+
+def stream_key(seed, job_name):
+    """
+    The Philox key of the random numbers of a job.
+
+    :param seed: The root seed, an integer.
+    :param job_name: The name of the job drawing the random numbers.
+    :returns: The key, as two 32 bit words.
+    """
+    digest = hashlib.sha256(f'{int(seed)}:{job_name}'.encode()).digest()
+    return numpy.frombuffer(digest[:8], dtype='<u4').copy()
+
+
+def job_seed(seed, job_name):
+    """
+    An integer seed for a job, for generators that are not keyed by
+    asset, e.g. to seed a `numpy.random.SeedSequence`.
+
+    :param seed: The root seed, an integer.
+    :param job_name: The name of the job.
+    :returns: A non-negative integer below 2**64.
+    """
+    low, high = stream_key(seed, job_name).astype(numpy.uint64)
+    return int(low) | (int(high) << 32)
+
+
+class AssetStream(object):
+
+    """
+    The random numbers of a job, for each asset.
+    """
+
+    def __init__(self, seed, job_name, asset_ids):
+        """
+        :param seed: The root seed, an integer.
+        :param job_name: The name of the job drawing the random numbers.
+            Jobs with different names have independent streams.
+        :param asset_ids: A 1D array of the non-negative integer id of each
+            asset, e.g. the :data:`misc.INTID` attribute.
+        """
+        self.key = stream_key(seed, job_name)
+        self.asset_ids = numpy.asarray(asset_ids).astype(numpy.uint64)
+
+    def uniform(self, draws=1, part=slice(None)):
+        """
+        Uniform random numbers in the open interval (0, 1).
+
+        :param draws: The number of draws of each asset.
+        :param part: An optional slice or index of the assets to draw for.
+        :returns: The draws. Dimensions (asset, draw)
+        """
+        ids = self.asset_ids[part]
+        # Each counter gives two draws of 52 random bits
+        blocks = -(-draws // 2)
+        counter = numpy.zeros((ids.shape[0], blocks, 4), dtype=numpy.uint64)
+        counter[..., 0] = (ids & MASK32)[:, None]
+        counter[..., 1] = (ids >> SHIFT32)[:, None]
+        counter[..., 2] = numpy.arange(blocks, dtype=numpy.uint64)
+        words = philox4x32(counter, self.key).astype(numpy.uint64)
+        high = (words[..., 0::2] >> numpy.uint64(6)).astype(float)
+        low = (words[..., 1::2] >> numpy.uint64(6)).astype(float)
+        # Centre the 52 bit integers in their interval, to avoid 0 and 1
+        bits = high * 2. ** 26 + low + 0.5
+        return (bits / 2. ** 52).reshape((ids.shape[0], -1))[:, :draws]
+
+    def normal(self, draws=1, part=slice(None)):
+        """
+        Standard normal random numbers, from the inverse normal CDF of
+        uniform draws.
+
+        :param draws: The number of draws of each asset.
+        :param part: An optional slice or index of the assets to draw for.
+        :returns: The draws. Dimensions (asset, draw)
+        """
+        return ndtri(self.uniform(draws, part))
@@ -15,6 +15,7 @@ SURGENC = 'surge_nc'
 REP_VAL_NAME = 'replacement_value_label'
 
 TEMPLATE = 'template'
+RANDOMSEED = 'random_seed'
 SAVE = 'save'
 SAVEAGG = 'save_agg'
 LOADWINDTCRM = 'load_wind'
@@ -25,6 +26,11 @@ PERMUTATION = 'exposure_permutation'
 VULNFILE = 'vulnerability'
 VULNSET = 'vulnerability_set'
 VULNMETHOD = 'vulnerability_method'
+VULNLUT = 'lut_resolution'
+VULNCACHE = 'cache_dir'
+VULNREALISATIONS = 'realisations'
+VULNQUANTILES = 'quantiles'
+VULNMEMORY = 'memory_budget'
 AGGREGATION = 'aggregation'
 AGGREGATE = 'aggregate'
 TABULATE = 'tabulate'
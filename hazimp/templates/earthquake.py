@@ -2,15 +2,19 @@ import logging
 import os
 
 from hazimp import misc
-from hazimp.config_build import find_attributes, add_job
+from hazimp.config_build import (find_attributes, add_job,
+                                 add_job_options, add_optional_job)
 from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LOADRASTER,
+                              REORDER_EXPOSURE, FRAGILITY,
                               LOADXMLVULNERABILITY,
                               SIMPLELINKER, SELECTVULNFUNCTION,
                               PERMUTATE_EXPOSURE, LOOKUP, MDMULT,
                               AGGREGATE_LOSS, CATEGORISE, SAVEALL,
                               SAVEPROVENANCE)
 from hazimp.templates.constants import (HAZARDRASTER, VULNFILE,
-                                        VULNSET, VULNMETHOD,
+                                        VULNSET, VULNMETHOD, VULNLUT,
+                                        VULNCACHE, VULNREALISATIONS,
+                                        VULNQUANTILES, VULNMEMORY,
                                         PERMUTATION, CALCSTRUCTLOSS,
                                         REP_VAL_NAME,
                                         AGGREGATION, SAVEAGG, SAVE, AGGREGATE,
@@ -31,6 +35,8 @@ def _earthquake_v1_reader(config: dict) -> list:
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
     atts = find_attributes(config, HAZARDRASTER)
     atts.setdefault('attribute_label', 'MMI')
 
@@ -38,7 +44,9 @@ def _earthquake_v1_reader(config: dict) -> list:
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
 
     # The column title in the exposure file = 'EQ_VULNERABILITY_FUNCTION_ID'
     vulnerability_set_id = vuln_atts[VULNSET]
@@ -55,13 +63,15 @@ def _earthquake_v1_reader(config: dict) -> list:
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
 
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
     if PERMUTATION in config:
         atts = find_attributes(config, PERMUTATION)
         add_job(job_insts, PERMUTATE_EXPOSURE, atts)
     else:
-        add_job(job_insts, LOOKUP)
+        atts = add_job_options(vuln_atts, {}, [VULNQUANTILES, VULNMEMORY])
+        add_job(job_insts, LOOKUP, atts)
 
     if CALCSTRUCTLOSS in config:
         atts_dict = find_attributes(config, CALCSTRUCTLOSS)
@@ -73,6 +83,8 @@ def _earthquake_v1_reader(config: dict) -> list:
                       'var_out': 'structural_loss'}
         add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     if AGGREGATION in config:
         attributes = find_attributes(config, AGGREGATION)
         add_job(job_insts, AGGREGATE_LOSS, attributes)
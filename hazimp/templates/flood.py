@@ -4,8 +4,10 @@ import os
 from hazimp import misc
 from hazimp.calcs.calcs import (WATER_DEPTH, FLOOR_HEIGHT,
                                 FLOOR_HEIGHT_CALC)
-from hazimp.config_build import find_attributes, add_job
+from hazimp.config_build import (find_attributes, raster_attributes,
+                                 add_job, add_job_options, add_optional_job)
 from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LOADRASTER,
+                              REORDER_EXPOSURE, FRAGILITY,
                               LOADXMLVULNERABILITY,
                               CONSTANT, SIMPLELINKER,
                               SELECTVULNFUNCTION,
@@ -15,7 +17,9 @@ from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LOADRASTER,
                               SAVEALL, SAVEPROVENANCE)
 from hazimp.templates.constants import (HAZARDRASTER,
                                         CALCSTRUCTLOSS, CALCCONTLOSS,
-                                        VULNSET, VULNFILE, VULNMETHOD,
+                                        VULNSET, VULNFILE, VULNMETHOD, VULNLUT,
+                                        VULNCACHE, VULNREALISATIONS,
+                                        VULNQUANTILES, VULNMEMORY,
                                         REP_VAL_NAME, PERMUTATION,
                                         AGGREGATION, AGGREGATE,
                                         SAVE, SAVEAGG
@@ -63,6 +67,8 @@ def _flood_impact_reader(config: dict) -> list:
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
     atts = find_attributes(config, [HAZARDRASTER])
     atts.setdefault('attribute_label', WATER_DEPTH)
 
@@ -70,7 +76,9 @@ def _flood_impact_reader(config: dict) -> list:
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
 
     # The column title in the exposure file = 'FLOOD_VULNERABILITY_FUNCTION_ID'
     vulnerability_set_id = vuln_atts[VULNSET]
@@ -89,13 +97,15 @@ def _flood_impact_reader(config: dict) -> list:
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
 
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
     if PERMUTATION in config:
         atts = find_attributes(config, PERMUTATION)
         add_job(job_insts, PERMUTATE_EXPOSURE, atts)
     else:
-        add_job(job_insts, LOOKUP)
+        atts = add_job_options(vuln_atts, {}, [VULNQUANTILES, VULNMEMORY])
+        add_job(job_insts, LOOKUP, atts)
 
     if CALCSTRUCTLOSS in config:
         atts_dict = find_attributes(config, CALCSTRUCTLOSS)
@@ -107,6 +117,8 @@ def _flood_impact_reader(config: dict) -> list:
                       'var_out': 'structural_loss'}
         add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     if AGGREGATION in config:
         attributes = find_attributes(config, AGGREGATION)
         add_job(job_insts, AGGREGATE_LOSS, attributes)
@@ -157,13 +169,17 @@ def _flood_fabric_v2_reader(config: dict) -> list:
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
-    file_list = find_attributes(config, HAZARDRASTER)
-    atts = {'file_list': file_list, 'attribute_label': WATER_DEPTH}
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
+    atts = raster_attributes(config, HAZARDRASTER)
+    atts['attribute_label'] = WATER_DEPTH
     add_job(job_insts, LOADRASTER, atts)
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
     # The column title in the exposure file = 'FLOOD_VULNERABILITY_FUNCTION_ID'
     vulnerability_set_id = vuln_atts[VULNSET]
 
@@ -188,9 +204,11 @@ def _flood_fabric_v2_reader(config: dict) -> list:
     else:
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
-    add_job(job_insts, LOOKUP)
+    atts = add_job_options(vuln_atts, {}, [VULNQUANTILES, VULNMEMORY])
+    add_job(job_insts, LOOKUP, atts)
 
     atts_dict = find_attributes(config, CALCSTRUCTLOSS)
     if REP_VAL_NAME not in atts_dict:
@@ -201,6 +219,8 @@ def _flood_fabric_v2_reader(config: dict) -> list:
         'var_out': 'structural_loss'}
     add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     file_name = find_attributes(config, SAVE)
     add_job(job_insts, SAVEALL, {'file_name': file_name})
 
@@ -229,13 +249,17 @@ def _flood_contents_v2_reader(config: dict) -> list:  # pylint: disable=R0915
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
-    file_list = find_attributes(config, HAZARDRASTER)
-    atts = {'file_list': file_list, 'attribute_label': WATER_DEPTH}
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
+    atts = raster_attributes(config, HAZARDRASTER)
+    atts['attribute_label'] = WATER_DEPTH
     add_job(job_insts, LOADRASTER, atts)
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
 
     floor_height_value = find_attributes(config, FLOOR_HEIGHT)
     atts = {'var': FLOOR_HEIGHT, 'value': floor_height_value}
@@ -301,9 +325,11 @@ def _flood_contents_v2_reader(config: dict) -> list:  # pylint: disable=R0915
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
 
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
-    add_job(job_insts, LOOKUP)
+    atts = add_job_options(vuln_atts, {}, [VULNQUANTILES, VULNMEMORY])
+    add_job(job_insts, LOOKUP, atts)
 
     atts_dict = find_attributes(config, CALCCONTLOSS)
     if REP_VAL_NAME not in atts_dict:
@@ -314,6 +340,8 @@ def _flood_contents_v2_reader(config: dict) -> list:  # pylint: disable=R0915
         'var_out': 'contents_loss'}
     add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     file_name = find_attributes(config, SAVE)
     add_job(job_insts, SAVEALL, {'file_name': file_name})
 
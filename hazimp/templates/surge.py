@@ -2,10 +2,12 @@ import logging
 import os
 
 from hazimp import misc
-from hazimp.config_build import find_attributes, add_job
+from hazimp.config_build import (find_attributes, add_job,
+                                 add_job_options, add_optional_job)
 from hazimp.calcs.calcs import (WATER_DEPTH, FLOOR_HEIGHT,
                                 FLOOR_HEIGHT_CALC)
 from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LOADRASTER,
+                              REORDER_EXPOSURE, FRAGILITY,
                               LOADXMLVULNERABILITY,
                               SIMPLELINKER, SELECTVULNFUNCTION,
                               LOOKUP, MDMULT, SAVEALL, SAVEPROVENANCE,
@@ -13,7 +15,9 @@ from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LOADRASTER,
                               AGGREGATE_LOSS, CATEGORISE)
 from hazimp.templates.constants import (HAZARDRASTER, VULNSET,
                                         CALCSTRUCTLOSS, REP_VAL_NAME, SAVE,
-                                        VULNFILE, VULNMETHOD,
+                                        VULNFILE, VULNMETHOD, VULNLUT,
+                                        VULNCACHE, VULNREALISATIONS,
+                                        VULNQUANTILES, VULNMEMORY,
                                         PERMUTATION, AGGREGATION, SAVEAGG,
                                         AGGREGATE)
 
@@ -32,6 +36,8 @@ def _surge_nc_reader(config: dict) -> list:
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
     atts = find_attributes(config, [HAZARDRASTER])
 
     # Hard-coded at this time for wind
@@ -40,7 +46,9 @@ def _surge_nc_reader(config: dict) -> list:
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
 
     # The column title in the exposure file = 'SURGE_VULNERABILITY_FUNCTION_ID'
     vulnerability_set_id = vuln_atts[VULNSET]
@@ -59,13 +67,15 @@ def _surge_nc_reader(config: dict) -> list:
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
 
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
     if PERMUTATION in config:
         atts = find_attributes(config, PERMUTATION)
         add_job(job_insts, PERMUTATE_EXPOSURE, atts)
     else:
-        add_job(job_insts, LOOKUP)
+        atts = add_job_options(vuln_atts, {}, [VULNQUANTILES, VULNMEMORY])
+        add_job(job_insts, LOOKUP, atts)
 
     if CALCSTRUCTLOSS in config:
         atts_dict = find_attributes(config, CALCSTRUCTLOSS)
@@ -77,6 +87,8 @@ def _surge_nc_reader(config: dict) -> list:
                       'var_out': 'structural_loss'}
         add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     if AGGREGATION in config:
         attributes = find_attributes(config, AGGREGATION)
         add_job(job_insts, AGGREGATE_LOSS, attributes)
@@ -2,8 +2,10 @@ import logging
 import os
 
 from hazimp import misc
-from hazimp.config_build import find_attributes, add_job
+from hazimp.config_build import (find_attributes, raster_attributes,
+                                 add_job, add_job_options, add_optional_job)
 from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LOADRASTER,
+                              REORDER_EXPOSURE, FRAGILITY,
                               LOADXMLVULNERABILITY,
                               SIMPLELINKER, SELECTVULNFUNCTION,
                               LOOKUP, MDMULT, SAVEALL, SAVEPROVENANCE,
@@ -11,7 +13,9 @@ from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LOADRASTER,
                               AGGREGATE_LOSS, CATEGORISE)
 from hazimp.templates.constants import (HAZARDRASTER, LOADWINDTCRM, VULNSET,
                                         CALCSTRUCTLOSS, REP_VAL_NAME, SAVE,
-                                        VULNFILE, VULNMETHOD,
+                                        VULNFILE, VULNMETHOD, VULNLUT,
+                                        VULNCACHE, VULNREALISATIONS,
+                                        VULNQUANTILES, VULNMEMORY,
                                         PERMUTATION, AGGREGATION, SAVEAGG,
                                         AGGREGATE)
 
@@ -30,15 +34,18 @@ def _wind_v4_reader(config: dict) -> list:
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
-    file_list = find_attributes(config, [HAZARDRASTER, LOADWINDTCRM])
-    atts = {'file_list': file_list,
-            'attribute_label': '0.2s gust at 10m height m/s'}
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
+    atts = raster_attributes(config, [HAZARDRASTER, LOADWINDTCRM])
+    atts['attribute_label'] = '0.2s gust at 10m height m/s'
     add_job(job_insts, LOADRASTER, atts)
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
 
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
 
     # The vulnerabilitySetID from the nrml file = 'domestic_flood_2012'
     # The column title in the exposure file = 'WIND_VULNERABILITY_FUNCTION_ID'
@@ -55,9 +62,11 @@ def _wind_v4_reader(config: dict) -> list:
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
 
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
-    add_job(job_insts, LOOKUP)
+    atts = add_job_options(vuln_atts, {}, [VULNQUANTILES, VULNMEMORY])
+    add_job(job_insts, LOOKUP, atts)
 
     atts_dict = find_attributes(config, CALCSTRUCTLOSS)
     if REP_VAL_NAME not in atts_dict:
@@ -69,6 +78,8 @@ def _wind_v4_reader(config: dict) -> list:
         'var_out': 'structural_loss'}
     add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     file_name = find_attributes(config, SAVE)
     add_job(job_insts, SAVEALL, {'file_name': file_name})
 
@@ -93,14 +104,17 @@ def _wind_v5_reader(config: dict) -> list:
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
-    file_list = find_attributes(config, [HAZARDRASTER, LOADWINDTCRM])
-    atts = {'file_list': file_list,
-            'attribute_label': '0.2s gust at 10m height m/s'}
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
+    atts = raster_attributes(config, [HAZARDRASTER, LOADWINDTCRM])
+    atts['attribute_label'] = '0.2s gust at 10m height m/s'
     add_job(job_insts, LOADRASTER, atts)
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
 
     # The column title in the exposure file = 'WIND_VULNERABILITY_FUNCTION_ID'
     vulnerability_set_id = vuln_atts[VULNSET]
@@ -116,6 +130,7 @@ def _wind_v5_reader(config: dict) -> list:
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
 
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
     atts = find_attributes(config, PERMUTATION)
@@ -130,6 +145,8 @@ def _wind_v5_reader(config: dict) -> list:
         'var_out': 'structural_loss'}
     add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     attributes = find_attributes(config, AGGREGATION)
     add_job(job_insts, AGGREGATE_LOSS, attributes)
 
@@ -169,6 +186,8 @@ def _wind_nc_reader(config: dict) -> list:
     atts = find_attributes(config, LOADCSVEXPOSURE)
     add_job(job_insts, LOADCSVEXPOSURE, atts)
 
+    add_optional_job(job_insts, config, REORDER_EXPOSURE)
+
     atts = find_attributes(config, [HAZARDRASTER, LOADWINDTCRM])
 
     # Hard-coded at this time for wind
@@ -177,7 +196,9 @@ def _wind_nc_reader(config: dict) -> list:
 
     vuln_atts = find_attributes(config, VULNFILE)
     vul_filename = os.path.join(misc.RESOURCE_DIR, vuln_atts['filename'])
-    add_job(job_insts, LOADXMLVULNERABILITY, {'file_name': vul_filename})
+    atts = {'file_name': vul_filename}
+    add_job_options(vuln_atts, atts, [VULNLUT, VULNCACHE])
+    add_job(job_insts, LOADXMLVULNERABILITY, atts)
 
     # The column title in the exposure file = 'WIND_VULNERABILITY_FUNCTION_ID'
     vulnerability_set_id = vuln_atts[VULNSET]
@@ -194,13 +215,15 @@ def _wind_nc_reader(config: dict) -> list:
         atts = {'variability_method': {
             vulnerability_set_id: 'mean'}}
 
+    add_job_options(vuln_atts, atts, [VULNREALISATIONS])
     add_job(job_insts, SELECTVULNFUNCTION, atts)
 
     if PERMUTATION in config:
         atts = find_attributes(config, PERMUTATION)
         add_job(job_insts, PERMUTATE_EXPOSURE, atts)
     else:
-        add_job(job_insts, LOOKUP)
+        atts = add_job_options(vuln_atts, {}, [VULNQUANTILES, VULNMEMORY])
+        add_job(job_insts, LOOKUP, atts)
 
     if CALCSTRUCTLOSS in config:
         atts_dict = find_attributes(config, CALCSTRUCTLOSS)
@@ -212,6 +235,8 @@ def _wind_nc_reader(config: dict) -> list:
                       'var_out': 'structural_loss'}
         add_job(job_insts, MDMULT, attributes)
 
+    add_optional_job(job_insts, config, FRAGILITY)
+
     if AGGREGATION in config:
         attributes = find_attributes(config, AGGREGATION)
         add_job(job_insts, AGGREGATE_LOSS, attributes)
@@ -25,15 +25,21 @@ LOGGER = logging.getLogger(__name__)
 NRML_SCHEMA = str(Path(__file__).parent / '../schema/openquake/nrml.xsd')
 
 
+# The compiled schemas, so each is only compiled once per process
+_SCHEMAS = {}
+
+
 class Validator:
     """
     XML file validator using XSD schema
     """
 
     def __init__(self, xsd_file: str):
-        self.schema = etree.XMLSchema(
-            etree.parse(xsd_file)
-        )
+        if xsd_file not in _SCHEMAS:
+            _SCHEMAS[xsd_file] = etree.XMLSchema(
+                etree.parse(xsd_file)
+            )
+        self.schema = _SCHEMAS[xsd_file]
 
     def validate(self, xml_filename: str):
         """
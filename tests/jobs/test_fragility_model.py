@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Test the fragility model module.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy
+from numpy import asarray, allclose
+from scipy.stats import lognorm
+
+from hazimp.jobs.fragility_model import (fragility_set_from_xml_file,
+                                         lognormal_params, expected_counts,
+                                         FragilitySet)
+
+
+def build_fragility_example():
+    """Build an example fragility xml file.
+
+    If you call this remember to delete the file;  os.remove(filename).
+
+    Returns:
+        The name of the file
+    """
+    str1 = """<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.5"
+      xmlns:gml="http://www.opengis.net/gml">
+    <fragilityModel format="continuous">
+        <description>Test fragility model</description>
+        <limitStates>slight moderate complete</limitStates>
+        <ffs noDamageLimit="5.0">
+            <taxonomy>W1</taxonomy>
+            <IML imt="MMI">5.0 10.0</IML>
+            <ffc ls="slight"><params mean="6.5" stddev="0.65"/></ffc>
+            <ffc ls="moderate"><params mean="7.5" stddev="0.75"/></ffc>
+            <ffc ls="complete"><params mean="9.0" stddev="0.9"/></ffc>
+        </ffs>
+        <ffs>
+            <taxonomy>URM</taxonomy>
+            <IML imt="MMI">5.0 10.0</IML>
+            <ffc ls="slight"><params mean="6.0" stddev="1.2"/></ffc>
+            <ffc ls="moderate"><params mean="7.0" stddev="1.4"/></ffc>
+            <ffc ls="complete"><params mean="8.0" stddev="1.6"/></ffc>
+        </ffs>
+    </fragilityModel>
+</nrml>"""
+
+    f = tempfile.NamedTemporaryFile(suffix='.xml',
+                                    prefix='test_fragility_model',
+                                    delete=False,
+                                    mode='w+t')
+    f.write(str1)
+    f.close()
+    return f.name
+
+
+class TestFragilityModel(unittest.TestCase):
+
+    def test_lognormal_params(self):
+        median, beta = lognormal_params(7.5, 0.75)
+        dist = lognorm(beta, scale=median)
+        self.assertTrue(allclose([dist.mean(), dist.std()], [7.5, 0.75]))
+
+    def test_from_xml(self):
+        filename = build_fragility_example()
+        fragility_set = fragility_set_from_xml_file(filename)
+        os.remove(filename)
+
+        self.assertEqual(fragility_set.intensity_measure_type, 'MMI')
+        self.assertEqual(fragility_set.damage_states,
+                         ['none', 'slight', 'moderate', 'complete'])
+        self.assertEqual(fragility_set.taxonomies, ['W1', 'URM'])
+        self.assertTrue(allclose(fragility_set.no_damage_limit, [5., 0.]))
+        median, beta = lognormal_params(8.0, 1.6)
+        self.assertTrue(allclose([fragility_set.median[1, 2],
+                                  fragility_set.beta[1, 2]], [median, beta]))
+
+    def test_damage_state_probabilities(self):
+        filename = build_fragility_example()
+        fragility_set = fragility_set_from_xml_file(filename)
+        os.remove(filename)
+
+        taxonomy = asarray(['W1', 'URM', 'W1', 'URM', 'W1'])
+        intensity = asarray([7.2, 7.2, 4.0, numpy.nan, 0.])
+        probs = fragility_set.damage_state_probabilities(taxonomy,
+                                                         intensity)
+        self.assertEqual(probs.shape, (5, 4))
+        self.assertTrue(allclose(probs.sum(axis=1), 1.))
+        self.assertTrue(numpy.all(probs >= 0.))
+
+        for asset in range(2):
+            row = fragility_set.taxonomies.index(taxonomy[asset])
+            exceed = [lognorm(fragility_set.beta[row, col],
+                              scale=fragility_set.median[row, col]).cdf(
+                                  intensity[asset]) for col in range(3)]
+            actual = -numpy.diff([1.] + exceed + [0.])
+            self.assertTrue(allclose(probs[asset], actual))
+
+        # Below the no damage limit, with no intensity, or at zero
+        self.assertTrue(allclose(probs[2:], [[1., 0., 0., 0.]] * 3))
+
+        with self.assertRaises(NotImplementedError):
+            fragility_set.damage_state_probabilities(['W1', 'S2'], [7, 7])
+
+    def test_crossing_functions(self):
+        # The complete state is more likely than moderate at high intensity
+        fragility_set = FragilitySet('MMI', ['moderate', 'complete'], ['C1'],
+                                     [[8., 8.5]], [[0.1, 0.4]])
+        probs = fragility_set.damage_state_probabilities(['C1'], [10.])
+        self.assertTrue(numpy.all(probs >= 0.))
+        self.assertTrue(allclose(probs.sum(), 1.))
+
+    def test_expected_counts(self):
+        probs = asarray([[0.5, 0.5], [0.2, 0.8], [1., 0.], [0.1, 0.9]])
+        counts = expected_counts(['A', 'B', 'A', None], probs,
+                                 ['none', 'slight'], 'REGION')
+        self.assertEqual(list(counts['REGION']), ['A', 'B'])
+        self.assertTrue(allclose(counts['none_count'], [1.5, 0.2]))
+        self.assertTrue(allclose(counts['slight_count'], [0.5, 0.8]))
+
+
+if __name__ == "__main__":
+    SUITE = unittest.makeSuite(TestFragilityModel, 'test')
+    RUNNER = unittest.TextTestRunner()
+    RUNNER.run(SUITE)
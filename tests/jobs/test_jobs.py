@@ -35,6 +35,7 @@ import tempfile
 import os
 
 import numpy
+import pandas
 
 from numpy import allclose, asarray, isnan, array, rollaxis
 
@@ -43,11 +44,14 @@ from hazimp.jobs.jobs import (JOBS, LOADRASTER, LOADCSVEXPOSURE,
                               SAVEALL, CONSTANT, ADD, RANDOM_CONSTANT,
                               MULT, MDMULT, AGGREGATE)
 from hazimp.jobs import jobs
+from hazimp.jobs.vulnerability_model import RealisedVulnerabilityCurves, \
+    interp_curves, interp_weights, vuln_sets_from_xml_file
 from hazimp import context
 from hazimp import misc
 from hazimp import parallel
 from tests import CWD
 from tests.jobs.test_vulnerability_model import build_example1
+from tests.jobs.test_fragility_model import build_fragility_example
 
 prov = mock.MagicMock(name='prov.model')
 
@@ -85,7 +89,8 @@ class DummyVulnSet(object):
         self.vuln_set = vuln_set
 
     def build_realised_vuln_curves(self, vuln_function_ids,
-                                   variability_method):
+                                   variability_method, realisations=None,
+                                   stream=None):
         """For test_SimpleLinker
         """
 
@@ -159,6 +164,35 @@ class TestJobs(unittest.TestCase):
         self.assertEqual(con_in.exposure_att['test'].tolist(),
                          actual)
 
+    def test_random_seed(self):
+        filename = build_example1()
+        vuln_sets = vuln_sets_from_xml_file([filename])
+        os.remove(filename)
+        ids = numpy.array(['IR', 'PK'] * 5)
+
+        def run(assets):
+            con_in = Dummy(site_shape=(len(assets),))
+            con_in.exposure_att = {misc.INTID: assets, 'ID': ids[assets]}
+            con_in.vulnerability_sets = vuln_sets
+            con_in.vul_function_titles = {'PAGER': 'ID'}
+            JOBS[jobs.RANDOM_SEED](con_in, seed=7)
+            JOBS[RANDOM_CONSTANT](con_in, var='test',
+                                  values={1: 0.2, 2: 0.5, 3: 0.3})
+            JOBS[jobs.SELECTVULNFUNCTION](
+                con_in, variability_method={'PAGER': 'normal'})
+            return (con_in.exposure_att['test'],
+                    con_in.exposure_vuln_curves['PAGER'].loss_per_asset)
+
+        # Any split of the assets gives the same draws
+        whole = run(numpy.arange(10))
+        for assets in [numpy.arange(4), numpy.arange(9, 2, -1)]:
+            part = run(assets)
+            for actual, expected in zip(part, whole):
+                numpy.testing.assert_array_equal(actual, expected[assets])
+
+        with self.assertRaises(RuntimeError):
+            JOBS[jobs.RANDOM_SEED](Dummy(), seed=-1)
+
     def test_rand_const2(self):
         inst = JOBS[RANDOM_CONSTANT]
         con_in = Dummy(site_shape=(5,))
@@ -584,9 +618,205 @@ class TestJobs(unittest.TestCase):
         msg += "\n Expected " + str(expected)
         self.assertTrue(len(con_in.exposure_att['ID']) == expected, msg)
 
+    @mock.patch('prov.model.ProvDocument.used')
+    def test_load_raster_colocated(self, mock_used):
+        # Write a file to test
+        f = tempfile.NamedTemporaryFile(
+            suffix='.txt', prefix='HAZIMPtest_jobs',
+            delete=False,
+            mode='w+t')
+        f.write('exposure_latitude, exposure_longitude, ID, haz_actual\n')
+        f.write('8.1, 0.1, 1, 4\n')
+        f.write('8.9, 2.9, 2, 6\n')
+        f.write('8.1, 0.1, 3, 4\n')
+        f.write('7.9, 1.5, 4, nan\n')  # Out of Haz area
+        f.write('8.1, 0.1, 5, 4\n')
+        f.close()
+
+        inst = JOBS[LOADCSVEXPOSURE]
+        con_in = context.Context()
+        con_in.exposure_lat = None
+        con_in.exposure_long = None
+        con_in.exposure_att = {}
+        test_kwargs = {'file_name': f.name, 'use_parallel': False}
+        inst(con_in, **test_kwargs)
+        os.remove(f.name)
+
+        haz_v = 'haz_v'
+        inst = JOBS[LOADRASTER]
+        test_kwargs = {'attribute_label': haz_v,
+                       'file_list': [str(CWD / 'data/basic_raster.aai')]}
+        with mock.patch('hazimp.raster.files_raster_data_at_points',
+                        wraps=jobs.raster_module.files_raster_data_at_points
+                        ) as mocked:
+            inst(con_in, **test_kwargs)
+            # Only the three unique locations are sampled
+            self.assertEqual(mocked.call_args[0][0].shape, (3,))
+
+        numpy.testing.assert_array_equal(
+            con_in.exposure_att[haz_v].values,
+            con_in.exposure_att['haz_actual'].values)
+
+    @mock.patch('hazimp.raster.configure_remote_reads')
+    @mock.patch('hazimp.raster.files_raster_data_at_points')
+    @mock.patch('hazimp.misc.get_file_mtime')
+    @mock.patch('hazimp.misc.download_file_from_s3_if_needed')
+    def test_load_raster_remote(self, mock_download, mock_mtime,
+                                mock_sample, mock_configure):
+        con_in = Dummy()
+        con_in.exposure_lat = array([8.5, 9.5])
+        con_in.exposure_long = array([0.5, 0.5])
+        mock_mtime.return_value = '2024-01-01 00:00:00 UTC'
+        mock_sample.return_value = (array([4., 1.]), [0., 8., 3., 10.])
+
+        inst = JOBS[LOADRASTER]
+        inst(con_in, attribute_label='haz_v',
+             file_list='/vsis3/bucket/hazard.tif', tile_cache_size=16)
+
+        # The raster is sampled in place, not downloaded
+        mock_download.assert_not_called()
+        mock_mtime.assert_called_once_with('/vsis3/bucket/hazard.tif')
+        mock_configure.assert_called_once_with(16)
+        self.assertEqual(mock_sample.call_args[0][2],
+                         ['/vsis3/bucket/hazard.tif'])
+        numpy.testing.assert_array_equal(con_in.exposure_att['haz_v'],
+                                         [4., 1.])
+
     def test_look_up(self):
-        pass
-        # FIXME Needs test.
+        levels = asarray([10., 20., 30.])
+        curves = {'structural': asarray([[0.0, 0.5, 1.0], [0.0, 0.2, 0.4]]),
+                  'contents': asarray([[0.0, 0.1, 0.9], [0.1, 0.6, 0.7]]),
+                  'other': asarray([[0.0, 0.3, 0.6], [0.0, 0.2, 0.8]])}
+        curve_index = asarray([0, 1, 1, 0])
+        con_in = Dummy()
+        con_in.exposure_att = {'gust': asarray([5., 15., 27., numpy.nan]),
+                               'depth': asarray([12., 30., 25., 1.])}
+        con_in.exposure_vuln_curves = {}
+        for loss_category, table in curves.items():
+            intensity_measure = 'depth' if loss_category == 'other' \
+                else 'gust'
+            con_in.exposure_vuln_curves[loss_category] = \
+                RealisedVulnerabilityCurves(intensity_measure, loss_category,
+                                            levels, table, loss_category,
+                                            0.0, curve_index)
+
+        inst = JOBS[jobs.LOOKUP]
+        with mock.patch('hazimp.jobs.vulnerability_model.interp_weights',
+                        wraps=interp_weights) as weights:
+            inst(con_in)
+        # Structural and contents share the weights
+        self.assertEqual(weights.call_count, 2)
+
+        for loss_category, table in curves.items():
+            intensity_measure = 'depth' if loss_category == 'other' \
+                else 'gust'
+            intensity = con_in.exposure_att[intensity_measure]
+            actual = interp_curves(intensity, levels, table, curve_index)
+            actual[isnan(intensity)] = 0.0
+            self.assertTrue(allclose(con_in.exposure_att[loss_category],
+                                     actual))
+
+    def test_look_up_monte_carlo(self):
+        levels = asarray([10., 20., 30.])
+        con_in = Dummy()
+        con_in.exposure_att = {'gust': asarray([15., 27., numpy.nan])}
+        con_in.exposure_vuln_curves = {
+            'wind': RealisedVulnerabilityCurves(
+                'gust', 'structural', levels,
+                asarray([[0.0, 0.5, 0.9]]), 'wind', 0.0,
+                asarray([0, 0, 0]), sigma_curves=asarray([[0., 0.1, 0.1]]),
+                realisations=100)}
+
+        inst = JOBS[jobs.LOOKUP]
+        numpy.random.seed(3)
+        inst(con_in, quantiles=[0.05, 0.5, 0.95])
+        for label in ['structural', 'structural_std', 'structural_q5',
+                      'structural_q50', 'structural_q95']:
+            self.assertEqual(con_in.exposure_att[label].shape, (3,))
+        att = con_in.exposure_att
+        self.assertTrue(allclose(att['structural'][:2], [0.25, 0.78],
+                                 atol=0.02))
+        self.assertTrue(numpy.all(att['structural_q5'][:2] <=
+                                  att['structural_q95'][:2]))
+        self.assertEqual(att['structural'][2], 0.0)
+
+    def test_permutate_exposure(self):
+        filename = build_example1()
+        con_in = Dummy()
+        con_in.vulnerability_sets = vuln_sets_from_xml_file([filename])
+        os.remove(filename)
+        con_in.vul_function_titles = {'PAGER': 'ID'}
+        ids = ['IR', 'PK', 'IR', 'PK', 'PK']
+        con_in.exposure_att = pandas.DataFrame(
+            {'MMI': [6., 6., 6., 6., 8.5], 'ID': ids,
+             'REGION': [1, 1, 2, 2, 3]})
+        JOBS[jobs.SELECTVULNFUNCTION](con_in,
+                                      variability_method={'PAGER': 'mean'})
+
+        inst = JOBS[jobs.PERMUTATE_EXPOSURE]
+        for statistics in ['exact', 'streaming']:
+            numpy.random.seed(2)
+            inst(con_in, groupby='REGION', iterations=50, quantile=[0., 1.],
+                 statistics=statistics)
+            att = con_in.exposure_att
+            # The assets of each region swap between the IR and PK curves
+            self.assertTrue(allclose(att['feathers_lower'],
+                                     [0.005, 0.005, 0.005, 0.005, 0.19]))
+            self.assertTrue(allclose(att['feathers_upper'],
+                                     [0.01, 0.01, 0.01, 0.01, 0.19]))
+        self.assertTrue(allclose(att['feathers'],
+                                 [0.005, 0.01, 0.005, 0.01, 0.19]))
+        # The exposure data is not permutated
+        self.assertEqual(list(att['ID']), ids)
+
+        # Stop once the quantiles of the region losses settle
+        con_in.prov = mock.MagicMock()
+        numpy.random.seed(2)
+        inst(con_in, groupby='REGION', iterations=1000, tolerance=0.05,
+             check_every=20)
+        permatts = con_in.prov.activity.call_args[0][3]
+        self.assertLess(permatts[':iterations'], 1000)
+        self.assertEqual(permatts[':iterations'] % 20, 0)
+        self.assertLess(float(permatts[':relativeChange']), 0.05)
+        with self.assertRaises(RuntimeError):
+            inst(con_in, iterations=10, tolerance=0.)
+
+        # The same seed gives the same result with a pool of processes
+        results = []
+        for workers in [None, 2]:
+            inst(con_in, groupby='REGION', iterations=30, seed=3,
+                 workers=workers)
+            results.append(con_in.exposure_att[['feathers_lower',
+                                                'feathers_upper']].values)
+        numpy.testing.assert_array_equal(results[0], results[1])
+
+    @mock.patch('prov.model.ProvDocument.used')
+    def test_fragility(self, mock_used):
+        filename = build_fragility_example()
+        con_in = context.Context()
+        con_in.exposure_att = pandas.DataFrame(
+            {'MMI': [7.2, 7.2, 4.0, 9.0],
+             'TYPE': ['W1', 'URM', 'W1', 'URM'],
+             'REGION': [1, 2, 1, 1]})
+        inst = JOBS[jobs.FRAGILITY]
+        inst(con_in, file_name=filename, taxonomy_field='TYPE',
+             groupby='REGION')
+
+        states = ['none', 'slight', 'moderate', 'complete']
+        probs = con_in.exposure_att[[f'{state}_probability'
+                                     for state in states]].values
+        self.assertTrue(allclose(probs.sum(axis=1), 1.))
+        self.assertTrue(allclose(probs[2], [1., 0., 0., 0.]))
+
+        counts = con_in.exposure_agg
+        self.assertEqual(list(counts['REGION']), [1, 2])
+        self.assertTrue(allclose(
+            counts[[f'{state}_count' for state in states]].values,
+            [probs[[0, 2, 3]].sum(axis=0), probs[1]]))
+
+        with self.assertRaises(RuntimeError):
+            inst(con_in, file_name=filename, taxonomy_field='BUILDING_TYPE')
+        os.remove(filename)
 
     @mock.patch('prov.model.ProvDocument.entity')
     @mock.patch('prov.model.ProvDocument.activity')
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Test the loss statistics module.
+"""
+
+import unittest
+
+import numpy
+from numpy import allclose
+
+from hazimp.jobs.loss_statistics import (ExactStatistics,
+                                         StreamingStatistics,
+                                         loss_statistics, relative_change)
+
+
+class TestLossStatistics(unittest.TestCase):
+
+    def test_streaming_statistics(self):
+        numpy.random.seed(1)
+        quantiles = [0., 0.05, 0.5, 0.95, 1.]
+        # Dimensions (iteration, asset)
+        losses = numpy.random.normal(0.3, 0.05, size=(2000, 20)) * \
+            numpy.linspace(0.5, 2., 20)
+        exact = ExactStatistics(20, 2000, quantiles)
+        streaming = StreamingStatistics(20, 2000, quantiles)
+        for loss in losses:
+            exact.update(loss)
+            streaming.update(loss)
+
+        self.assertTrue(allclose(streaming.mean, losses.mean(axis=0)))
+        self.assertTrue(allclose(streaming.std, losses.std(axis=0)))
+        self.assertTrue(allclose(exact.quantiles(),
+                                 numpy.quantile(losses, quantiles, axis=0)))
+        # The extremes are exact, the other quantiles are estimates
+        estimate = streaming.quantiles()
+        self.assertTrue(allclose(estimate[[0, -1]],
+                                 exact.quantiles()[[0, -1]]))
+        self.assertTrue(allclose(estimate, exact.quantiles(), rtol=0.05))
+
+    def test_streaming_few_iterations(self):
+        losses = numpy.array([[0.1, 0.5], [0.3, 0.2], [0.2, 0.4]])
+        streaming = StreamingStatistics(2, 3, [0.05, 0.5])
+        for loss in losses:
+            streaming.update(loss)
+        self.assertTrue(allclose(streaming.quantiles(),
+                                 numpy.quantile(losses, [0.05, 0.5],
+                                                axis=0)))
+
+    def test_relative_change(self):
+        self.assertAlmostEqual(relative_change([1.1, 0., 2.], [1., 0., 2.]),
+                               0.1)
+        self.assertEqual(relative_change([0.5], [0.]), numpy.inf)
+
+    def test_loss_statistics(self):
+        self.assertIsInstance(loss_statistics(10, 100, [0.5]),
+                              ExactStatistics)
+        self.assertIsInstance(loss_statistics(10, 100, [0.5], 'auto'),
+                              ExactStatistics)
+        with self.assertLogs('hazimp.jobs.loss_statistics', 'WARNING'):
+            self.assertIsInstance(
+                loss_statistics(10 ** 6, 1000, [0.5], 'auto',
+                                memory_budget=256),
+                StreamingStatistics)
+        self.assertIsInstance(loss_statistics(10, 100, [0.5], 'streaming'),
+                              StreamingStatistics)
+        with self.assertRaises(RuntimeError):
+            loss_statistics(10, 100, [0.5], 'sketchy')
+
+
+if __name__ == "__main__":
+    SUITE = unittest.makeSuite(TestLossStatistics, 'test')
+    RUNNER = unittest.TextTestRunner()
+    RUNNER.run(SUITE)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Test the permutation module.
+"""
+
+import unittest
+
+import numpy
+from numpy import asarray
+
+from hazimp.jobs.permutation import permutation_losses, batch_seeds
+from hazimp.jobs.vulnerability_model import RealisedVulnerabilityCurves
+
+
+def build_curve_sets():
+    """
+    Two vulnerability sets on the same intensities, for 12 assets in 3
+    groups of 4. The assets of a group have the same intensity.
+    """
+    levels = asarray([10., 20., 30.])
+    intensities = numpy.repeat([12., 22., 35.], 4)
+    curve_index = numpy.arange(12) % 3
+    curve_sets = []
+    for curves in [[[0., 0.5, 1.], [0., 0.2, 0.4], [0.1, 0.3, 0.9]],
+                   [[0., 0.1, 0.2], [0., 0.6, 0.7], [0.2, 0.4, 0.5]]]:
+        vuln_curve = RealisedVulnerabilityCurves('gust', 'structural',
+                                                 levels, asarray(curves),
+                                                 'wind', 0.0, curve_index)
+        curve_sets.append((vuln_curve, intensities,
+                           vuln_curve.look_up_weights(intensities)))
+    return curve_sets
+
+
+class TestPermutation(unittest.TestCase):
+
+    def test_batch_seeds(self):
+        seeds = batch_seeds(5, 25, batch_size=10)
+        self.assertEqual(len(seeds), 3)
+        again = batch_seeds(5, 25, batch_size=10)
+        for first, second in zip(seeds, again):
+            self.assertEqual(first.generate_state(4).tolist(),
+                             second.generate_state(4).tolist())
+
+    def test_permutation_losses(self):
+        curve_sets = build_curve_sets()
+        codes = numpy.arange(12) // 4
+        serial = list(permutation_losses(curve_sets, codes, 25, seed=11))
+        self.assertEqual([batch[0].shape for batch in serial],
+                         [(10, 12), (10, 12), (5, 12)])
+
+        # Every permutation moves the curves within each group
+        base = curve_sets[0][0].look_up(curve_sets[0][1])
+        for losses in numpy.concatenate([batch[0] for batch in serial]):
+            for group in range(3):
+                assets = codes == group
+                numpy.testing.assert_array_equal(numpy.sort(losses[assets]),
+                                                 numpy.sort(base[assets]))
+
+        for workers in [2, 3]:
+            parallel = list(permutation_losses(curve_sets, codes, 25,
+                                               seed=11, workers=workers))
+            self.assertEqual(len(parallel), len(serial))
+            for first, second in zip(serial, parallel):
+                for set_first, set_second in zip(first, second):
+                    numpy.testing.assert_array_equal(set_first, set_second)
+
+        # Stopping early, while holding the last losses, releases the pool
+        batches = permutation_losses(curve_sets, codes, 45, seed=11,
+                                     workers=2)
+        first = next(batches)
+        batches.close()
+        numpy.testing.assert_array_equal(first[0], serial[0][0])
+
+        other = list(permutation_losses(curve_sets, codes, 25, seed=12))
+        self.assertFalse(numpy.array_equal(serial[0][0], other[0][0]))
+
+
+if __name__ == "__main__":
+    SUITE = unittest.makeSuite(TestPermutation, 'test')
+    RUNNER = unittest.TextTestRunner()
+    RUNNER.run(SUITE)
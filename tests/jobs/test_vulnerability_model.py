@@ -23,14 +23,19 @@ Test the vulnerability module.
 """
 
 import os
+import shutil
 import tempfile
 import unittest
+from unittest import mock
 
 import numpy
 from numpy import asarray, allclose
 
 from hazimp.jobs.vulnerability_model import vuln_sets_from_xml_file, \
-    RealisedVulnerabilityCurves
+    RealisedVulnerabilityCurves, interp_curves, lut_levels, \
+    vuln_set_from_xml_stream, vuln_sets_from_xml_node, interp_weights, \
+    monte_carlo_losses, ratio_cutoff, hazard_chunk_size
+from hazimp.xml_interface import XmlLayer
 
 
 def build_example1():
@@ -218,6 +223,288 @@ class TestVulnerabilityFunction(unittest.TestCase):
         self.assertTrue(allclose(loss,
                                  asarray([0.5, 10.0])), 'got ' + str(loss))
 
+    def test_interp_curves(self):
+        rng = numpy.random.default_rng(7)
+        levels = asarray([17., 20., 25., 30., 40., 60., 90.])
+        loss_per_asset = numpy.sort(rng.random((50, levels.shape[0])),
+                                    axis=1)
+        # Inside, on the levels, outside and missing intensities
+        intensity = rng.uniform(0., 100., (50, 3))
+        intensity[:7, 0] = levels
+        intensity[7, 1] = numpy.nan
+        intensity[8, 2] = numpy.inf
+
+        actual = numpy.empty(intensity.shape)
+        for asset in range(intensity.shape[0]):
+            actual[asset] = numpy.interp(intensity[asset], levels,
+                                         loss_per_asset[asset])
+        loss = interp_curves(intensity, levels, loss_per_asset)
+        numpy.testing.assert_array_equal(loss, actual)
+
+        loss = interp_curves(intensity[:, 0], levels, loss_per_asset)
+        numpy.testing.assert_array_equal(loss, actual[:, 0])
+
+    def test_build_realised_curve_table(self):
+        filename = build_example1()
+        vuln_sets = vuln_sets_from_xml_file([filename])
+        os.remove(filename)
+        vuln_set = vuln_sets["PAGER"]
+
+        function_ids = asarray(["PK", "IR", "PK", "PK", "IR"])
+        rvc = vuln_set.build_realised_vuln_curves(function_ids)
+        self.assertEqual(rvc.curves.shape, (2, 3))
+        self.assertEqual(rvc.curve_index.dtype, numpy.int32)
+        for asset, key in enumerate(function_ids):
+            self.assertTrue(allclose(
+                rvc.loss_per_asset[asset],
+                vuln_set.vulnerability_functions[key].mean_loss))
+
+        intensity = asarray([5.0, 6.0, 7.0, 12.0, numpy.nan])
+        actual = [numpy.interp(intensity[asset], [5.0, 7.0, 10.0],
+                               rvc.loss_per_asset[asset])
+                  for asset in range(4)]
+        loss = rvc.look_up(intensity)
+        self.assertTrue(allclose(loss[:4], actual))
+        self.assertEqual(loss[4], vuln_set.default_loss)
+
+        with self.assertRaises(NotImplementedError) as err:
+            vuln_set.build_realised_vuln_curves(
+                asarray(["PK", "XX", "YY", "XX"]))
+        self.assertIn('[XX, YY]', str(err.exception))
+
+    def test_build_realised_sampled_curves(self):
+        filename = build_example1()
+        vuln_sets = vuln_sets_from_xml_file([filename])
+        os.remove(filename)
+        vuln_set = vuln_sets["PAGER"]
+        function_ids = ["PK", "IR", "PK", "IR", "IR"]
+
+        for method in ['normal', 'normal_uniform']:
+            numpy.random.seed(5)
+            rvc = vuln_set.build_realised_vuln_curves(function_ids, method)
+            numpy.random.seed(5)
+            actual = [vuln_set.vulnerability_functions[key].get_loss(method)
+                      for key in function_ids]
+            numpy.testing.assert_array_equal(rvc.loss_per_asset, actual)
+
+    def test_look_up_table(self):
+        levels = asarray([17., 20., 25., 30., 40., 60., 90.])
+        curves = asarray([[0.0, 0.01, 0.05, 0.2, 0.5, 0.9, 1.0],
+                          [0.0, 0.0, 0.02, 0.1, 0.3, 0.7, 0.95]])
+        curve_index = asarray([0, 1, 1, 0, 1, 0])
+        intensity = asarray([0., 18.26, 33.333, 59.99, 120., numpy.nan])
+
+        grid = lut_levels(levels, 0.1)
+        self.assertTrue(allclose(grid[[0, -1]], [17., 90.]))
+        rvc = RealisedVulnerabilityCurves('wind', 'structural', levels,
+                                          curves, 'wind', 0.0,
+                                          curve_index, grid)
+        self.assertTrue(allclose(rvc.lut_error_bound, 0.05 * 0.03))
+
+        actual = interp_curves(intensity, levels, curves, curve_index)
+        loss = rvc.look_up(intensity)
+        self.assertTrue(numpy.all(
+            numpy.abs(loss[:5] - actual[:5]) <= rvc.lut_error_bound))
+        self.assertEqual(loss[5], 0.0)
+
+        # On the grid the table gives the curve
+        on_grid = asarray([17., 17.5, 25., 40., 90., 40.])
+        loss = rvc.look_up(on_grid)
+        actual = interp_curves(on_grid, levels, curves, curve_index)
+        self.assertTrue(allclose(loss, actual))
+
+        for resolution in [0, -1., 'a']:
+            with self.assertRaises(RuntimeError):
+                lut_levels(levels, resolution)
+
+    def test_vuln_set_look_up_table(self):
+        filename = build_example1()
+        vuln_sets = vuln_sets_from_xml_file([filename], lut_resolution=0.5)
+        os.remove(filename)
+        vuln_set = vuln_sets["PAGER"]
+        # One row per function, built once
+        self.assertEqual(vuln_set.lut.shape, (2, 11))
+
+        function_ids = asarray(["PK", "IR", "PK", "PK"])
+        intensity = asarray([6.0, 8.2, 5.0, numpy.nan])
+        rvc = vuln_set.build_realised_vuln_curves(function_ids)
+        self.assertTrue(allclose(
+            rvc.lut, vuln_set.lut[[vuln_set.lut_rows['PK'],
+                                   vuln_set.lut_rows['IR']]]))
+        actual = interp_curves(intensity, rvc.intensity_measure_level,
+                               rvc.curves, rvc.curve_index)
+        loss = rvc.look_up(intensity)
+        self.assertTrue(numpy.all(
+            numpy.abs(loss[:3] - actual[:3]) <= rvc.lut_error_bound))
+
+        # Sampled curves are interpolated, without a row per asset
+        rvc = vuln_set.build_realised_vuln_curves(function_ids, 'normal')
+        self.assertIsNone(rvc.lut)
+        actual = interp_curves(intensity, rvc.intensity_measure_level,
+                               rvc.loss_per_asset)
+        self.assertTrue(allclose(rvc.look_up(intensity)[:3], actual[:3]))
+
+    def test_look_up_hazard_dimensions(self):
+        levels = asarray([17., 20., 25., 30., 40., 60., 90.])
+        curves = asarray([[0.0, 0.01, 0.05, 0.2, 0.5, 0.9, 1.0],
+                          [0.0, 0.0, 0.02, 0.1, 0.3, 0.7, 0.95]])
+        curve_index = asarray([0, 1, 1])
+        numpy.random.seed(1)
+        # Dimensions (asset, ensemble member, time step)
+        intensity = numpy.random.uniform(10., 100., size=(3, 4, 5))
+        intensity[1, 2, 3] = numpy.nan
+        actual = numpy.empty(intensity.shape)
+        for asset, row in enumerate(curve_index):
+            actual[asset] = numpy.interp(intensity[asset], levels,
+                                         curves[row])
+        actual[1, 2, 3] = 0.0
+
+        for grid in [None, lut_levels(levels, 0.1)]:
+            rvc = RealisedVulnerabilityCurves('wind', 'structural', levels,
+                                              curves, 'wind', 0.0,
+                                              curve_index, grid)
+            whole = rvc.look_up(intensity)
+            self.assertEqual(whole.shape, intensity.shape)
+            self.assertTrue(numpy.all(
+                numpy.abs(whole - actual) <= rvc.lut_error_bound + 1e-12))
+            # A tiny memory budget looks up one hazard value at a time
+            self.assertEqual(hazard_chunk_size(intensity.shape, 1e-6), 1)
+            chunked = rvc.look_up(intensity, memory_budget=1e-6)
+            numpy.testing.assert_array_equal(chunked, whole)
+
+    def test_compiled_cache(self):
+        filename = build_example1()
+        cache_dir = tempfile.mkdtemp(prefix='test_vuln_cache')
+        vuln_sets = vuln_sets_from_xml_file([filename], cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        with mock.patch('hazimp.jobs.vulnerability_model.'
+                        'vuln_set_from_xml_stream') as parse:
+            cached = vuln_sets_from_xml_file([filename], cache_dir=cache_dir)
+            parse.assert_not_called()
+        os.remove(filename)
+        shutil.rmtree(cache_dir)
+
+        self.assertEqual(list(cached), list(vuln_sets))
+        expected = vuln_sets["PAGER"]
+        actual = cached["PAGER"]
+        for att in ['intensity_measure_type', 'vulnerability_set_id',
+                    'asset_category', 'loss_category', 'default_loss']:
+            self.assertEqual(getattr(actual, att), getattr(expected, att))
+        numpy.testing.assert_array_equal(actual.intensity_measure_level,
+                                         expected.intensity_measure_level)
+        self.assertEqual(list(actual.vulnerability_functions),
+                         list(expected.vulnerability_functions))
+        for key, funct in expected.vulnerability_functions.items():
+            cached_funct = actual.vulnerability_functions[key]
+            numpy.testing.assert_array_equal(cached_funct.mean_loss,
+                                             funct.mean_loss)
+            numpy.testing.assert_array_equal(
+                cached_funct.coefficient_of_variation,
+                funct.coefficient_of_variation)
+            self.assertEqual(str(cached_funct.distribution),
+                             str(funct.distribution))
+
+    def test_xml_stream(self):
+        filename = build_example1()
+        set_id, vuln_set = vuln_set_from_xml_stream(filename)
+        xml_node = XmlLayer(filename=filename)
+        expected_id, expected = vuln_sets_from_xml_node(xml_node)
+        os.remove(filename)
+
+        self.assertEqual(set_id, expected_id)
+        self.assertEqual(vuln_set.default_loss, expected.default_loss)
+        self.assertTrue(allclose(vuln_set.intensity_measure_level,
+                                 expected.intensity_measure_level))
+        self.assertEqual(list(vuln_set.vulnerability_functions),
+                         list(expected.vulnerability_functions))
+        for key, funct in expected.vulnerability_functions.items():
+            actual = vuln_set.vulnerability_functions[key]
+            self.assertTrue(allclose(actual.mean_loss, funct.mean_loss))
+            self.assertTrue(allclose(actual.coefficient_of_variation,
+                                     funct.coefficient_of_variation))
+
+    def test_xml_stream_invalid(self):
+        filename = build_example1()
+        with open(filename) as fhandle:
+            text = fhandle.read()
+        with open(filename, 'w') as fhandle:
+            fhandle.write(text.replace('<covLRs>0.30 0.30 0.30 </covLRs>',
+                                       ''))
+        with self.assertRaises(SystemExit):
+            vuln_sets_from_xml_file([filename])
+        os.remove(filename)
+
+    def test_monte_carlo_losses(self):
+        levels = asarray([10., 20., 30.])
+        mean_curves = asarray([[0.0, 0.5, 0.9], [0.1, 0.2, 0.4]])
+        sigma_curves = asarray([[0.0, 0.2, 0.3], [0.05, 0.1, 0.1]])
+        curve_index = asarray([0, 1, 1, 0, 1])
+        intensity = asarray([5., 15., 27., 35., numpy.nan])
+        realisations = 200
+        quantiles = [0.1, 0.9]
+        weights = interp_weights(intensity, levels)
+
+        def expected(deviates):
+            loss = numpy.empty((realisations, intensity.shape[0]))
+            for asset, curve in enumerate(curve_index):
+                for real in range(realisations):
+                    points = ratio_cutoff(mean_curves[curve] +
+                                          deviates[real, asset] *
+                                          sigma_curves[curve])
+                    loss[real, asset] = numpy.interp(intensity[asset],
+                                                     levels, points)
+            return (loss.mean(axis=0), loss.std(axis=0),
+                    numpy.quantile(loss, quantiles, axis=0))
+
+        # All of the assets in one chunk, or one asset per chunk
+        numpy.random.seed(11)
+        deviates = numpy.random.normal(0, 1, (realisations, 5))
+        chunked = numpy.hstack([numpy.random.normal(0, 1, (realisations, 1))
+                                for _ in range(5)])
+        numpy.random.seed(11)
+        for memory_budget, deviate in [(1, deviates), (1e-6, chunked)]:
+            actual = monte_carlo_losses(weights, mean_curves, sigma_curves,
+                                        curve_index, realisations, quantiles,
+                                        memory_budget)
+            for result, target in zip(actual, expected(deviate)):
+                numpy.testing.assert_allclose(result[..., :4],
+                                              target[..., :4])
+                self.assertTrue(numpy.all(numpy.isnan(result[..., 4])))
+
+        # Outside the levels the spread is that of the end points
+        self.assertTrue(actual[1][0] == 0.)
+        self.assertTrue(actual[1][3] > 0.)
+
+    def test_build_realised_monte_carlo(self):
+        filename = build_example1()
+        vuln_set = vuln_sets_from_xml_file([filename])["PAGER"]
+        os.remove(filename)
+
+        rvc = vuln_set.build_realised_vuln_curves(["PK", "IR", "PK"],
+                                                  'normal', realisations=50)
+        self.assertEqual(rvc.realisations, 50)
+        self.assertEqual(rvc.curves.shape, (2, 3))
+        pk_funct = vuln_set.vulnerability_functions["PK"]
+        numpy.testing.assert_allclose(
+            rvc.sigma_curves[rvc.curve_index[0]],
+            pk_funct.mean_loss * pk_funct.coefficient_of_variation)
+
+        mean, std, quantile_loss = rvc.monte_carlo(
+            asarray([8., numpy.nan, 4.]), quantiles=[0.5])
+        self.assertEqual(quantile_loss.shape, (1, 3))
+        self.assertEqual(mean[1], vuln_set.default_loss)
+        self.assertEqual(std[1], 0.)
+        self.assertTrue(std[0] > 0.)
+
+        # The mean method has no realisations
+        rvc = vuln_set.build_realised_vuln_curves(["PK"], 'mean',
+                                                  realisations=50)
+        self.assertIsNone(rvc.realisations)
+        with self.assertRaises(RuntimeError):
+            vuln_set.build_realised_vuln_curves(["PK"], 'normal',
+                                                realisations=0)
+
 
 # -----------------------------------------------------------
 if __name__ == "__main__":
@@ -38,7 +38,8 @@ from hazimp.config import instance_builder, read_config_file
 from hazimp.config_build import (_get_job_or_calc,
                                  check_1st_level_keys, file_can_open,
                                  check_files_to_load, check_attributes,
-                                 find_attributes)
+                                 find_attributes, add_job_options,
+                                 add_optional_job)
 from hazimp.jobs import jobs
 from hazimp.jobs.jobs import LOADRASTER, SAVEALL, LoadRaster, SaveExposure
 from tests import CWD
@@ -65,6 +66,14 @@ class TestConfig(unittest.TestCase):
         actual = config.instance_builder(the_config)
         self.assertEqual(calcs.CALCS['add_test'], actual[0].job_instance)
 
+    def test_random_seed(self):
+        the_config = [{'template': 'default'}, {'add_test': None},
+                      {'random_seed': 42}]
+        actual = config.instance_builder(the_config)
+        self.assertIsInstance(actual[0].job_instance, jobs.RandomSeed)
+        self.assertEqual(actual[0].atts_to_add, {'seed': 42})
+        self.assertEqual(calcs.CALCS['add_test'], actual[1].job_instance)
+
     def test_instance_builder_bad_format(self):
         with self.assertRaises(RuntimeError) as context:
             instance_builder(['template'])
@@ -187,6 +196,21 @@ class TestConfig(unittest.TestCase):
         attributes = find_attributes(config, [jobs.LOADRASTER, jobs.LOADCSVEXPOSURE])
         self.assertEqual(attributes, expected_attributes)
 
+    def test_add_job_options(self):
+        section = {'filename': 'curve.xml', 'cache_dir': 'cache'}
+        atts = add_job_options(section, {'file_name': 'curve.xml'},
+                               ['lut_resolution', 'cache_dir'])
+        self.assertEqual(atts, {'file_name': 'curve.xml',
+                                'cache_dir': 'cache'})
+
+        job_insts = []
+        add_optional_job(job_insts, {}, jobs.REORDER_EXPOSURE)
+        self.assertEqual(job_insts, [])
+        add_optional_job(job_insts, {jobs.REORDER_EXPOSURE: {'order': 8}},
+                         jobs.REORDER_EXPOSURE)
+        self.assertIsInstance(job_insts[0].job_instance, jobs.ReorderExposure)
+        self.assertEqual(job_insts[0].atts_to_add, {'order': 8})
+
     def test_instansiate_jobs_without_template(self):
         config = [
             {LOADRASTER: {
@@ -157,6 +157,33 @@ class TestContext(unittest.TestCase):
             self.assertTrue(allclose(con.exposure_att[key],
                                      actual[key]))
 
+    def test_reorder_exposure(self):
+        lon = array([0., 3., 1., 2., 0., 3.])
+        lat = array([0., 3., 1., 2., 3., 0.])
+        con = context.Context()
+        con.set_prov_label('test label')
+        con.exposure_att = pd.DataFrame({'shoes': lon * 10 + lat,
+                                         misc.INTID: arange(6)})
+        con.exposure_lat = lat
+        con.exposure_long = lon
+
+        indexes = con.reorder_exposure(curve=misc.HILBERT, order=2)
+        assert_array_equal(con.exposure_long, lon[indexes])
+        assert_array_equal(con.exposure_lat, lat[indexes])
+        assert_array_equal(con.exposure_att['shoes'],
+                           con.exposure_long * 10 + con.exposure_lat)
+        assert_array_equal(con.exposure_att[misc.INTID], indexes)
+        self.assertFalse((indexes == arange(6)).all())
+
+        # The exposure is saved in the original order
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'reordered.csv')
+            con.save_exposure_atts(filename, use_parallel=False)
+            saved = misc.csv2dict(filename)
+        assert_array_equal(saved[context.EX_LONG], lon)
+        assert_array_equal(saved[context.EX_LAT], lat)
+        assert_array_equal(saved['shoes'], lon * 10 + lat)
+
     @patch('hazimp.context.aggregate.choropleth')
     @patch('hazimp.context.misc.upload_to_s3_if_applicable')
     def test_save_aggregation_local(self, upload_mock, choropleth_mock):
@@ -34,14 +34,13 @@ Test the misc module.
 import os
 import tempfile
 import unittest
-from unittest.mock import patch, call, ANY
+from unittest.mock import patch, ANY
 from zipfile import ZipFile
 
 import numpy
 import pandas as pd
 from botocore.exceptions import ClientError
 from git import InvalidGitRepositoryError, Repo
-from mock import Mock
 
 # mock_s3 was changed to mock_aws for moto>=5.0
 try:
@@ -49,7 +48,6 @@ try:
 except ImportError:
     from moto import mock_s3 as mock_aws
 
-from numpy.random.mtrand import permutation
 from numpy import allclose
 
 from hazimp.misc import (csv2dict, get_required_args, sorted_dict_values,
@@ -58,7 +56,9 @@ from hazimp.misc import (csv2dict, get_required_args, sorted_dict_values,
                          create_temp_file_path_for_s3,
                          download_from_s3, upload_to_s3_if_applicable,
                          download_file_from_s3_if_needed, mod_file_list,
-                         permutate_att_values, get_git_commit)
+                         get_git_commit, group_codes,
+                         group_permutation,
+                         space_filling_key, HILBERT, MORTON, get_file_mtime)
 from tests import CWD
 
 
@@ -213,22 +213,47 @@ class TestMisc(unittest.TestCase):
         self.assertEqual(r_keys, ['boots', 'feet', 'socks'])
         self.assertEqual(r_values, [1, 2, 3])
 
-    def test_permutate_att_values(self):
-        with patch('hazimp.misc.permutation', Mock(wraps=permutation)) as mock:
-            data_frame = pd.DataFrame({'x': [1, 2, 3]})
-            permutate_att_values(data_frame, 'x')
+    def test_group_permutation(self):
+        codes = numpy.array([0, 1, 0, 1, -1, 0, 1, -1])
+        numpy.random.seed(4)
+        for _ in range(10):
+            index = group_permutation(codes)
+            self.assertEqual(sorted(index), list(range(8)))
+            # Values only move within their group
+            numpy.testing.assert_array_equal(codes[index], codes)
+            # Values with no group stay put
+            numpy.testing.assert_array_equal(index[[4, 7]], [4, 7])
+
+        df = pd.DataFrame({'x': [1, 2, 3], 'y': ['a', None, 'a']})
+        numpy.testing.assert_array_equal(group_codes(df, 'y'), [0, -1, 0])
+        numpy.testing.assert_array_equal(group_codes(df), [0, 0, 0])
+        with self.assertRaises(SystemExit):
+            group_codes(df, 'z')
 
-            mock.assert_has_calls([
-                call(1),
-                call(2),
-                call(3),
-            ])
+    def test_space_filling_key(self):
+        # A 4 x 4 grid of points
+        lon, lat = numpy.meshgrid(numpy.arange(4.), numpy.arange(4.) - 30)
+        lon = lon.ravel()
+        lat = lat.ravel()
 
-    def test_permutate_att_values_invalid_group(self):
-        data_frame = pd.DataFrame({'x': [1, 2, 3]})
+        key = space_filling_key(lon, lat, HILBERT, order=2)
+        numpy.testing.assert_array_equal(numpy.sort(key), numpy.arange(16))
+        # Each point along a Hilbert curve is next to the last one
+        order = numpy.argsort(key)
+        steps = (numpy.abs(numpy.diff(lon[order])) +
+                 numpy.abs(numpy.diff(lat[order])))
+        numpy.testing.assert_array_equal(steps, 1)
 
-        with self.assertRaises(SystemExit):
-            permutate_att_values(data_frame, 'x', 'y')
+        key = space_filling_key(lon, lat, MORTON, order=2)
+        numpy.testing.assert_array_equal(key[:4], [0, 1, 4, 5])
+        numpy.testing.assert_array_equal(numpy.sort(key), numpy.arange(16))
+
+        # Points without a location go last
+        key = space_filling_key([1., numpy.nan, 2.], [1., 1., 2.])
+        self.assertEqual(numpy.argmax(key), 1)
+
+        with self.assertRaises(RuntimeError):
+            space_filling_key(lon, lat, 'peano')
 
     def test_get_git_commit(self):
         self.assertEqual((ANY, ANY, ANY, ANY), get_git_commit())
@@ -254,6 +279,21 @@ class TestMisc(unittest.TestCase):
         self.assertEqual(bucket_key, 'subdir/file.ext')
         self.assertEqual(file_name, 'file.ext')
 
+    @mock_aws
+    def test_get_file_mtime_s3(self):
+        s3 = get_s3_client(region_name='us-east-1')
+        s3.create_bucket(Bucket='bucket')
+        s3.put_object(Bucket='bucket', Key='subdir/hazard.tif', Body='')
+        modified = s3.head_object(Bucket='bucket',
+                                  Key='subdir/hazard.tif')['LastModified']
+
+        # The object is not downloaded to get the time
+        directory_path = get_temporary_directory()
+        mtime = get_file_mtime('/vsis3/bucket/subdir/hazard.tif')
+        self.assertEqual(mtime, modified.strftime('%Y-%m-%d %H:%M:%S %Z'))
+        self.assertFalse(os.path.exists(
+            os.path.join(directory_path, 'hazard.tif')))
+
     @mock_aws
     def test_download_from_s3(self):
         s3 = get_s3_client(region_name='us-east-1')
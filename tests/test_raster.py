@@ -32,13 +32,25 @@ Test the raster module.
 """
 
 import os
+import shutil
 import tempfile
 import unittest
+from unittest import mock
 
+import boto3
 import numpy
 from numpy import asarray, allclose, nan
 
-from hazimp.raster import Raster, recalc_max, files_raster_data_at_points
+try:
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    ThreadedMotoServer = None
+
+from hazimp.raster import (Raster, recalc_max, files_raster_data_at_points,
+                           RasterCache, PixelIndex, TileIndex, Mosaic,
+                           is_mosaic, STRATEGIES, WINDOW, BLOCK, SPARSE,
+                           NEAREST, BILINEAR, unique_points, is_remote,
+                           configure_remote_reads, MAX_COALESCED_BLOCKS)
 from tests import CWD
 
 
@@ -125,6 +137,118 @@ class TestRaster(unittest.TestCase):
 
         os.remove(f.name)
 
+    def test3_raster_data_at_points_blocks(self):
+        # Write a file to test
+        f = tempfile.NamedTemporaryFile(suffix='.aai',
+                                        prefix='test_misc',
+                                        delete=False,
+                                        mode='w+t')
+        f.write('ncols 5   \r\n')
+        f.write('nrows 3 \r\n')
+        f.write('xllcorner +0.   \r\n')
+        f.write('yllcorner +7. \r\n')
+        f.write('cellsize 1   \r\n')
+        f.write('NODATA_value -9999 \r\n')
+        f.write('1 2 3 4 5 \r\n')
+        f.write('6 7 8 9 -9999 \r\n')
+        f.write('11 12 13 14 15')
+        f.close()
+        # lon 0 - 5
+        # lat 7 - 10
+
+        lon = asarray([4.5, 0.5, 3.5, 1.5, 4.5, 0.5, 5.0, -1, nan, 2.5])
+        lat = asarray([7.5, 9.5, 8.5, 7.5, 8.5, 9.5, 9.5, 9.5, 9.5, 10.5])
+
+        # Blocks smaller than, and not aligned with, the grid
+        raster = Raster(f.name, 0., 10., 1., -1., -9999, 5, 3, 2, 2)
+        col, row, inside = raster.pixel_index(lon, lat)
+        numpy.testing.assert_array_equal(
+            inside, [True] * 6 + [False] * 4)
+        numpy.testing.assert_array_equal(
+            col, [4, 0, 3, 1, 4, 0, -1, -1, -1, -1])
+        numpy.testing.assert_array_equal(
+            row, [2, 0, 1, 2, 1, 0, -1, -1, -1, -1])
+
+        data = raster.raster_data_at_points(lon, lat)
+        actual = asarray([15, 1, 9, 12, nan, 1, nan, nan, nan, nan])
+        numpy.testing.assert_equal(data, actual)
+
+        # Native blocks from the file
+        raster = Raster.from_file(f.name)
+        data = raster.raster_data_at_points(lon, lat)
+        numpy.testing.assert_equal(data, actual)
+
+        for strategy in STRATEGIES:
+            data = raster.raster_data_at_points(lon, lat, strategy=strategy)
+            numpy.testing.assert_equal(data, actual)
+        self.assertRaises(RuntimeError, raster.raster_data_at_points,
+                          lon, lat, strategy='monkey')
+
+        os.remove(f.name)
+
+    def test_bilinear(self):
+        # Write a file to test
+        f = tempfile.NamedTemporaryFile(suffix='.aai',
+                                        prefix='test_misc',
+                                        delete=False,
+                                        mode='w+t')
+        f.write('ncols 5\nnrows 3\nxllcorner 0\nyllcorner 7\n'
+                'cellsize 1\nNODATA_value -9999\n'
+                '1 2 3 4 5\n6 7 8 9 -9999\n11 12 13 14 15')
+        f.close()
+
+        lon = asarray([0.5, 1.0, 1.0, 0.25, 4.25, 3.75, 3.5, 5.0])
+        lat = asarray([9.5, 9.0, 9.5, 9.5, 8.5, 8.5, 8.0, 9.5])
+        # Cell centre, corner, edge, grid edge, no data cell,
+        # next to no data, between rows, outside
+        actual = asarray([1., 4., 1.5, 1., nan, 9., 11.5, nan])
+
+        raster = Raster.from_file(f.name)
+        for strategy in STRATEGIES:
+            data = raster.raster_data_at_points(
+                lon, lat, strategy=strategy, interpolation=BILINEAR)
+            numpy.testing.assert_allclose(data, actual)
+
+        data = raster.raster_data_at_points(lon, lat, interpolation=NEAREST)
+        numpy.testing.assert_equal(
+            data, asarray([1., 7., 2., 1., nan, 9., 14., nan]))
+
+        # The raster cache gives the same values
+        with tempfile.TemporaryDirectory() as cache_dir:
+            data, _ = files_raster_data_at_points(
+                lon, lat, [f.name], scaling_factor=2.,
+                cache=RasterCache(cache_dir), interpolation=BILINEAR)
+            numpy.testing.assert_allclose(data, actual * 2.)
+
+        self.assertRaises(RuntimeError, raster.raster_data_at_points,
+                          lon, lat, interpolation='cubic')
+        os.remove(f.name)
+
+    def test_sample_strategy(self):
+        raster = Raster('dummy.tif', 0., 10., 1., -1., -9999,
+                        10000, 10000, 100, 100)
+        # A compact cluster of points
+        col = asarray([10, 20, 30])
+        row = asarray([10, 20, 30])
+        self.assertEqual(raster.sample_strategy(col, row), WINDOW)
+
+        # Points across the grid, several per block
+        col = asarray([10, 20, 9990, 9995])
+        row = asarray([10, 20, 9990, 9995])
+        self.assertEqual(raster.sample_strategy(col, row, 1), BLOCK)
+
+        # Points across the grid, one per block
+        col = asarray([10, 9990])
+        row = asarray([10, 9990])
+        self.assertEqual(raster.sample_strategy(col, row, 1), SPARSE)
+
+        # Blocks too big for the memory budget
+        raster = Raster('dummy.tif', 0., 10., 1., -1., -9999,
+                        10000, 10000, 10000, 100)
+        col = asarray([10, 20, 9990, 9995])
+        row = asarray([10, 20, 9990, 9995])
+        self.assertEqual(raster.sample_strategy(col, row, 1), SPARSE)
+
     def test2_files_raster_data_at_points(self):
 
         files = []
@@ -207,6 +331,268 @@ class TestRaster(unittest.TestCase):
         actual = numpy.array([0.01, numpy.nan, 0.02])
         numpy.testing.assert_equal(data, actual)
 
+    def test5_raster_cache(self):
+        files = [str(CWD / 'data/basic_raster.aai')]
+
+        longitude = asarray([0.5, 2.6, 1.3, 5.0])
+        latitude = asarray([9.3, 9.5, 9.5, 9.5])
+        actual, actual_extent = files_raster_data_at_points(
+            longitude, latitude, files)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = RasterCache(cache_dir)
+            key = cache.key(files[0])
+            self.assertIsNotNone(key)
+            self.assertIsNone(cache.key('/vsis3/bucket/key.tif'))
+
+            # First use decodes the raster, the second uses the cache
+            for _ in range(2):
+                data, extent = files_raster_data_at_points(
+                    longitude, latitude, files, cache=cache)
+                numpy.testing.assert_equal(data, actual)
+                self.assertEqual(extent, actual_extent)
+                self.assertTrue(os.path.isfile(
+                    os.path.join(cache_dir, key + '.npy')))
+            raster = cache.raster(files[0])
+            self.assertIsInstance(raster.data, numpy.memmap)
+
+            # The content hash does not depend on the path
+            content_cache = RasterCache(cache_dir, hash_content=True)
+            self.assertNotEqual(content_cache.key(files[0]), key)
+            with tempfile.TemporaryDirectory() as copy_dir:
+                copy = os.path.join(copy_dir, 'renamed.aai')
+                shutil.copyfile(files[0], copy)
+                self.assertEqual(content_cache.key(copy),
+                                 content_cache.key(files[0]))
+                self.assertNotEqual(cache.key(copy), key)
+            data, _ = files_raster_data_at_points(
+                longitude, latitude, files, cache=content_cache)
+            numpy.testing.assert_equal(data, actual)
+            self.assertEqual(len(os.listdir(cache_dir)), 4)
+
+            # Shrinking the cache removes the least recently used entry
+            os.utime(os.path.join(cache_dir, key + '.npy'), (0, 0))
+            small_cache = RasterCache(cache_dir, max_size=0)
+            small_cache.evict(keep=content_cache.key(files[0]))
+            self.assertEqual(sorted(os.listdir(cache_dir)),
+                             sorted([content_cache.key(files[0]) + ext
+                                     for ext in ('.json', '.npy')]))
+
+    def test6_pixel_index(self):
+        files = [str(CWD / 'data/basic_raster.aai')] * 3
+
+        longitude = asarray([0.5, 2.6, 1.3, 5.0])
+        latitude = asarray([9.3, 9.5, 9.5, 9.5])
+        actual = numpy.array([1., nan, 2., nan])
+
+        with tempfile.TemporaryDirectory() as index_dir:
+            pixel_index = PixelIndex(longitude, latitude, index_dir)
+            with mock.patch.object(Raster, 'pixel_index',
+                                   autospec=True,
+                                   side_effect=Raster.pixel_index) as mocked:
+                data, _ = files_raster_data_at_points(
+                    longitude, latitude, files, pixel_index=pixel_index)
+                # All of the files are on one grid
+                self.assertEqual(mocked.call_count, 1)
+            for i in range(3):
+                numpy.testing.assert_equal(data[:, i], actual)
+            self.assertEqual(len(os.listdir(index_dir)), 1)
+
+            # A later run loads the saved index
+            pixel_index = PixelIndex(longitude, latitude, index_dir)
+            with mock.patch.object(Raster, 'pixel_index') as mocked:
+                data, _ = files_raster_data_at_points(
+                    longitude, latitude, files[:1], pixel_index=pixel_index)
+                mocked.assert_not_called()
+            numpy.testing.assert_equal(data, actual)
+
+            # Different exposure gets a different index
+            pixel_index = PixelIndex(longitude[:2], latitude[:2], index_dir)
+            data, _ = files_raster_data_at_points(
+                longitude[:2], latitude[:2], files[:1],
+                pixel_index=pixel_index)
+            numpy.testing.assert_equal(data, actual[:2])
+            self.assertEqual(len(os.listdir(index_dir)), 2)
+
+    def test7_mosaic(self):
+        # Two 2x2 tiles side by side, and a file that is not a raster
+        tiles = {'west.aai': (0, '1 2\n3 4\n'),
+                 'east.aai': (2, '5 6\n7 -9999\n')}
+        longitude = asarray([0.5, 1.5, 2.5, 3.5, 3.5, 4.5, 1.0])
+        latitude = asarray([9.5, 8.5, 9.5, 9.5, 8.5, 9.0, 11.0])
+        actual = asarray([1., 4., 5., 6., nan, nan, nan])
+
+        with tempfile.TemporaryDirectory() as tile_dir:
+            for name, (xll, values) in tiles.items():
+                with open(os.path.join(tile_dir, name), 'w') as fhandle:
+                    fhandle.write(f'ncols 2\nnrows 2\nxllcorner {xll}\n'
+                                  'yllcorner 8\ncellsize 1\n'
+                                  f'NODATA_value -9999\n{values}')
+            with open(os.path.join(tile_dir, 'README.txt'), 'w') as fhandle:
+                fhandle.write('Not a raster')
+
+            self.assertTrue(is_mosaic(tile_dir))
+            self.assertTrue(is_mosaic(os.path.join(tile_dir, '*.aai')))
+            self.assertFalse(is_mosaic(str(CWD / 'data/basic_raster.aai')))
+            with tempfile.TemporaryDirectory() as other_dir:
+                # A single raster with glob characters in its name
+                single = os.path.join(other_dir, 'gust[1].aai')
+                shutil.copyfile(CWD / 'data/basic_raster.aai', single)
+                self.assertFalse(is_mosaic(single))
+                data, _ = files_raster_data_at_points(
+                    longitude, latitude, [single])
+                expected, _ = files_raster_data_at_points(
+                    longitude, latitude,
+                    [str(CWD / 'data/basic_raster.aai')])
+                numpy.testing.assert_equal(data, expected)
+
+            index = TileIndex.from_tiles(tile_dir)
+            self.assertEqual(len(index.filenames), 2)
+            self.assertEqual(index.extent(), (0., 8., 4., 10.))
+            tile = index.route(longitude, latitude)
+            self.assertEqual(
+                [os.path.basename(index.filenames[i]) if i >= 0 else None
+                 for i in tile],
+                ['west.aai', 'west.aai', 'east.aai', 'east.aai', 'east.aai',
+                 None, None])
+
+            pattern = os.path.join(tile_dir, '*.aai')
+            for tiles_name in (tile_dir, pattern):
+                data, extent = files_raster_data_at_points(
+                    longitude, latitude, [tiles_name])
+                numpy.testing.assert_equal(data, actual)
+                self.assertEqual(list(extent), [0., 8., 4., 10.])
+
+            # Tiles can be mixed with single rasters
+            data, _ = files_raster_data_at_points(
+                longitude, latitude,
+                [pattern, str(CWD / 'data/basic_raster.aai')])
+            numpy.testing.assert_equal(data[:, 0], actual)
+
+            # A saved index is reused while the tiles are unchanged
+            with tempfile.TemporaryDirectory() as index_dir:
+                Mosaic.from_tiles(pattern, index_dir)
+                self.assertEqual(len(os.listdir(index_dir)), 1)
+                with mock.patch.object(Raster, 'from_file') as mocked:
+                    mosaic = Mosaic.from_tiles(pattern, index_dir)
+                    mocked.assert_not_called()
+                self.assertEqual(mosaic.extent(), (0., 8., 4., 10.))
+
+            with self.assertRaises(RuntimeError):
+                TileIndex.from_tiles(os.path.join(tile_dir, '*.tif'))
+
+    def test_remote_reads(self):
+        self.assertTrue(is_remote('/vsis3/bucket/hazard.tif'))
+        self.assertFalse(is_remote(str(CWD / 'data/basic_raster.aai')))
+
+        # A 10 x 4 grid of 2 x 2 blocks, 5 blocks per row
+        raster = Raster('/vsis3/bucket/hazard.tif', 0., 4., 1., -1.,
+                        -9999, 10, 4, 2, 2)
+        self.assertTrue(raster.remote)
+
+        # Neighbouring blocks in a row are read together
+        first, last, starts = raster._block_runs(asarray([0, 1, 2, 4, 5, 7]))
+        numpy.testing.assert_array_equal(first, [0, 4, 5, 7])
+        numpy.testing.assert_array_equal(last, [2, 4, 5, 7])
+        numpy.testing.assert_array_equal(starts, [0, 3, 4, 5])
+        raster.x_size = 2 * (MAX_COALESCED_BLOCKS + 1)
+        first, last, _ = raster._block_runs(
+            numpy.arange(MAX_COALESCED_BLOCKS + 1))
+        numpy.testing.assert_array_equal(
+            first, [0, MAX_COALESCED_BLOCKS])
+        raster.x_size = 10
+
+        # A window is only read if every block in it holds a point
+        col = asarray([0, 3])
+        row = asarray([0, 1])
+        self.assertEqual(raster.sample_strategy(col, row), WINDOW)
+        col = asarray([0, 9])
+        self.assertEqual(raster.sample_strategy(col, row), BLOCK)
+        self.assertEqual(raster.sample_strategy(col, row, memory_budget=0),
+                         SPARSE)
+
+        # The same values are read with coalesced blocks
+        local = Raster.from_file(str(CWD / 'data/basic_raster.aai'))
+        local.block_x_size = 1
+        longitude = asarray([0.5, 2.6, 1.3, 5.0])
+        latitude = asarray([9.3, 9.5, 9.5, 9.5])
+        actual = local.raster_data_at_points(longitude, latitude,
+                                             strategy=BLOCK)
+        local.remote = True
+        data = local.raster_data_at_points(longitude, latitude,
+                                           strategy=BLOCK)
+        numpy.testing.assert_equal(data, actual)
+
+        with mock.patch('hazimp.raster.gdal.SetConfigOption') as mocked:
+            configure_remote_reads(32)
+            mocked.assert_any_call('CPL_VSIL_CURL_CACHE_SIZE',
+                                   str(32 * 1024 ** 2))
+            mocked.assert_any_call('GDAL_HTTP_MERGE_CONSECUTIVE_RANGES',
+                                   'YES')
+
+    @unittest.skipIf(ThreadedMotoServer is None,
+                     'The moto server is not installed')
+    def test_remote_reads_s3(self):
+        server = ThreadedMotoServer(ip_address='127.0.0.1', port=0,
+                                    verbose=False)
+        server.start()
+        self.addCleanup(server.stop)
+        endpoint = '{}:{}'.format(*server.get_host_and_port())
+        environ = {'AWS_S3_ENDPOINT': endpoint,
+                   'AWS_HTTPS': 'NO',
+                   'AWS_VIRTUAL_HOSTING': 'FALSE',
+                   'AWS_ACCESS_KEY_ID': 'testing',
+                   'AWS_SECRET_ACCESS_KEY': 'testing',
+                   'AWS_REGION': 'us-east-1',
+                   'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR'}
+
+        filename = str(CWD / 'data/basic_raster.aai')
+        longitude = asarray([0.5, 1.5, 2.5, 0.5, 1.5, 2.5, 5.0])
+        latitude = asarray([9.5, 9.5, 9.5, 8.5, 8.5, 8.5, 9.5])
+        with mock.patch.dict(os.environ, environ):
+            s3 = boto3.client('s3', endpoint_url=f'http://{endpoint}',
+                              region_name='us-east-1')
+            s3.create_bucket(Bucket='hazard')
+            s3.upload_file(filename, 'hazard', 'basic_raster.aai')
+
+            local = Raster.from_file(filename)
+            remote = Raster.from_file('/vsis3/hazard/basic_raster.aai')
+            self.assertTrue(remote.remote)
+            # Blocks of one cell, so neighbouring blocks are coalesced
+            local.block_x_size = remote.block_x_size = 1
+            for strategy in (WINDOW, BLOCK):
+                actual = local.raster_data_at_points(
+                    longitude, latitude, strategy=strategy)
+                data = remote.raster_data_at_points(
+                    longitude, latitude, strategy=strategy)
+                numpy.testing.assert_equal(data, actual)
+            numpy.testing.assert_equal(data, [1., 2., nan, 4., 5., 6., nan])
+
+    def test_files_in_processes(self):
+        files = [str(CWD / 'data/basic_raster.aai')] * 3
+        longitude = asarray([0.5, 2.6, 1.3, 5.0, 1.5])
+        latitude = asarray([9.3, 9.5, 9.5, 9.5, 8.5])
+
+        actual, actual_extent = files_raster_data_at_points(
+            longitude, latitude, files, scaling_factor=2.)
+        data, extent = files_raster_data_at_points(
+            longitude, latitude, files, scaling_factor=2., workers=2)
+        self.assertEqual(data.shape, (5, 3))
+        numpy.testing.assert_equal(data, actual)
+        self.assertEqual(extent, actual_extent)
+
+    def test_unique_points(self):
+        lon = asarray([1.5, 0.5, 1.5, 0.5, 1.5, nan])
+        lat = asarray([9.5, 9.5, 9.5, 8.5, 9.5, 9.5])
+        u_lon, u_lat, inverse = unique_points(lon, lat)
+        self.assertEqual(u_lon.shape[0], 4)
+        numpy.testing.assert_equal(u_lon[inverse], lon)
+        numpy.testing.assert_equal(u_lat[inverse], lat)
+
+        u_lon, u_lat, inverse = unique_points(asarray([]), asarray([]))
+        self.assertEqual(u_lon.shape[0], 0)
+        self.assertEqual(inverse.shape[0], 0)
+
 
 if __name__ == "__main__":
     Suite = unittest.makeSuite(TestRaster, 'test')
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2012-2014 Geoscience Australia
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Test the rng module.
+"""
+
+import unittest
+
+import numpy
+
+from hazimp.rng import philox4x32, AssetStream, job_seed
+
+
+class TestRng(unittest.TestCase):
+
+    def test_philox4x32(self):
+        # The known answers of the Random123 Philox4x32-10
+        counters = [[0, 0, 0, 0],
+                    [0xffffffff] * 4,
+                    [0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344]]
+        keys = [[0, 0], [0xffffffff] * 2, [0xa4093822, 0x299f31d0]]
+        actual = [[0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8],
+                  [0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd],
+                  [0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1]]
+        for counter, key, words in zip(counters, keys, actual):
+            self.assertEqual(philox4x32(counter, key).tolist(), words)
+
+    def test_asset_stream(self):
+        ids = numpy.arange(1000) * 7
+        stream = AssetStream(42, 'job', ids)
+        uniform = stream.uniform(3)
+        self.assertEqual(uniform.shape, (1000, 3))
+        self.assertTrue(numpy.all((uniform > 0) & (uniform < 1)))
+        self.assertAlmostEqual(uniform.mean(), 0.5, delta=0.02)
+
+        # The draws of an asset do not depend on the other assets
+        shuffled = numpy.random.permutation(1000)
+        part = AssetStream(42, 'job', ids[shuffled]).uniform(3)
+        numpy.testing.assert_array_equal(part, uniform[shuffled])
+        numpy.testing.assert_array_equal(stream.uniform(3, slice(10, 20)),
+                                         uniform[10:20])
+        numpy.testing.assert_array_equal(stream.uniform(1), uniform[:, :1])
+
+        # Other jobs and seeds have other streams
+        self.assertFalse(numpy.array_equal(
+            AssetStream(42, 'other', ids).uniform(3), uniform))
+        self.assertFalse(numpy.array_equal(
+            AssetStream(43, 'job', ids).uniform(3), uniform))
+        self.assertNotEqual(job_seed(42, 'job'), job_seed(42, 'other'))
+
+        normal = stream.normal(2)
+        self.assertAlmostEqual(normal.mean(), 0., delta=0.1)
+        self.assertAlmostEqual(normal.std(), 1., delta=0.1)
+
+
+if __name__ == "__main__":
+    SUITE = unittest.makeSuite(TestRng, 'test')
+    RUNNER = unittest.TextTestRunner()
+    RUNNER.run(SUITE)
@@ -22,7 +22,10 @@ Test templates
 import os
 import unittest
 
+import yaml
+
 from hazimp import misc
+from hazimp.config import instance_builder
 from hazimp.calcs.calcs import FLOOR_HEIGHT, CalcFloorInundation
 from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LoadCsvExposure, LoadRaster,
                               LoadXmlVulnerability, SimpleLinker,
@@ -31,13 +34,15 @@ from hazimp.jobs.jobs import (LOADCSVEXPOSURE, LoadCsvExposure, LoadRaster,
                               PermutateExposure, MultipleDimensionMult,
                               AggregateLoss, SaveAggregation, Categorise,
                               Aggregate, Tabulate, Const,
-                              RandomConst, Add)
+                              RandomConst, Add, REORDER_EXPOSURE,
+                              ReorderExposure, FRAGILITY, Fragility)
 from hazimp.templates import (WINDNC, READERS, VULNFILE, PERMUTATION,
                               CALCSTRUCTLOSS, AGGREGATION, SAVE,
                               VULNSET, HAZARDRASTER, AGGREGATE, TABULATE,
                               SAVEAGG, WINDV5, CALCCONTLOSS, FLOODCONTENTSV2,
                               FLOODFABRICV2, WINDV4, EARTHQUAKEV1,
-                              SURGENC)
+                              SURGENC, VULNLUT, VULNCACHE,
+                              VULNREALISATIONS, VULNQUANTILES, VULNMEMORY)
 from hazimp.templates.flood import CONT_ACTIONS, INSURE_PROB
 
 
@@ -101,7 +106,10 @@ class TestTemplates(unittest.TestCase):
             },
             HAZARDRASTER: {'file_list': ['hazard.tif']},
             VULNFILE: {'filename': 'curve.xml',
-                       VULNSET: 'wind'},
+                       VULNSET: 'wind',
+                       VULNLUT: 0.1,
+                       VULNCACHE: 'vuln_cache',
+                       VULNREALISATIONS: 100},
             PERMUTATION: {},
             CALCSTRUCTLOSS: {'replacement_value_label': 'REPLACEMENT_VALUE'},
             AGGREGATION: {},
@@ -109,6 +117,7 @@ class TestTemplates(unittest.TestCase):
             CATEGORISE: {},
             AGGREGATE: {},
             TABULATE: {},
+            REORDER_EXPOSURE: {'curve': 'morton'},
             SAVE: 'output.csv'
         }
 
@@ -116,10 +125,14 @@ class TestTemplates(unittest.TestCase):
 
         self.assertJobs(jobs, [
             (LoadCsvExposure, {'file_name': 'exposure.csv'}),
+            (ReorderExposure, {'curve': 'morton'}),
             (LoadRaster, {'attribute_label': '0.2s gust at 10m height m/s', 'file_list': ['hazard.tif']}),
-            (LoadXmlVulnerability, {'file_name': os.path.join(misc.RESOURCE_DIR, 'curve.xml')}),
+            (LoadXmlVulnerability, {'file_name': os.path.join(misc.RESOURCE_DIR, 'curve.xml'),
+                                    'lut_resolution': 0.1,
+                                    'cache_dir': 'vuln_cache'}),
             (SimpleLinker, {'vul_functions_in_exposure': {'wind': 'WIND_VULNERABILITY_FUNCTION_ID'}}),
-            (SelectVulnFunction, {'variability_method': {'wind': 'mean'}}),
+            (SelectVulnFunction, {'variability_method': {'wind': 'mean'},
+                                  'realisations': 100}),
             (PermutateExposure, {}),
             (MultipleDimensionMult, {'var1': 'structural',
                                      'var2': 'REPLACEMENT_VALUE',
@@ -211,6 +224,36 @@ class TestTemplates(unittest.TestCase):
             (SaveProvenance, {'file_name': 'output.xml'})
         ])
 
+    def test_template_earthquake_v1_fragility(self):
+        config = {
+            LOADCSVEXPOSURE: {
+                'file_name': 'exposure.csv'
+            },
+            HAZARDRASTER: {'file_list': 'hazard.tif'},
+            VULNFILE: {'filename': 'curve.xml',
+                       VULNSET: 'eq'},
+            FRAGILITY: {'file_name': 'fragility.xml',
+                        'taxonomy_field': 'BUILDING_TYPE',
+                        'groupby': 'SA1_CODE'},
+            SAVE: 'output.csv'
+        }
+
+        jobs = READERS[EARTHQUAKEV1](config)
+
+        self.assertJobs(jobs, [
+            (LoadCsvExposure, {'file_name': 'exposure.csv'}),
+            (LoadRaster, {'attribute_label': 'MMI', 'file_list': 'hazard.tif'}),
+            (LoadXmlVulnerability, {'file_name': os.path.join(misc.RESOURCE_DIR, 'curve.xml')}),
+            (SimpleLinker, {'vul_functions_in_exposure': {'eq': 'EQ_VULNERABILITY_FUNCTION_ID'}}),
+            (SelectVulnFunction, {'variability_method': {'eq': 'mean'}}),
+            (LookUp, {}),
+            (Fragility, {'file_name': 'fragility.xml',
+                         'taxonomy_field': 'BUILDING_TYPE',
+                         'groupby': 'SA1_CODE'}),
+            (SaveExposure, {'file_name': 'output.csv'}),
+            (SaveProvenance, {'file_name': 'output.xml'})
+        ])
+
     def test_template_wind_nc_fails_without_mandatory(self):
         config = {
             LOADCSVEXPOSURE: {
@@ -307,6 +350,47 @@ class TestTemplates(unittest.TestCase):
             (SaveProvenance, {'file_name': 'output.xml'})
         ])
 
+    def test_template_hazard_raster_options(self):
+        config_list = yaml.safe_load("""
+        - template: wind_v5
+        - load_exposure:
+            file_name: exposure.csv
+        - hazard_raster:
+            file_list: [gust.tif]
+            workers: 4
+            interpolation: bilinear
+        - vulnerability:
+            filename: curve.xml
+            vulnerability_set: wind
+        - exposure_permutation: {}
+        - calc_struct_loss:
+            replacement_value_label: REPLACEMENT_VALUE
+        - aggregation: {}
+        - save: output.csv
+        - save_agg: aggregation.csv
+        """)
+
+        jobs = instance_builder(config_list)
+        self.assertIsInstance(jobs[1].job_instance, LoadRaster)
+        self.assertEqual(jobs[1].atts_to_add,
+                         {'file_list': ['gust.tif'], 'workers': 4,
+                          'interpolation': 'bilinear',
+                          'attribute_label': '0.2s gust at 10m height m/s'})
+
+        config = {
+            LOADCSVEXPOSURE: {'file_name': 'exposure.csv'},
+            VULNFILE: {'filename': 'fabric_flood_avg_curve.xml',
+                       VULNSET: 'structural_domestic_flood_2012'},
+            HAZARDRASTER: {'file_list': 'depth.txt', 'workers': 2},
+            FLOOR_HEIGHT: 0.3,
+            CALCSTRUCTLOSS: {'replacement_value_label': 'REPLACEMENT_VALUE'},
+            SAVE: 'output.csv'
+        }
+        jobs = READERS[FLOODFABRICV2](config)
+        self.assertEqual(jobs[1].atts_to_add,
+                         {'file_list': 'depth.txt', 'workers': 2,
+                          'attribute_label': 'water_depth_above_ground_(m)'})
+
     def test_template_wind_v4_config(self):
         config = {
             LOADCSVEXPOSURE: {
@@ -314,7 +398,9 @@ class TestTemplates(unittest.TestCase):
             },
             HAZARDRASTER: {},
             VULNFILE: {'filename': 'curve.xml',
-                       VULNSET: 'wind'},
+                       VULNSET: 'wind',
+                       VULNQUANTILES: [0.1, 0.9],
+                       VULNMEMORY: 64},
             CALCSTRUCTLOSS: {'replacement_value_label': 'REPLACEMENT_VALUE'},
             SAVE: 'output.csv',
             SAVEAGG: 'aggregation.csv',
@@ -328,7 +414,7 @@ class TestTemplates(unittest.TestCase):
             (LoadXmlVulnerability, {'file_name': os.path.join(misc.RESOURCE_DIR, 'curve.xml')}),
             (SimpleLinker, {'vul_functions_in_exposure': {'wind': 'WIND_VULNERABILITY_FUNCTION_ID'}}),
             (SelectVulnFunction, {'variability_method': {'wind': 'mean'}}),
-            (LookUp, {}),
+            (LookUp, {'quantiles': [0.1, 0.9], 'memory_budget': 64}),
             (MultipleDimensionMult, {'var1': 'structural',
                                      'var2': 'REPLACEMENT_VALUE',
                                      'var_out': 'structural_loss'}),